@@ -0,0 +1,219 @@
+#
+# almanac.py -- sun and moon almanacs for many nights at once
+#
+#  Eric Jeschke (eric@naoj.org)
+#
+# The Sun and Moon are computed with pyephem only at nodes every few
+# hours; between them their geocentric places are interpolated, so the
+# altitudes for a whole range of dates can be evaluated as arrays.  The
+# rise, set and twilight times of all the nights are then bracketed on
+# a coarse grid and refined together (see crossing.find_windows).
+# Events follow the conventions of pyephem as used by Observer: the
+# upper limb, with refraction, crossing the observer's horizon.
+#
+from datetime import date, datetime, timedelta
+import math
+
+# 3rd party imports
+import ephem
+import numpy
+
+# local imports
+from obsplan import apparent, crossing, timegrid
+from obsplan.timegrid import TimeGrid
+
+# spacing of the pyephem nodes (days)
+node_days = 0.5
+
+# the events, in the order of Observer.sun_set_rise_times()
+sun_events = ('sunset', 'twilight_12_evening', 'twilight_18_evening',
+              'twilight_18_morning', 'twilight_12_morning', 'sunrise')
+fields = sun_events + ('moonrise', 'moonset', 'moon_illum')
+
+
+def _interp(t0, vals, t):
+    # cubic Lagrange interpolation of `vals` (rows tabulated every
+    # node_days from MJD `t0`) at MJDs `t`
+    x = (t - t0) / node_days
+    k = numpy.clip(numpy.floor(x).astype(numpy.int64), 1, vals.shape[-1] - 3)
+    u = x - k
+    w = (-u * (u - 1) * (u - 2) / 6.0, (u + 1) * (u - 1) * (u - 2) / 2.0,
+         -(u + 1) * u * (u - 2) / 2.0, (u + 1) * u * (u - 1) / 6.0)
+    return sum([wi * vals[..., k + i - 1] for i, wi in enumerate(w)])
+
+
+class Ephemeris(object):
+    """
+    Geocentric places of the Sun and Moon between MJDs `mjd1` and
+    `mjd2`, from pyephem at nodes every `node_days` and interpolated in
+    between.  sun_at() returns the rows (g_ra, g_dec, radius) and
+    moon_at() (g_ra, g_dec, radius, earth_distance, moon_phase) of the
+    pyephem bodies, for arrays of MJDs.
+    """
+    def __init__(self, mjd1, mjd2):
+        super(Ephemeris, self).__init__()
+        n = int(math.ceil((mjd2 - mjd1) / node_days)) + 4
+        self.t0 = mjd1 - node_days
+        t = self.t0 + numpy.arange(n) * node_days
+        self.sun = numpy.empty((3, n))
+        self.moon = numpy.empty((5, n))
+        sun, moon = ephem.Sun(), ephem.Moon()
+        for i, djd in enumerate(t + timegrid.DJD_MJD_OFFSET):
+            sun.compute(ephem.Date(djd))
+            moon.compute(ephem.Date(djd))
+            self.sun[:, i] = (sun.g_ra, sun.g_dec, sun.radius)
+            self.moon[:, i] = (moon.g_ra, moon.g_dec, moon.radius,
+                               moon.earth_distance, moon.moon_phase)
+        self.sun[0] = numpy.unwrap(self.sun[0])
+        self.moon[0] = numpy.unwrap(self.moon[0])
+
+    def sun_at(self, mjd):
+        return _interp(self.t0, self.sun, mjd)
+
+    def moon_at(self, mjd):
+        return _interp(self.t0, self.moon, mjd)
+
+
+class Almanac(object):
+    """
+    Sun and Moon events for a run of nights.  `dates` are the local
+    dates on which the nights start, and each of the `fields` is an
+    array with a value per night: the times as UTC MJDs (NaN if the
+    event does not happen between local noon and the following noon)
+    and `moon_illum` the illuminated fraction of the Moon at the middle
+    of the night.
+    """
+    def __init__(self, observer, dates, values):
+        super(Almanac, self).__init__()
+        self.observer = observer
+        self.dates = dates
+        for name in fields:
+            setattr(self, name, values[name])
+
+    def __len__(self):
+        return len(self.dates)
+
+    def datetimes(self, name):
+        """
+        Returns the times of event `name` as a list of UTC datetimes
+        (None where there is no event).
+        """
+        mjd = getattr(self, name)
+        ok = ~numpy.isnan(mjd)
+        dts = TimeGrid(mjd[ok]).datetimes()
+        res = [None] * len(mjd)
+        for i, dt in zip(numpy.nonzero(ok)[0], dts):
+            res[i] = dt
+        return res
+
+    def night(self, idx):
+        """
+        Returns the tuple of (sunset, 12d, 18d, 18d, 12d, sunrise) UTC
+        datetimes for night `idx`, as Observer.sun_set_rise_times().
+        """
+        return tuple([self.datetimes(name)[idx] for name in sun_events])
+
+    def write(self, out_f, tz=None):
+        """
+        Write the almanac to file object `out_f` as a text table, with
+        times in timezone `tz` (default: the observer's).
+        """
+        if tz is None:
+            tz = self.observer.tz_local
+        cols = [[dt.astimezone(tz).strftime('%H:%M') if dt is not None
+                 else '--:--' for dt in self.datetimes(name)]
+                for name in fields[:-1]]
+        out_f.write('# %-10s %s %s\n' % (
+            'date', ' '.join(['%-19s' % name for name in fields[:-1]]),
+            'moon_illum'))
+        for i, dt in enumerate(self.dates):
+            out_f.write('%-12s %s %10.3f\n' % (
+                dt.strftime('%Y-%m-%d'),
+                ' '.join(['%-19s' % col[i] for col in cols]),
+                self.moon_illum[i]))
+
+
+def _as_date(dt):
+    if isinstance(dt, datetime):
+        return dt.date()
+    if isinstance(dt, date):
+        return dt
+    return datetime.strptime(dt, '%Y-%m-%d').date()
+
+def calc_almanac(observer, date_start, date_stop, step=30.0,
+                 precision=1.0):
+    """
+    Compute an Almanac for `observer` for the nights starting on local
+    dates `date_start` through `date_stop` (dates, datetimes or
+    "YYYY-MM-DD" strings).  Altitudes are sampled every `step` minutes
+    to bracket the events, which are refined to within `precision`
+    seconds.
+    """
+    d1, d2 = _as_date(date_start), _as_date(date_stop)
+    dates = [d1 + timedelta(days=i) for i in range((d2 - d1).days + 1)]
+    noons = [observer.tz_local.localize(datetime(dt.year, dt.month, dt.day,
+                                                 12, 0, 0))
+             for dt in dates + [dates[-1] + timedelta(days=1)]]
+    noon = numpy.array([timegrid.datetime2mjd(dt) for dt in noons])
+    mjd1, mjd2 = noon[0], noon[-1]
+
+    eph = Ephemeris(mjd1, mjd2)
+    lon, lat = float(observer.site.lon), float(observer.site.lat)
+    pressure, temp = observer.pressure, observer.temperature
+    # the Sun's horizons for each of its crossings, then the Moon's
+    horizons = numpy.array([observer.horizon, observer.horizon12,
+                            observer.horizon18, observer.horizon])
+
+    def func(idx, mjd):
+        res = numpy.empty(len(mjd))
+        sel = idx < 3
+        # the Sun's crossings are mostly sampled at the same times
+        t, inv = numpy.unique(mjd[sel], return_inverse=True)
+        ra, dec, radius = eph.sun_at(t)
+        lst = apparent.last(TimeGrid(t), lon)
+        _alt, az = apparent.hadec2altaz(lst - ra, dec, lat)
+        alt = apparent.refract(_alt, pressure, temp) + radius
+        res[sel] = alt[inv]
+        sel = ~sel
+        t = mjd[sel]
+        ra, dec, radius, dist, phase = eph.moon_at(t)
+        lst = apparent.last(TimeGrid(t), lon)
+        ra, dec = apparent.topocentric(ra, dec,
+                                       dist / apparent.earth_radius_au,
+                                       lst, lat, observer.elevation)
+        _alt, az = apparent.hadec2altaz(lst - ra, dec, lat)
+        res[sel] = apparent.refract(_alt, pressure, temp) + radius
+        return res - horizons[idx]
+
+    windows = crossing.find_windows(func, len(horizons), mjd1, mjd2,
+                                    step=step, precision=precision)
+
+    def _first(times):
+        # the first of `times` in each night
+        res = numpy.full(len(dates), numpy.nan)
+        times = numpy.array(sorted(times))
+        if len(times) > 0:
+            night = numpy.searchsorted(noon, times, side='right') - 1
+            night, first = numpy.unique(night, return_index=True)
+            res[night] = times[first]
+        return res
+
+    values = {}
+    for i, (set_name, rise_name) in enumerate(
+            [('sunset', 'sunrise'),
+             ('twilight_12_evening', 'twilight_12_morning'),
+             ('twilight_18_evening', 'twilight_18_morning'),
+             ('moonset', 'moonrise')]):
+        # windows are when the body is above the horizon, cut off at
+        # the ends of the range
+        values[rise_name] = _first([t1 for t1, t2 in windows[i]
+                                    if t1 > mjd1])
+        values[set_name] = _first([t2 for t1, t2 in windows[i]
+                                   if t2 < mjd2])
+
+    mid = 0.5 * (values['sunset'] + values['sunrise'])
+    mid = numpy.where(numpy.isnan(mid), noon[:-1] + 0.5, mid)
+    values['moon_illum'] = eph.moon_at(mid)[4]
+    return Almanac(observer, dates, values)
+
+#END
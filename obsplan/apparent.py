@@ -0,0 +1,385 @@
+#
+# apparent.py -- vectorized conversion of apparent places to the
+#                  observed (horizon) frame
+#
+#  Eric Jeschke (eric@naoj.org)
+#
+# These functions operate on numpy arrays (all angles in radians) and
+# follow the conventions used by pyephem: azimuth is measured from
+# North through East, and refraction is that of libastro, so that
+# results agree with the pyephem path to well under an arcsecond for
+# the same apparent place.
+#
+# Apparent places of sidereal targets (precession, nutation and annual
+# aberration applied to the catalog position) are computed with low
+# precision formulae that agree with pyephem to about 1 arcsec.  Since
+# the apparent place of a star changes by less than 0.4 arcsec per day,
+# they only need to be computed once per night: see ApparentPlaces.
+#
+import numpy
+
+# local imports
+from obsplan import timegrid
+
+twopi = 2.0 * numpy.pi
+arcsec = numpy.pi / (180.0 * 3600.0)
+
+# Julian Date of Dublin Julian Date (used by pyephem) 0
+djd_offset = 2415020.0
+
+# minimum altitude used for the airmass calculation (3 deg)
+airmass_min_alt = numpy.radians(3.0)
+
+
+def radec2vec(ra, dec):
+    """Unit vectors (shape (N, 3)) for `ra`, `dec`"""
+    cos_dec = numpy.cos(dec)
+    return numpy.array([cos_dec * numpy.cos(ra), cos_dec * numpy.sin(ra),
+                        numpy.sin(dec)]).T
+
+def vec2radec(vec):
+    """RA, Dec for unit vectors `vec` (shape (N, 3))"""
+    x, y, z = vec.T
+    ra = numpy.mod(numpy.arctan2(y, x), twopi)
+    dec = numpy.arctan2(z, numpy.hypot(x, y))
+    return (ra, dec)
+
+def rotation(axis, angle):
+    """Matrix rotating the coordinate frame by `angle` about `axis` (0-2)"""
+    c, s = numpy.cos(angle), numpy.sin(angle)
+    i, j = [(1, 2), (2, 0), (0, 1)][axis]
+    mat = numpy.identity(3)
+    mat[i, i] = mat[j, j] = c
+    mat[i, j], mat[j, i] = s, -s
+    return mat
+
+def precession_matrix(jd1, jd2):
+    """
+    IAU 1976 precession matrix from the mean equator and equinox of
+    Julian Date `jd1` to that of `jd2`.
+    """
+    T = (jd1 - 2451545.0) / 36525.0
+    t = (jd2 - jd1) / 36525.0
+    w = 2306.2181 + (1.39656 - 0.000139 * T) * T
+    zeta = (w + ((0.30188 - 0.000344 * T) + 0.017998 * t) * t) * t
+    z = (w + ((1.09468 + 0.000066 * T) + 0.018203 * t) * t) * t
+    theta = ((2004.3109 + (-0.85330 - 0.000217 * T) * T) +
+             ((-0.42665 - 0.000217 * T) - 0.041833 * t) * t) * t
+    return numpy.dot(rotation(2, -z * arcsec),
+                     numpy.dot(rotation(1, theta * arcsec),
+                               rotation(2, -zeta * arcsec)))
+
+def nutation_matrix(jd, nut=None):
+    """
+    Nutation matrix (mean to true equator and equinox) at `jd`.  `nut`
+    is nutation(jd), if it is at hand.
+    """
+    if nut is None:
+        nut = nutation(jd)
+    dpsi, deps, eps0 = nut
+    return numpy.dot(rotation(0, -(eps0 + deps)),
+                     numpy.dot(rotation(2, -dpsi), rotation(0, eps0)))
+
+def sun_longitude(jd):
+    """
+    Low precision geometric longitude of the Sun (mean equinox of
+    date) at Julian Date(s) `jd`, good to about 0.01 deg.
+    Returns a tuple of (longitude, eccentricity of the Earth's orbit,
+    longitude of perihelion), angles in radians.
+    """
+    T = (numpy.asarray(jd, dtype=numpy.float64) - 2451545.0) / 36525.0
+    L0 = 280.46646 + (36000.76983 + 0.0003032 * T) * T
+    M = numpy.radians(357.52911 + (35999.05029 - 0.0001537 * T) * T)
+    C = ((1.914602 - (0.004817 + 0.000014 * T) * T) * numpy.sin(M) +
+         (0.019993 - 0.000101 * T) * numpy.sin(2*M) +
+         0.000289 * numpy.sin(3*M))
+    e = 0.016708634 - (0.000042037 + 0.0000001267 * T) * T
+    peri = 102.93735 + (1.71946 + 0.00046 * T) * T
+    return (numpy.radians(numpy.mod(L0 + C, 360.0)), e, numpy.radians(peri))
+
+def earth_velocity(jd, nut=None):
+    """
+    Velocity of the Earth in units of the speed of light, in the
+    equatorial frame of date, at Julian Date `jd` (for aberration).
+    `nut` is as for nutation_matrix().
+    """
+    # constant of aberration
+    kappa = 20.49552 * arcsec
+    lon, e, peri = sun_longitude(jd)
+    if nut is None:
+        nut = nutation(jd)
+    dpsi, deps, eps0 = nut
+    vx = kappa * (numpy.sin(lon) - e * numpy.sin(peri))
+    vy = -kappa * (numpy.cos(lon) - e * numpy.cos(peri))
+    eps = eps0 + deps
+    return numpy.array([vx, vy * numpy.cos(eps), vy * numpy.sin(eps)])
+
+class ApparentFrame(object):
+    """
+    The transformation from catalog places to apparent geocentric places
+    at Julian Date `jd` (precession, nutation and annual aberration),
+    kept so that it can be applied to many batches of targets.  `gast`
+    is the Greenwich apparent sidereal time (radians) at `jd`.
+    """
+    def __init__(self, jd):
+        super(ApparentFrame, self).__init__()
+        self.jd = jd
+        nut = nutation(jd)
+        dpsi, deps, eps0 = nut
+        self.nut = nutation_matrix(jd, nut=nut)
+        self.velocity = earth_velocity(jd, nut=nut)
+        self.gast = float(numpy.mod(timegrid.gmst_rad(jd) +
+                                    dpsi * numpy.cos(eps0 + deps), twopi))
+        # rotation matrices by catalog equinox
+        self._matrices = {}
+
+    def matrix(self, epoch_jd):
+        try:
+            return self._matrices[epoch_jd]
+        except KeyError:
+            mat = numpy.dot(self.nut, precession_matrix(epoch_jd, self.jd))
+            self._matrices[epoch_jd] = mat
+            return mat
+
+    def radec(self, ra, dec, epoch_jd):
+        """
+        Apparent RA/Dec of catalog positions `ra`, `dec` (arrays,
+        radians) for the mean equinoxes `epoch_jd` (an array or a
+        scalar).  Returns a tuple of arrays (ra, dec).
+        """
+        vec = radec2vec(numpy.asarray(ra, dtype=numpy.float64),
+                        numpy.asarray(dec, dtype=numpy.float64))
+        epoch_jd = numpy.broadcast_to(epoch_jd, (len(vec),))
+        # precess each group of positions with the same equinox
+        for epoch in numpy.unique(epoch_jd):
+            idx = epoch_jd == epoch
+            vec[idx] = numpy.dot(vec[idx], self.matrix(float(epoch)).T)
+        # annual aberration (first order)
+        v = self.velocity
+        vec = vec + v - vec * numpy.dot(vec, v)[:, numpy.newaxis]
+        vec /= numpy.sqrt((vec * vec).sum(axis=1))[:, numpy.newaxis]
+        return vec2radec(vec)
+
+def apparent_radec(ra, dec, epoch_jd, jd):
+    """
+    Apparent geocentric RA/Dec at Julian Date `jd` of catalog positions
+    `ra`, `dec` (arrays, radians) for the mean equinoxes `epoch_jd`
+    (an array or a scalar).  Returns a tuple of arrays (ra, dec).
+    """
+    return ApparentFrame(jd).radec(ra, dec, epoch_jd)
+
+
+def target_arrays(targets):
+    """
+    Returns arrays (ra, dec, epoch_jd) of the catalog positions and
+    equinoxes (Julian Dates) of a list of sidereal targets having
+    pyephem FixedBody `body` attributes.
+    """
+    bodies = [tgt.body for tgt in targets]
+    ra = numpy.array([float(body._ra) for body in bodies])
+    dec = numpy.array([float(body._dec) for body in bodies])
+    # pyephem epochs are Dublin Julian Dates
+    epoch_jd = numpy.array([float(body._epoch) for body in bodies]) + djd_offset
+    return (ra, dec, epoch_jd)
+
+
+class ApparentPlaces(object):
+    """
+    Apparent geocentric places of a catalog of sidereal targets at
+    Julian Date `jd`.  `ra`, `dec` (radians) are the catalog positions
+    for the mean equinoxes `epoch_jd` (Julian Dates).
+
+    The result is accurate to about 1 arcsec at `jd` and drifts by less
+    than 0.4 arcsec per day away from it, mostly from aberration, so one
+    computation per night gives alt/az tracks within about 1.5 arcsec of
+    the pyephem path.
+    """
+    def __init__(self, ra, dec, epoch_jd, jd):
+        super(ApparentPlaces, self).__init__()
+        self.cat_ra = numpy.asarray(ra, dtype=numpy.float64)
+        self.cat_dec = numpy.asarray(dec, dtype=numpy.float64)
+        self.epoch_jd = epoch_jd
+        self.jd = jd
+        self.ra, self.dec = apparent_radec(self.cat_ra, self.cat_dec,
+                                           epoch_jd, jd)
+
+    @classmethod
+    def from_targets(cls, targets, jd):
+        """
+        Make the apparent places of a list of sidereal targets (having
+        pyephem FixedBody `body` attributes) at Julian Date `jd`.
+        """
+        ra, dec, epoch_jd = target_arrays(targets)
+        return cls(ra, dec, epoch_jd, jd)
+
+    def __len__(self):
+        return len(self.ra)
+
+
+def catalog_radec(targets, grid):
+    """
+    Apparent places of sidereal `targets` for the samples of TimeGrid
+    `grid`, computed once per day of samples.  Returns a tuple of
+    arrays (ra, dec), of shape (N, 1) if the grid is within one day
+    and (N, T) otherwise.
+    """
+    ra, dec, epoch_jd = target_arrays(targets)
+    return grid_radec(ra, dec, epoch_jd, grid)
+
+def grid_radec(ra, dec, epoch_jd, grid):
+    """
+    Like catalog_radec(), for catalog positions `ra`, `dec` (radians)
+    for the mean equinoxes `epoch_jd` (Julian Dates).
+    """
+    jd = grid.jd
+    days = numpy.floor(grid.mjd)
+    day_list = numpy.unique(days)
+    if len(day_list) == 1:
+        places = ApparentPlaces(ra, dec, epoch_jd, jd.mean())
+        return (places.ra[:, numpy.newaxis], places.dec[:, numpy.newaxis])
+
+    res_ra = numpy.empty((len(ra), len(grid)))
+    res_dec = numpy.empty((len(ra), len(grid)))
+    for day in day_list:
+        idx = days == day
+        places = ApparentPlaces(ra, dec, epoch_jd, jd[idx].mean())
+        res_ra[:, idx] = places.ra[:, numpy.newaxis]
+        res_dec[:, idx] = places.dec[:, numpy.newaxis]
+    return (res_ra, res_dec)
+
+def topocentric(ra, dec, dist, lst, lat, elevation):
+    """
+    Correct geocentric `ra`, `dec` of a body at distance `dist` (Earth
+    radii) for parallax, as seen at local sidereal time `lst` from
+    latitude `lat` and `elevation` (m).  Returns a tuple (ra, dec).
+    """
+    # observer's geocentric position (Earth radii)
+    u = numpy.arctan(0.99664719 * numpy.tan(lat))
+    h = elevation / 6378140.0
+    rho_sin = 0.99664719 * numpy.sin(u) + h * numpy.sin(lat)
+    rho_cos = numpy.cos(u) + h * numpy.cos(lat)
+    sin_par = 1.0 / dist
+    ha = lst - ra
+    cos_dec = numpy.cos(dec)
+    denom = cos_dec - rho_cos * sin_par * numpy.cos(ha)
+    d_ra = numpy.arctan2(-rho_cos * sin_par * numpy.sin(ha), denom)
+    dec = numpy.arctan2((numpy.sin(dec) - rho_sin * sin_par) * numpy.cos(d_ra),
+                        denom)
+    return (numpy.mod(ra + d_ra, twopi), dec)
+
+def nutation(jd):
+    """
+    Low precision nutation for Julian Date(s) `jd`: the dominant terms
+    of the IAU 1980 series, good to about 0.5 arcsec.
+    Returns a tuple of (dpsi, deps, eps0), in radians.
+    """
+    T = (numpy.asarray(jd, dtype=numpy.float64) - 2451545.0) / 36525.0
+    # longitude of the ascending node of the Moon's orbit
+    omega = numpy.radians(125.04452 - 1934.136261 * T)
+    # mean longitudes of the Sun and Moon
+    L = numpy.radians(280.4665 + 36000.7698 * T)
+    Lp = numpy.radians(218.3165 + 481267.8813 * T)
+    dpsi = (-17.20 * numpy.sin(omega) - 1.32 * numpy.sin(2*L) -
+            0.23 * numpy.sin(2*Lp) + 0.21 * numpy.sin(2*omega)) * arcsec
+    deps = (9.20 * numpy.cos(omega) + 0.57 * numpy.cos(2*L) +
+            0.10 * numpy.cos(2*Lp) - 0.09 * numpy.cos(2*omega)) * arcsec
+    # mean obliquity of the ecliptic
+    eps0 = numpy.radians(23.43929111 - (46.8150 * T + 0.00059 * T**2 -
+                                        0.001813 * T**3) / 3600.0)
+    return (dpsi, deps, eps0)
+
+def equation_of_equinoxes(jd):
+    """Apparent minus mean sidereal time (radians) at Julian Date(s) `jd`"""
+    dpsi, deps, eps0 = nutation(jd)
+    return dpsi * numpy.cos(eps0 + deps)
+
+def last(grid, longitude):
+    """
+    Local apparent sidereal time (radians) of each sample of TimeGrid
+    `grid`, at `longitude` (radians, east positive).
+    """
+    jd = grid.jd
+    return numpy.mod(grid.lmst(longitude) + equation_of_equinoxes(jd), twopi)
+
+def hadec2altaz(ha, dec, lat):
+    """
+    Convert hour angle and declination to (geometric) altitude and
+    azimuth at latitude `lat`.  Returns a tuple of (alt, az).
+    """
+    sin_lat, cos_lat = numpy.sin(lat), numpy.cos(lat)
+    sin_dec, cos_dec = numpy.sin(dec), numpy.cos(dec)
+    cos_ha = numpy.cos(ha)
+    sin_alt = sin_lat * sin_dec + cos_lat * cos_dec * cos_ha
+    alt = numpy.arcsin(numpy.clip(sin_alt, -1.0, 1.0))
+    y = -cos_dec * numpy.sin(ha)
+    x = cos_lat * sin_dec - sin_lat * cos_dec * cos_ha
+    az = numpy.mod(numpy.arctan2(y, x), twopi)
+    return (alt, az)
+
+def unrefract(alt, pressure, temp):
+    """
+    Remove refraction from apparent altitude(s) `alt` for `pressure`
+    (mbar) and `temp` (deg C), using the libastro formulae.
+    """
+    alt = numpy.asarray(alt, dtype=numpy.float64)
+    if not pressure:
+        return alt
+    alt_deg = numpy.degrees(alt)
+    # high altitude formula (only used above 14.5 deg)
+    with numpy.errstate(divide='ignore'):
+        r_hi = 7.888888e-5 * pressure / ((273.0 + temp) * numpy.tan(alt))
+    r_hi = numpy.where(alt_deg > 14.5, r_hi, 0.0)
+    # low altitude formula
+    a = ((2e-5 * alt_deg + 1.96e-2) * alt_deg + 1.594e-1) * pressure
+    b = (273.0 + temp) * ((8.45e-2 * alt_deg + 5.05e-1) * alt_deg + 1.0)
+    r_lo = numpy.radians(a / b)
+    # blended between 14.5 and 15.5 deg
+    frac = numpy.clip(alt_deg - 14.5, 0.0, 1.0)
+    r = r_lo + frac * (r_hi - r_lo)
+    return numpy.where((alt < 0.0) & (r < 0.0), alt, alt - r)
+
+def refract(alt, pressure, temp, niter=5):
+    """
+    Apply refraction to geometric altitude(s) `alt` for `pressure`
+    (mbar) and `temp` (deg C), giving apparent altitude(s).
+    """
+    alt = numpy.asarray(alt, dtype=numpy.float64)
+    if not pressure:
+        return alt
+    # Newton iteration on the inverse, with a numerical derivative; a
+    # plain fixed point iteration converges too slowly a few degrees
+    # below the horizon, where the refraction changes quickly
+    aa = alt + (alt - unrefract(alt, pressure, temp))
+    h = 1.0e-7
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        for i in range(niter):
+            f = unrefract(aa, pressure, temp)
+            d = (unrefract(aa + h, pressure, temp) - f) / h
+            aa = aa - (f - alt) / d
+    return aa
+
+def airmass(alt):
+    """Compute airmass for altitude(s) `alt`"""
+    alt = numpy.maximum(alt, airmass_min_alt)
+    sz = 1.0/numpy.sin(alt) - 1.0
+    return 1.0 + sz*(0.9981833 - sz*(0.002875 + 0.0008083*sz))
+
+def parallactic(dec, ha, lat, az):
+    """Compute parallactic angle"""
+    cos_dec = numpy.cos(dec)
+    sinp = -1.0*numpy.sin(az)*numpy.cos(lat)
+    cosp = (-1.0*numpy.cos(az)*numpy.cos(ha) -
+            numpy.sin(az)*numpy.sin(ha)*numpy.sin(lat)) * cos_dec
+    # (multiplying through by cos(dec) > 0 avoids the division)
+    pang = numpy.arctan2(sinp, cosp)
+    return numpy.where(cos_dec != 0.0, pang,
+                       numpy.pi if lat > 0.0 else 0.0)
+
+def wrap_pi(angle):
+    """Wrap `angle` into the range [-pi, pi)"""
+    return numpy.mod(angle + numpy.pi, twopi) - numpy.pi
+
+# Earth equatorial radius in AU
+earth_radius_au = 6378140.0 / 149597870700.0
+
+#END
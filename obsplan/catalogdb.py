@@ -0,0 +1,320 @@
+#
+# catalogdb.py -- persistent target catalog in an SQLite database
+#
+#  Eric Jeschke (eric@naoj.org)
+#
+# Targets are stored with RA/Dec in radians (for their catalog
+# equinox), so loading them needs no parsing of sexagesimal strings.
+# Queries by declination and RA range use indexes, and the RA is also
+# kept as a band number so that RA windows that wrap around 0h are
+# cheap.  Visibility calculated for a period of a night can be cached
+# alongside.
+#
+import math
+
+# local imports
+from obsplan import misc, timegrid
+from obsplan.entity import SiderealTarget
+
+try:
+    import sqlite3
+    have_sqlite = True
+except ImportError:
+    have_sqlite = False
+
+twopi = 2.0 * math.pi
+
+# width of the RA bands (radians)
+ra_band_width = math.radians(15.0)
+# padding (radians) for queries made from sidereal times, to allow for
+# precession of the catalog positions and the sampling of the window
+query_pad = math.radians(1.0)
+
+_schema = """
+create table if not exists targets (
+    id integer primary key,
+    name text not null,
+    ra real not null,
+    dec real not null,
+    equinox real not null,
+    priority real not null default 0.0,
+    ra_band integer not null
+);
+create index if not exists targets_dec on targets (dec);
+create index if not exists targets_band on targets (ra_band, dec);
+create index if not exists targets_name on targets (name);
+
+create table if not exists visibility (
+    target_id integer not null references targets (id) on delete cascade,
+    site text not null,
+    night text not null,
+    period_start real not null,
+    period_stop real not null,
+    el_min real not null,
+    seconds real not null,
+    rise real,
+    setting real,
+    primary key (site, night, period_start, period_stop, el_min, target_id)
+);
+"""
+
+
+class CatalogError(Exception):
+    pass
+
+
+class CatalogDB(object):
+    """
+    A target catalog kept in the SQLite database at `path` (":memory:"
+    for a temporary one).  Rows are returned as Bunch objects with
+    attributes id, name, ra, dec, equinox and priority.
+    """
+    def __init__(self, path):
+        super(CatalogDB, self).__init__()
+        if not have_sqlite:
+            raise CatalogError("sqlite3 is not available in this Python")
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("pragma foreign_keys = on")
+        cols = [row[1] for row in
+                self.conn.execute("pragma table_info(visibility)")]
+        if len(cols) > 0 and 'period_start' not in cols:
+            # a visibility cache without the periods: it can only be
+            # recalculated
+            self.conn.execute("drop table visibility")
+        self.conn.executescript(_schema)
+
+    def close(self):
+        self.conn.close()
+
+    def _band(self, ra):
+        return int(math.floor((ra % twopi) / ra_band_width))
+
+    def add_targets(self, targets, priorities=None):
+        """
+        Add a list of SiderealTargets to the catalog, in one
+        transaction.  Returns the list of their ids.
+        """
+        targets = list(targets)
+        if priorities is None:
+            priorities = [0.0] * len(targets)
+        rows = []
+        for tgt, pri in zip(targets, priorities):
+            body = tgt.body
+            ra, dec = float(body._ra), float(body._dec)
+            rows.append((tgt.name, ra, dec, float(tgt.equinox), float(pri)))
+        return self.add_rows(rows)
+
+    def add_rows(self, rows):
+        """
+        Add targets given as (name, ra, dec, equinox, priority) tuples,
+        with RA/Dec in radians, in one transaction.  Returns the list
+        of their ids.
+        """
+        ids = []
+        with self.conn:
+            cur = self.conn.cursor()
+            for row in rows:
+                name, ra, dec, equinox, pri = row
+                cur.execute("insert into targets (name, ra, dec, equinox, "
+                            "priority, ra_band) values (?, ?, ?, ?, ?, ?)",
+                            (name, ra % twopi, dec, equinox, pri,
+                             self._band(ra)))
+                ids.append(cur.lastrowid)
+        return ids
+
+    def remove(self, ids):
+        with self.conn:
+            self.conn.executemany("delete from targets where id = ?",
+                                  [(i,) for i in ids])
+
+    def __len__(self):
+        return self.conn.execute("select count(*) from targets").fetchone()[0]
+
+    def _rows(self, sql, args=()):
+        cur = self.conn.execute("select id, name, ra, dec, equinox, priority "
+                                "from targets " + sql, args)
+        return [misc.Bunch(id=row[0], name=row[1], ra=row[2], dec=row[3],
+                           equinox=row[4], priority=row[5])
+                for row in cur]
+
+    def get(self, ids):
+        """Returns the rows for a list of target ids."""
+        res = []
+        for i in ids:
+            res.extend(self._rows("where id = ?", (i,)))
+        return res
+
+    def get_by_name(self, name):
+        return self._rows("where name = ?", (name,))
+
+    def _ra_clauses(self, ra_min, ra_max):
+        # SQL condition and arguments for RA in [ra_min, ra_max], which
+        # may wrap around 0h
+        if ra_max - ra_min >= twopi:
+            return ("1", [])
+        ra_min, ra_max = ra_min % twopi, ra_max % twopi
+        if ra_min <= ra_max:
+            ranges = [(ra_min, ra_max)]
+        else:
+            ranges = [(ra_min, twopi), (0.0, ra_max)]
+        clauses, args = [], []
+        for ra1, ra2 in ranges:
+            last = int(math.floor(min(ra2, twopi - 1.0e-12) / ra_band_width))
+            bands = list(range(self._band(ra1), last + 1))
+            clauses.append("(ra_band in (%s) and ra between ? and ?)" % (
+                ', '.join(['?'] * len(bands))))
+            args.extend(bands + [ra1, ra2])
+        return ('(' + ' or '.join(clauses) + ')', args)
+
+    def query(self, dec_min=-math.pi/2, dec_max=math.pi/2, ra_min=0.0,
+              ra_max=twopi, priority_min=None):
+        """
+        Returns the rows of the targets with Dec in [dec_min, dec_max]
+        and RA in [ra_min, ra_max] (radians).  The RA range may wrap
+        around 0h, e.g. ra_min=5.5, ra_max=0.5.
+        """
+        cond, args = self._ra_clauses(ra_min, ra_max)
+        sql = "where dec between ? and ? and " + cond
+        args = [dec_min, dec_max] + args
+        if priority_min is not None:
+            sql += " and priority >= ?"
+            args.append(priority_min)
+        return self._rows(sql + " order by id", args)
+
+    def query_observable(self, observer, time_start, time_stop,
+                         el_min_deg=15.0, priority_min=None):
+        """
+        Returns the rows of the targets that can possibly be above
+        `el_min_deg` at `observer` between `time_start` and `time_stop`.
+        This is a conservative, geometric preselection; use
+        Observer.get_windows() on the result for the exact windows.
+        """
+        lat = float(observer.site.lat)
+        el_min = math.radians(el_min_deg)
+        # a target can only reach el_min if it culminates above it
+        dec_min = max(lat - (math.pi/2 - el_min), -math.pi/2)
+        dec_max = min(lat + (math.pi/2 - el_min), math.pi/2)
+
+        mjd1 = timegrid.datetime2mjd(time_start)
+        mjd2 = timegrid.datetime2mjd(time_stop)
+        grid = timegrid.TimeGrid([mjd1, mjd2])
+        lst1 = grid.lmst(float(observer.site.lon))[0]
+        # sidereal time covered by the period
+        span = (mjd2 - mjd1) * 1.00273790935 * twopi
+
+        # the hour angle range in which a target is above el_min depends
+        # on its declination, so query in declination bands
+        nbands = 18
+        edges = [dec_min + (dec_max - dec_min) * i / float(nbands)
+                 for i in range(nbands + 1)]
+        clauses, args = [], []
+        for dec1, dec2 in zip(edges[:-1], edges[1:]):
+            ha = max([self._half_arc(dec, lat, el_min)
+                      for dec in (dec1, 0.5 * (dec1 + dec2), dec2)])
+            if ha <= 0.0:
+                continue
+            ha = min(ha + query_pad, math.pi)
+            cond, ra_args = self._ra_clauses(lst1 - ha, lst1 + span + ha)
+            clauses.append("(dec between ? and ? and %s)" % (cond))
+            args.extend([dec1 - query_pad, dec2 + query_pad] + ra_args)
+        if len(clauses) == 0:
+            return []
+        sql = "where (" + " or ".join(clauses) + ")"
+        if priority_min is not None:
+            sql += " and priority >= ?"
+            args.append(priority_min)
+        return self._rows(sql + " order by id", args)
+
+    def _half_arc(self, dec, lat, el_min):
+        # hour angle (radians) at which a target at `dec` crosses
+        # `el_min`: 0 if it never reaches it, pi if it never goes below
+        cos_h = ((math.sin(el_min) - math.sin(lat) * math.sin(dec)) /
+                 max(math.cos(lat) * math.cos(dec), 1.0e-12))
+        if cos_h >= 1.0:
+            return 0.0
+        if cos_h <= -1.0:
+            return math.pi
+        return math.acos(cos_h)
+
+    def to_targets(self, rows):
+        """Make SiderealTargets from a list of rows."""
+        return [SiderealTarget.from_radians(row.name, row.ra, row.dec,
+                                            equinox=row.equinox)
+                for row in rows]
+
+    # visibility cache
+
+    def set_visibility(self, site, night, time_start, time_stop, el_min_deg,
+                       values):
+        """
+        Cache visibility values for the period from `time_start` to
+        `time_stop` of the night `night` (a string, e.g. "2014-04-28") at
+        `site`.  `values` is a list of (target id, seconds observable,
+        rise MJD, set MJD) tuples; rise and set may be None.
+        """
+        period = (timegrid.datetime2mjd(time_start),
+                  timegrid.datetime2mjd(time_stop))
+        with self.conn:
+            self.conn.executemany(
+                "insert or replace into visibility (target_id, site, night, "
+                "period_start, period_stop, el_min, seconds, rise, setting) "
+                "values (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(tid, site, night) + period + (el_min_deg, secs, rise, sett)
+                 for tid, secs, rise, sett in values])
+
+    def get_visibility(self, site, night, time_start, time_stop, el_min_deg,
+                       ids=None):
+        """
+        Returns a dict mapping target ids to cached (seconds, rise MJD,
+        set MJD) tuples for `site`, the period from `time_start` to
+        `time_stop` of `night` and `el_min_deg`.
+        """
+        period = (timegrid.datetime2mjd(time_start),
+                  timegrid.datetime2mjd(time_stop))
+        cur = self.conn.execute(
+            "select target_id, seconds, rise, setting from visibility "
+            "where site = ? and night = ? and period_start = ? and "
+            "period_stop = ? and el_min = ?",
+            (site, night) + period + (el_min_deg,))
+        res = dict([(row[0], tuple(row[1:])) for row in cur])
+        if ids is not None:
+            res = dict([(i, res[i]) for i in ids if i in res])
+        return res
+
+    def calc_visibility(self, observer, night, time_start, time_stop,
+                        el_min_deg=15.0, rows=None):
+        """
+        Returns a dict mapping target ids to (seconds, rise MJD, set MJD)
+        for the targets in `rows` (by default the result of
+        query_observable()) between `time_start` and `time_stop`.  Only
+        targets not already cached for that period of `night` are
+        calculated.
+        """
+        if rows is None:
+            rows = self.query_observable(observer, time_start, time_stop,
+                                         el_min_deg=el_min_deg)
+        ids = [row.id for row in rows]
+        res = self.get_visibility(observer.name, night, time_start,
+                                  time_stop, el_min_deg, ids=ids)
+        todo = [row for row in rows if row.id not in res]
+        if len(todo) == 0:
+            return res
+
+        targets = self.to_targets(todo)
+        windows = observer.get_windows(targets, time_start, time_stop,
+                                       el_min_deg=el_min_deg)
+        values = []
+        for row, wins in zip(todo, windows):
+            secs = sum([(t2 - t1).total_seconds() for t1, t2 in wins])
+            rise = sett = None
+            if len(wins) > 0:
+                rise = timegrid.datetime2mjd(wins[0][0])
+                sett = timegrid.datetime2mjd(wins[-1][1])
+            values.append((row.id, secs, rise, sett))
+            res[row.id] = (secs, rise, sett)
+        self.set_visibility(observer.name, night, time_start, time_stop,
+                            el_min_deg, values)
+        return res
+
+#END
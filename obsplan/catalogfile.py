@@ -0,0 +1,163 @@
+#
+# catalogfile.py -- memory-mapped binary target catalogs
+#
+#  Eric Jeschke (eric@naoj.org)
+#
+# File layout (all little-endian):
+#
+#   header    64 bytes: magic "OBSCAT01", number of targets N (uint64),
+#             then zero padding
+#   ra        N float64, radians, for the catalog equinox
+#   dec       N float64, radians
+#   equinox   N float64, years
+#   offsets   N+1 uint64, offsets of the names in the string table
+#   names     UTF-8 string table
+#
+# Opening a catalog maps the file read-only, so the columns are used in
+# place without parsing or copying, and processes that open the same
+# file share one page-cached copy.
+#
+import struct
+
+# 3rd party imports
+import ephem
+import numpy
+
+# local imports
+from obsplan import apparent
+from obsplan.entity import SiderealTarget, TargetTrack
+
+magic = b'OBSCAT01'
+header_size = 64
+
+
+class CatalogFileError(Exception):
+    pass
+
+
+def write_arrays(path, names, ra, dec, equinox=2000.0):
+    """
+    Write a binary catalog from a list of `names` and arrays of `ra`,
+    `dec` (radians) and `equinox` (years, may be a scalar).
+    """
+    n = len(names)
+    ra = numpy.asarray(ra, dtype='<f8')
+    dec = numpy.asarray(dec, dtype='<f8')
+    equinox = numpy.asarray(numpy.broadcast_to(equinox, (n,)), dtype='<f8')
+    if ra.shape != (n,) or dec.shape != (n,):
+        raise CatalogFileError("names, ra and dec must be of equal length")
+
+    blobs = [name.encode('utf-8') for name in names]
+    offsets = numpy.zeros(n + 1, dtype='<u8')
+    offsets[1:] = numpy.cumsum([len(blob) for blob in blobs])
+
+    header = magic + struct.pack('<Q', n)
+    header = header + b'\0' * (header_size - len(header))
+    with open(path, 'wb') as out_f:
+        out_f.write(header)
+        for arr in (ra, dec, equinox, offsets):
+            out_f.write(arr.tobytes())
+        out_f.write(b''.join(blobs))
+
+def write_catalog(path, targets):
+    """Write a binary catalog from a list of SiderealTargets."""
+    targets = list(targets)
+    names = [tgt.name for tgt in targets]
+    ra = [float(tgt.body._ra) for tgt in targets]
+    dec = [float(tgt.body._dec) for tgt in targets]
+    equinox = [float(tgt.equinox) for tgt in targets]
+    write_arrays(path, names, ra, dec, equinox)
+
+
+class MappedCatalog(object):
+    """
+    A binary catalog opened by memory mapping.  `ra`, `dec` and
+    `equinox` are read-only arrays backed by the file.  Indexing gives
+    SiderealTargets, made on demand.
+    """
+    def __init__(self, path):
+        super(MappedCatalog, self).__init__()
+        self.path = path
+        self._map = numpy.memmap(path, dtype=numpy.uint8, mode='r')
+        if self._map[:len(magic)].tobytes() != magic:
+            raise CatalogFileError("not a binary catalog: %s" % (path))
+        (n,) = struct.unpack('<Q', self._map[8:16].tobytes())
+        self.n = n
+
+        def _column(idx, dtype, count):
+            start = header_size + idx * n * 8
+            return self._map[start:start + count * 8].view(dtype)
+
+        self.ra = _column(0, '<f8', n)
+        self.dec = _column(1, '<f8', n)
+        self.equinox = _column(2, '<f8', n)
+        self._offsets = _column(3, '<u8', n + 1)
+        self._names_start = header_size + (4 * n + 1) * 8
+        self._epoch_jd = None
+
+    def close(self):
+        # the arrays keep the mapping alive until they are dropped
+        self.ra = self.dec = self.equinox = self._offsets = None
+        self._map = None
+
+    def __len__(self):
+        return self.n
+
+    def get_name(self, idx):
+        i1, i2 = int(self._offsets[idx]), int(self._offsets[idx + 1])
+        start = self._names_start
+        return self._map[start + i1:start + i2].tobytes().decode('utf-8')
+
+    @property
+    def names(self):
+        return [self.get_name(i) for i in range(self.n)]
+
+    def find(self, name):
+        """Returns the index of the target named `name`."""
+        key = name.encode('utf-8')
+        blob = self._map[self._names_start:].tobytes()
+        for i in range(self.n):
+            i1, i2 = int(self._offsets[i]), int(self._offsets[i + 1])
+            if blob[i1:i2] == key:
+                return i
+        raise KeyError(name)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(self.n))]
+        return SiderealTarget.from_radians(self.get_name(idx),
+                                           float(self.ra[idx]),
+                                           float(self.dec[idx]),
+                                           equinox=float(self.equinox[idx]))
+
+    def epoch_jd(self):
+        """Julian Dates of the catalog equinoxes, as pyephem has them."""
+        if self._epoch_jd is not None:
+            return self._epoch_jd
+        eqs, inverse = numpy.unique(self.equinox, return_inverse=True)
+        jds = numpy.array([float(ephem.readdb("x,f|A,0,0,0.0,%s" % (
+            float(eq)))._epoch) for eq in eqs]) + apparent.djd_offset
+        self._epoch_jd = jds[inverse]
+        return self._epoch_jd
+
+    def places(self, jd):
+        """
+        Returns the ApparentPlaces of the whole catalog at Julian Date
+        `jd`, computed straight from the mapped columns.
+        """
+        return apparent.ApparentPlaces(self.ra, self.dec, self.epoch_jd(), jd)
+
+    def get_track(self, observer, grid):
+        """
+        Returns a catalog TargetTrack of the whole catalog for
+        `observer` at the samples of TimeGrid `grid` (as for
+        Observer.get_catalog_track, with apparent places made once per
+        day of samples).
+        """
+        ra, dec = apparent.grid_radec(self.ra, self.dec, self.epoch_jd(),
+                                      grid)
+        lst, alt, az = observer.calc_altaz(ra, dec, grid)
+        return TargetTrack(self, grid, ra, dec, alt, az, lst,
+                           float(observer.site.lat))
+
+#END
@@ -0,0 +1,299 @@
+#
+# cluster.py -- evaluate a catalog on several hosts
+#
+#  Eric Jeschke (eric@naoj.org)
+#
+# A Coordinator splits a catalog into shards and hands them out over
+# TCP to worker processes, which may run on any host that can reach it
+# (or all on localhost).  Each worker is sent the Observer and the
+# Constraints once when it connects, then a shard at a time; it finds
+# the windows of the whole shard together (and optionally the tracks)
+# and sends back arrays of results.
+#
+# A shard is given back to the queue if its worker disconnects, fails
+# to answer within `shard_timeout` seconds, so a worker can be killed
+# and restarted (or replaced) at any point of a run.
+#
+# Messages are pickled (see multiprocessing.connection); connections
+# are authenticated with a shared `authkey`, but should still only be
+# made on trusted networks.
+#
+# Start a worker with:
+#
+#   python -m obsplan.cluster <host>:<port> [--authkey=<key>]
+#
+import argparse
+from collections import deque
+from multiprocessing.connection import Listener, Client
+import threading
+import time
+import traceback
+
+# 3rd party imports
+import numpy
+
+# local imports
+from obsplan import crossing, timegrid
+
+default_authkey = b'obsplan'
+
+
+class ClusterError(Exception):
+    pass
+
+
+def evaluate_shard(observer, cts, targets, time_interval=None):
+    """
+    Evaluate `targets` for `observer` and Constraints `cts`.  Returns a
+    dict of arrays with a value for each target: `observable`, and the
+    MJDs `time_rise` and `time_set` of the window chosen as by
+    Constraints.observable() (NaN if there is none), and `up_time` (sec)
+    in all windows together.  If `time_interval` (minutes) is given,
+    the dict also holds the tracks over the period sampled at that
+    interval: `mjd` and `alt`, `az` (float32 radians) of shape (N, T).
+    """
+    targets = list(targets)
+    n = len(targets)
+    mjd1 = timegrid.datetime2mjd(cts.time_start)
+    mjd2 = timegrid.datetime2mjd(cts.time_stop)
+    func = crossing.altitude_func(observer, targets,
+                                  el_min_deg=cts.el_min_deg,
+                                  el_max_deg=cts.el_max_deg,
+                                  airmass=cts.airmass,
+                                  horizon_mask=observer.horizon_mask)
+    windows = crossing.find_windows(func, n, mjd1, mjd2)
+
+    res = dict(observable=numpy.zeros(n, dtype=bool),
+               time_rise=numpy.full(n, numpy.nan),
+               time_set=numpy.full(n, numpy.nan),
+               up_time=numpy.zeros(n))
+    for i, wins in enumerate(windows):
+        if len(wins) == 0:
+            continue
+        durations = [(t2 - t1) * 86400.0 for t1, t2 in wins]
+        res['up_time'][i] = sum(durations)
+        # the first window that is long enough, else the first
+        j = 0
+        for k, duration in enumerate(durations):
+            if duration >= cts.duration:
+                res['observable'][i] = True
+                j = k
+                break
+        res['time_rise'][i], res['time_set'][i] = wins[j]
+
+    if time_interval is not None:
+        grid = observer.get_time_grid(time_start=cts.time_start,
+                                      time_stop=cts.time_stop,
+                                      time_interval=time_interval)
+        trk = observer.get_catalog_track(targets, grid)
+        res['mjd'] = grid.mjd
+        res['alt'] = trk.alt.astype(numpy.float32)
+        res['az'] = trk.az.astype(numpy.float32)
+    return res
+
+
+class ClusterResult(object):
+    """
+    The results for a whole catalog, as arrays indexed like `targets`
+    (see evaluate_shard for the names).
+    """
+    def __init__(self, targets, shard_results):
+        super(ClusterResult, self).__init__()
+        self.targets = targets
+        names = shard_results[0].keys()
+        for name in names:
+            if name == 'mjd':
+                val = shard_results[0][name]
+            else:
+                val = numpy.concatenate([res[name] for res in shard_results])
+            setattr(self, name, val)
+
+    def __len__(self):
+        return len(self.targets)
+
+
+class Coordinator(object):
+    """
+    Hands out `targets` in shards of `shard_size` to the workers that
+    connect to `address` (host, port; port 0 picks a free one, see the
+    `address` attribute), to be evaluated for `observer` and
+    Constraints `cts` (see evaluate_shard).
+    """
+    def __init__(self, observer, cts, targets, shard_size=500,
+                 time_interval=None, address=('localhost', 0),
+                 authkey=default_authkey, shard_timeout=600.0):
+        super(Coordinator, self).__init__()
+        self.observer = observer
+        self.cts = cts
+        self.targets = list(targets)
+        self.time_interval = time_interval
+        self.authkey = authkey
+        self.shard_timeout = shard_timeout
+        self.shards = [self.targets[i:i + shard_size]
+                       for i in range(0, len(self.targets), shard_size)]
+
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self._cond = threading.Condition()
+        self._queue = deque(range(len(self.shards)))
+        self._results = {}
+        self._error = None
+        self._done = False
+        self._thread = None
+        # number of shards given back to the queue
+        self.requeued = 0
+
+    def start(self):
+        """Start accepting workers."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._accept)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _accept(self):
+        while not self._done:
+            try:
+                conn = self.listener.accept()
+            except Exception:
+                # failed handshake, or we are closing
+                continue
+            if self._done:
+                conn.close()
+                break
+            thread = threading.Thread(target=self._serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _finished(self):
+        return (self._error is not None or
+                len(self._results) == len(self.shards))
+
+    def _next_shard(self):
+        # wait for a shard to do: None when there are no more
+        with self._cond:
+            while len(self._queue) == 0 and not self._finished():
+                self._cond.wait(1.0)
+            if self._finished():
+                return None
+            return self._queue.popleft()
+
+    def _serve(self, conn):
+        idx = None
+        try:
+            conn.send(('setup', self.observer, self.cts, self.time_interval))
+            while True:
+                idx = self._next_shard()
+                if idx is None:
+                    conn.send(('stop',))
+                    break
+                conn.send(('shard', idx, self.shards[idx]))
+                if not conn.poll(self.shard_timeout):
+                    raise ClusterError("shard %d timed out" % (idx))
+                msg = conn.recv()
+                with self._cond:
+                    if msg[0] == 'error':
+                        self._error = "shard %d failed: %s" % (idx, msg[2])
+                    else:
+                        self._results[idx] = msg[2]
+                    idx = None
+                    self._cond.notify_all()
+        except Exception:
+            # worker gone: its shard goes back to the queue
+            if idx is not None:
+                with self._cond:
+                    self._queue.appendleft(idx)
+                    self.requeued += 1
+                    self._cond.notify_all()
+        finally:
+            conn.close()
+
+    def run(self, timeout=None):
+        """
+        Wait (up to `timeout` sec) for all the shards to be done and
+        return a ClusterResult.
+        """
+        if len(self.shards) == 0:
+            # nothing to hand out: the arrays are empty, but shaped as
+            # the workers' would be
+            self.close()
+            return ClusterResult(self.targets, [evaluate_shard(
+                self.observer, self.cts, [], self.time_interval)])
+        self.start()
+        with self._cond:
+            self._cond.notify_all()
+            if timeout is not None:
+                deadline = time.time() + timeout
+            while not self._finished():
+                wait = 1.0
+                if timeout is not None:
+                    wait = min(wait, deadline - time.time())
+                    if wait <= 0.0:
+                        break
+                self._cond.wait(wait)
+        self.close()
+        if self._error is not None:
+            raise ClusterError(self._error)
+        if len(self._results) < len(self.shards):
+            raise ClusterError("timed out with %d of %d shards done" % (
+                len(self._results), len(self.shards)))
+        return ClusterResult(self.targets,
+                             [self._results[i]
+                              for i in range(len(self.shards))])
+
+    def close(self):
+        """Stop accepting workers."""
+        if self._done:
+            return
+        self._done = True
+        if self._thread is not None:
+            # wake up the accepting thread
+            try:
+                Client(self.address, authkey=self.authkey).close()
+            except Exception:
+                pass
+            self._thread.join()
+        self.listener.close()
+
+
+def run_worker(address, authkey=default_authkey):
+    """
+    Evaluate shards for the coordinator at `address` (host, port) until
+    it has no more.
+    """
+    conn = Client(address, authkey=authkey)
+    try:
+        msg = conn.recv()
+        observer, cts, time_interval = msg[1:]
+        while True:
+            msg = conn.recv()
+            if msg[0] == 'stop':
+                break
+            idx, targets = msg[1:]
+            try:
+                res = evaluate_shard(observer, cts, targets,
+                                     time_interval=time_interval)
+            except Exception:
+                conn.send(('error', idx, traceback.format_exc()))
+                continue
+            conn.send(('result', idx, res))
+    except EOFError:
+        # coordinator gone
+        pass
+    finally:
+        conn.close()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Evaluate catalog shards for an obsplan coordinator.")
+    parser.add_argument('address', help="coordinator address (host:port)")
+    parser.add_argument('--authkey', default=default_authkey.decode(),
+                        help="shared authentication key")
+    options = parser.parse_args(args)
+    host, port = options.address.rsplit(':', 1)
+    run_worker((host, int(port)), authkey=options.authkey.encode())
+
+if __name__ == '__main__':
+    main()
+
+#END
@@ -0,0 +1,472 @@
+#
+# crossing.py -- find when many targets cross altitude limits
+#
+#  Eric Jeschke (eric@naoj.org)
+#
+from collections import OrderedDict
+import math
+
+# 3rd party imports
+import ephem
+import numpy
+
+# local imports
+from obsplan import apparent, timegrid
+from obsplan.timegrid import TimeGrid
+
+
+def find_windows(func, ntargets, mjd1, mjd2, step=10.0, precision=1.0):
+    """
+    Find all the windows between MJDs `mjd1` and `mjd2` in which
+    `func` is non-negative, for `ntargets` targets at once.
+
+    `func(idx, mjd)` is called with equal length arrays of target
+    indices and MJDs and returns the function values for those pairs.
+    It is sampled every `step` minutes to bracket the sign changes,
+    which are then refined together by bisection to within `precision`
+    seconds.  Windows shorter than `step` may be missed.
+
+    Returns a list with, for each target, a list of (start, stop) MJD
+    tuples.
+    """
+    nsteps = max(1, int(math.ceil((mjd2 - mjd1) * 1440.0 / step)))
+    t = numpy.linspace(mjd1, mjd2, nsteps + 1)
+    idx = numpy.repeat(numpy.arange(ntargets), len(t))
+    up = func(idx, numpy.tile(t, ntargets)) >= 0.0
+    up = up.reshape((ntargets, len(t)))
+
+    # bracket the sign changes and refine them all together
+    i_tgt, i_t = numpy.nonzero(up[:, 1:] != up[:, :-1])
+    lo, hi = t[i_t], t[i_t + 1]
+    lo_up = up[i_tgt, i_t]
+    niter = int(math.ceil(math.log(max(step * 60.0 / precision, 1.0), 2)))
+    for i in range(niter):
+        mid = 0.5 * (lo + hi)
+        mid_up = func(i_tgt, mid) >= 0.0
+        same = mid_up == lo_up
+        lo = numpy.where(same, mid, lo)
+        hi = numpy.where(same, hi, mid)
+    cross = 0.5 * (lo + hi)
+
+    # pair up the crossings into windows
+    res = [[] for i in range(ntargets)]
+    start = dict([(i, mjd1) for i in numpy.nonzero(up[:, 0])[0]])
+    for i, mjd, rising in zip(i_tgt, cross, ~lo_up):
+        if rising:
+            start[i] = mjd
+        else:
+            res[i].append((start.pop(i), mjd))
+    for i, mjd in start.items():
+        res[i].append((mjd, mjd2))
+    return res
+
+
+def _is_sidereal(target):
+    return isinstance(getattr(target, 'body', None), ephem.FixedBody)
+
+# altitude_limit() results, by arguments
+_altitude_limits = {}
+
+def altitude_limit(el_deg, pressure, temp):
+    """
+    Geometric altitude (radians) corresponding to an apparent altitude
+    of `el_deg` degrees, for `pressure` (mbar) and `temp` (deg C).
+    Refraction rises monotonically towards the horizon, so limits on
+    the apparent altitude can be tested on the geometric one.
+    """
+    key = (el_deg, pressure, temp)
+    try:
+        return _altitude_limits[key]
+    except KeyError:
+        pass
+    h = float(apparent.unrefract(math.radians(el_deg), pressure, temp))
+    if len(_altitude_limits) < 1000:
+        _altitude_limits[key] = h
+    return h
+
+def altitude_func(observer, targets, el_min_deg=None, el_max_deg=None,
+                  airmass=None, horizon_mask=None):
+    """
+    Make a function for find_windows() that is non-negative when
+    `targets` are between `el_min_deg` and `el_max_deg` degrees
+    (apparent altitude), below `airmass` and above `horizon_mask` (a
+    horizon.HorizonMask) as seen by `observer`.
+
+    Sidereal targets are done together from their apparent places;
+    other targets are calculated one by one.  The limits are taken to
+    geometric altitudes once, so that no refraction is calculated for
+    the samples.
+    """
+    targets = list(targets)
+    lon, lat = float(observer.site.lon), float(observer.site.lat)
+    pressure, temp = observer.pressure, observer.temperature
+    fixed = numpy.array([_is_sidereal(tgt) for tgt in targets], dtype=bool)
+    sidereal = [tgt for tgt, flag in zip(targets, fixed) if flag]
+    # index of each target among the sidereal ones
+    sid_idx = numpy.cumsum(fixed) - 1
+    # apparent places, computed once per day
+    places = {}
+
+    el_min_deg = fold_airmass(el_min_deg, airmass)
+    h_min = h_max = None
+    if el_min_deg is not None:
+        h_min = altitude_limit(el_min_deg, pressure, temp)
+    if el_max_deg is not None:
+        h_max = altitude_limit(el_max_deg, pressure, temp)
+
+    def _places(day):
+        try:
+            return places[day]
+        except KeyError:
+            jd = day + 0.5 + timegrid.MJD_OFFSET
+            places[day] = apparent.ApparentPlaces.from_targets(sidereal, jd)
+            return places[day]
+
+    def _altaz(idx, mjd):
+        # geometric altitudes and azimuths
+        alt, az = numpy.empty(len(idx)), numpy.empty(len(idx))
+        sel = fixed[idx]
+        if numpy.any(sel):
+            t, i_sid = mjd[sel], sid_idx[idx[sel]]
+            ra, dec = numpy.empty(len(t)), numpy.empty(len(t))
+            days = numpy.floor(t)
+            for day in numpy.unique(days):
+                pl = _places(day)
+                d_sel = days == day
+                ra[d_sel] = pl.ra[i_sid[d_sel]]
+                dec[d_sel] = pl.dec[i_sid[d_sel]]
+            lst = apparent.last(TimeGrid(t), lon)
+            alt[sel], az[sel] = apparent.hadec2altaz(lst - ra, dec, lat)
+        for i in numpy.unique(idx[~sel]):
+            t_sel = idx == i
+            trk = targets[i].calc_track(observer, TimeGrid(mjd[t_sel]))
+            alt[t_sel] = apparent.unrefract(trk.alt, pressure, temp)
+            az[t_sel] = trk.az
+        return (alt, az)
+
+    def func(idx, mjd):
+        alt, az = _altaz(idx, mjd)
+        res = numpy.ones(len(alt))
+        if h_min is not None:
+            res = numpy.minimum(res, alt - h_min)
+        if h_max is not None:
+            res = numpy.minimum(res, h_max - alt)
+        if horizon_mask is not None:
+            limit = apparent.unrefract(horizon_mask.limit(az), pressure,
+                                       temp)
+            res = numpy.minimum(res, alt - limit)
+        return res
+
+    return func
+
+
+# rate of the sidereal time (radians per day; see timegrid.gmst_rad)
+sidereal_rate = math.radians(360.98564736629)
+
+def sidereal_windows(observer, targets, mjd1, mjd2, el_min_deg=None,
+                     el_max_deg=None, frame=None):
+    """
+    Find the windows between MJDs `mjd1` and `mjd2` in which sidereal
+    `targets` are between `el_min_deg` and `el_max_deg` degrees of
+    (apparent) altitude at `observer`, as find_windows() would with
+    altitude_func(), but solved directly from the hour angles at which
+    the limits are crossed.  The apparent places are taken from `frame`
+    (an apparent.ApparentFrame, by default for the middle of the
+    period), which should be within a day or so of the period.  Horizon
+    masks are not handled.
+
+    Returns a list with, for each target, a list of (start, stop) MJD
+    tuples.
+    """
+    targets = list(targets)
+    lon, lat = float(observer.site.lon), float(observer.site.lat)
+    pressure, temp = observer.pressure, observer.temperature
+    if frame is None:
+        frame = apparent.ApparentFrame(0.5 * (mjd1 + mjd2) +
+                                       timegrid.MJD_OFFSET)
+    ra, dec = frame.radec(*apparent.target_arrays(targets))
+    sin_dec, cos_dec = numpy.sin(dec), numpy.cos(dec)
+    sin_lat, cos_lat = math.sin(lat), math.cos(lat)
+
+    def _cos_ha(el_deg):
+        # cosine of the hour angles at which the limit is crossed
+        h = altitude_limit(el_deg, pressure, temp)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return (math.sin(h) - sin_lat * sin_dec) / (cos_lat * cos_dec)
+
+    n = len(targets)
+    # up for hour angles within ha_max, and not within ha_min
+    ha_max = numpy.full(n, math.pi)
+    ha_min = numpy.zeros(n)
+    if el_min_deg is not None:
+        c = _cos_ha(el_min_deg)
+        ha_max = numpy.where(c > 1.0, -1.0,
+                             numpy.arccos(numpy.clip(c, -1.0, 1.0)))
+    if el_max_deg is not None:
+        c = _cos_ha(el_max_deg)
+        ha_min = numpy.where(c < -1.0, 2 * math.pi,
+                             numpy.arccos(numpy.clip(c, -1.0, 1.0)))
+
+    # transits, from the sidereal time of the frame
+    mjd0 = frame.jd - timegrid.MJD_OFFSET
+    lst1 = frame.gast + lon + (mjd1 - mjd0) * sidereal_rate
+    first = numpy.mod(ra - lst1, apparent.twopi) / sidereal_rate
+    period = apparent.twopi / sidereal_rate
+    ntransits = int(math.ceil((mjd2 - mjd1) / period)) + 2
+
+    res = []
+    for i in range(n):
+        windows = []
+        if ha_min[i] >= ha_max[i]:
+            res.append(windows)
+            continue
+        d_max, d_min = ha_max[i] / sidereal_rate, ha_min[i] / sidereal_rate
+        for k in range(-1, ntransits):
+            t = mjd1 + first[i] + k * period
+            if d_min > 0.0:
+                spans = [(t - d_max, t - d_min), (t + d_min, t + d_max)]
+            else:
+                spans = [(t - d_max, t + d_max)]
+            for t1, t2 in spans:
+                t1, t2 = max(t1, mjd1), min(t2, mjd2)
+                if t1 >= t2:
+                    continue
+                # join windows that meet (always up)
+                if len(windows) > 0 and windows[-1][1] >= t1 - 1.0e-9:
+                    windows[-1] = (windows[-1][0], max(windows[-1][1], t2))
+                else:
+                    windows.append((t1, t2))
+        res.append(windows)
+    return res
+
+
+# airmass_alt() results, by airmass
+_airmass_alts = {}
+
+def airmass_alt(airmass):
+    """
+    Apparent altitude (radians) at which apparent.airmass() reaches
+    `airmass`.
+    """
+    try:
+        return _airmass_alts[airmass]
+    except KeyError:
+        pass
+    lo, hi = apparent.airmass_min_alt, math.pi / 2
+    # airmass falls monotonically with altitude
+    for i in range(50):
+        mid = 0.5 * (lo + hi)
+        if apparent.airmass(mid) > airmass:
+            lo = mid
+        else:
+            hi = mid
+    alt = 0.5 * (lo + hi)
+    if len(_airmass_alts) < 1000:
+        _airmass_alts[airmass] = alt
+    return alt
+
+def fold_airmass(el_min_deg, airmass):
+    """
+    Returns the lower elevation limit (degrees) combining `el_min_deg`
+    and `airmass` (either may be None).  The airmass limit is rounded to
+    a microdegree, so that equivalent limits compare equal.
+    """
+    if airmass is None:
+        return el_min_deg
+    alt_deg = round(math.degrees(airmass_alt(airmass)), 6)
+    if el_min_deg is None or alt_deg > el_min_deg:
+        return alt_deg
+    return el_min_deg
+
+
+class WindowCache(object):
+    """
+    Observing windows of targets at `observer`, solved for whole nights
+    (local mean noon to noon) and kept, so that queries for periods
+    within a night are answered from the crossing times already found.
+
+    Sidereal targets are solved directly (see sidereal_windows()), which
+    costs little more than a single altitude, so their nights are
+    filled in on a miss.  Other targets, and any target when the
+    observer has a horizon mask, need a search of the altitudes (see
+    find_windows(), sampled every `step` minutes): on a miss only the
+    period asked for is searched, and nothing is kept.  Use fill() to
+    solve whole nights for many such targets in one go, when the cache
+    is to be warmed on purpose.
+
+    Entries are keyed by target, night and effective horizon: the
+    elevation and airmass limits are folded into a single lower
+    altitude limit, so that queries with equivalent limits share them.
+    At most `max_size` nights are kept, the least recently used being
+    dropped.  The cache empties itself when the observer's location,
+    atmosphere or horizon mask changes; call clear() after changing a
+    target.
+    """
+    def __init__(self, observer, max_size=4096, step=10.0):
+        super(WindowCache, self).__init__()
+        self.observer = observer
+        self.max_size = max_size
+        self.step = step
+        self._cache = OrderedDict()
+        # apparent.ApparentFrame for the middle of each night
+        self._frames = {}
+        self._signature = None
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self._cache.clear()
+        self._frames.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _check_observer(self):
+        obs = self.observer
+        sig = (obs.longitude, obs.latitude, obs.elevation, obs.pressure,
+               obs.temperature, id(obs.horizon_mask))
+        if sig != self._signature:
+            self.clear()
+            self._signature = sig
+            # the windows are solved with the observer's site
+            obs._check_sites()
+
+    def _target_key(self, target):
+        xeph_line = getattr(target, 'xeph_line', None)
+        if xeph_line is not None:
+            return ('sidereal', xeph_line)
+        return ('target', id(target))
+
+    def _night_start(self, night):
+        # local mean noon starting `night`
+        lon = float(self.observer.site.lon)
+        return night + 0.5 - lon / apparent.twopi
+
+    def _nights(self, mjd1, mjd2):
+        lon = float(self.observer.site.lon)
+        offset = lon / apparent.twopi - 0.5
+        return range(int(math.floor(mjd1 + offset)),
+                     int(math.floor(mjd2 + offset)) + 1)
+
+    def _direct(self, target):
+        # can the target's nights be solved directly?
+        return _is_sidereal(target) and self.observer.horizon_mask is None
+
+    def _lookup(self, target, night, el_min_deg, el_max_deg):
+        key = (self._target_key(target), night, el_min_deg, el_max_deg)
+        try:
+            tgt, windows = self._cache.pop(key)
+        except KeyError:
+            return None
+        # an id may have been reused by a new target
+        if tgt is target or key[0][0] == 'sidereal':
+            self._cache[key] = (tgt, windows)
+            return windows
+        return None
+
+    def _store(self, target, night, el_min_deg, el_max_deg, windows):
+        key = (self._target_key(target), night, el_min_deg, el_max_deg)
+        if len(self._cache) >= self.max_size:
+            self._cache.popitem(last=False)
+        self._cache[key] = (target, windows)
+
+    def _solve_nights(self, targets, night, el_min_deg, el_max_deg, step):
+        # solves and stores whole `night` for `targets`
+        mjd1 = self._night_start(night)
+        mjd2 = self._night_start(night + 1)
+        direct = [tgt for tgt in targets if self._direct(tgt)]
+        other = [tgt for tgt in targets if not self._direct(tgt)]
+        res = []
+        if len(direct) > 0:
+            frame = self._frames.get(night, None)
+            if frame is None:
+                if len(self._frames) >= self.max_size:
+                    self._frames.clear()
+                frame = apparent.ApparentFrame(0.5 * (mjd1 + mjd2) +
+                                               timegrid.MJD_OFFSET)
+                self._frames[night] = frame
+            res.extend(zip(direct, sidereal_windows(
+                self.observer, direct, mjd1, mjd2, el_min_deg=el_min_deg,
+                el_max_deg=el_max_deg, frame=frame)))
+        if len(other) > 0:
+            func = altitude_func(self.observer, other, el_min_deg=el_min_deg,
+                                 el_max_deg=el_max_deg,
+                                 horizon_mask=self.observer.horizon_mask)
+            res.extend(zip(other, find_windows(func, len(other), mjd1, mjd2,
+                                               step=step)))
+        for tgt, windows in res:
+            self._store(tgt, night, el_min_deg, el_max_deg, windows)
+        return res
+
+    def fill(self, targets, mjd1, mjd2, el_min_deg=None, el_max_deg=None,
+             airmass=None, step=None):
+        """
+        Solve and keep the whole nights between `mjd1` and `mjd2` for
+        `targets`, with the limits as for get_windows().  The targets
+        missing from the cache for a night are solved together, in a
+        single search of the altitudes sampled every `step` minutes
+        (default: our step).
+        """
+        self._check_observer()
+        el_min_deg = fold_airmass(el_min_deg, airmass)
+        if step is None:
+            step = self.step
+        for night in self._nights(mjd1, mjd2):
+            missing = [tgt for tgt in targets
+                       if self._lookup(tgt, night, el_min_deg,
+                                       el_max_deg) is None]
+            if len(missing) > 0:
+                self.misses += len(missing)
+                self._solve_nights(missing, night, el_min_deg, el_max_deg,
+                                   step)
+
+    def get_windows(self, target, mjd1, mjd2, el_min_deg=None,
+                    el_max_deg=None, airmass=None, step=None):
+        """
+        Returns the list of (start, stop) MJD windows between `mjd1` and
+        `mjd2` in which `target` is between `el_min_deg` and
+        `el_max_deg` degrees of altitude, below `airmass` and above the
+        observer's horizon mask (as for Observer.get_windows).  When the
+        period has to be searched, the altitudes are sampled every
+        `step` minutes (default: our step).
+        """
+        self._check_observer()
+        el_min_deg = fold_airmass(el_min_deg, airmass)
+        if step is None:
+            step = self.step
+
+        windows = []
+        for night in self._nights(mjd1, mjd2):
+            night_windows = self._lookup(target, night, el_min_deg,
+                                         el_max_deg)
+            if night_windows is not None:
+                self.hits += 1
+            elif self._direct(target):
+                self.misses += 1
+                night_windows = self._solve_nights([target], night,
+                                                   el_min_deg,
+                                                   el_max_deg, step)[0][1]
+            else:
+                # search just the period asked for
+                self.misses += 1
+                func = altitude_func(self.observer, [target],
+                                     el_min_deg=el_min_deg,
+                                     el_max_deg=el_max_deg,
+                                     horizon_mask=self.observer.horizon_mask)
+                return find_windows(func, 1, mjd1, mjd2, step=step)[0]
+
+            for t1, t2 in night_windows:
+                # join windows running through noon
+                if len(windows) > 0 and windows[-1][1] >= t1:
+                    windows[-1] = (windows[-1][0], t2)
+                else:
+                    windows.append((t1, t2))
+
+        res = []
+        for t1, t2 in windows:
+            t1, t2 = max(t1, mjd1), min(t2, mjd2)
+            if t1 < t2:
+                res.append((t1, t2))
+        return res
+
+#END
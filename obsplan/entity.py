@@ -7,21 +7,177 @@
 #   Copyright (c) 2008 UCO/Lick Observatory.
 #
 from datetime import datetime
+from collections import OrderedDict
 import math
+import os
 
 # local imports
-from obsplan import misc
+from obsplan import misc, apparent
+from obsplan import timegrid, crossing, almanac, lookup, pairs, lowprec
+from obsplan.timegrid import TimeGrid
 
 # 3rd party imports
 import ephem
 import pytz
 import numpy
+from numpy.polynomial.chebyshev import Chebyshev
+
+# Dublin Julian Date (used by pyephem) of JD 0
+DJD_OFFSET = 2415020.0
+
+
+def calc_gmst(jd):
+    """Compute Greenwich Mean Sidereal Time from Julian Date `jd`"""
+    return ephem.degrees(float(timegrid.gmst_rad(jd)))
+
+def calc_parallactic(dec, ha, lat, az):
+    """Compute parallactic angle"""
+    if numpy.cos(dec) != 0.0:
+        sinp = -1.0*numpy.sin(az)*numpy.cos(lat)/numpy.cos(dec)
+        cosp = -1.0*numpy.cos(az)*numpy.cos(ha)-numpy.sin(az)*numpy.sin(ha)*numpy.sin(lat)
+        parang = ephem.degrees(numpy.arctan2(sinp, cosp))
+    else:
+        if lat > 0.0:
+            parang = numpy.pi
+        else:
+            parang = 0.0
+    return parang
+
+def calc_airmass(alt):
+    """Compute airmass"""
+    if alt < ephem.degrees('03:00:00'):
+        alt = ephem.degrees('03:00:00')
+    sz = 1.0/numpy.sin(alt) - 1.0
+    xp = 1.0 + sz*(0.9981833 - sz*(0.002875 + 0.0008083*sz))
+    return xp
 
 
 class BaseTarget(object):
-    pass
 
-class SiderealTarget(object):
+    def calc_track_exact(self, observer, grid):
+        """
+        Returns a TargetTrack for `observer` at the samples of TimeGrid
+        `grid`, doing a full pyephem calculation for every sample.
+        """
+        site = observer.get_site(date=grid)
+        n = len(grid)
+        ra, dec, alt, az = (numpy.empty(n), numpy.empty(n),
+                            numpy.empty(n), numpy.empty(n))
+        for i, djd in enumerate(grid.djd):
+            site.date = djd
+            body = self.compute(site)
+            ra[i], dec[i] = body.ra, body.dec
+            alt[i], az[i] = body.alt, body.az
+        lst = apparent.last(grid, float(site.lon))
+        return TargetTrack(self, grid, ra, dec, alt, az, lst,
+                           float(site.lat))
+
+    def calc_track_interp(self, observer, grid, tolerance=1.0, degree=8,
+                          span=240):
+        """
+        Returns a TargetTrack for `observer` at the samples of TimeGrid
+        `grid`, interpolated from full calculations at a sparse set of
+        knots.  The time range is fitted piecewise with Chebyshev
+        polynomials of `degree`, starting with pieces of `span`
+        minutes; each piece is checked against full
+        calculations between its knots and split in half until the
+        position, alt/az and parallactic angle agree to within
+        `tolerance` arcsec.  Pieces too short to be worth fitting are
+        calculated exactly.
+
+        Refraction is taken out before fitting and put back afterwards,
+        as its kink near the horizon would defeat the polynomials.
+        """
+        tol = tolerance * apparent.arcsec
+        pressure, temp = observer.pressure, observer.temperature
+        mjd = grid.mjd
+        n = len(grid)
+        lon, lat = float(observer.site.lon), float(observer.site.lat)
+        # fitted values: ra, dec, geometric alt, az
+        vals = numpy.empty((n, 4))
+        alt = numpy.empty(n)
+        fitted = numpy.zeros(n, dtype=bool)
+
+        # knots at the Chebyshev nodes, checks between them and at the
+        # ends; the fits are done with precomputed matrices
+        npts = degree + 1
+        x_knot = numpy.cos(numpy.pi * (numpy.arange(npts) + 0.5) / npts)
+        x_check = numpy.cos(numpy.pi * numpy.arange(npts + 1) / npts)
+        nexact = len(x_knot) + len(x_check)
+        v_inv = numpy.linalg.inv(numpy.polynomial.chebyshev.chebvander(
+            x_knot, degree))
+        v_check = numpy.polynomial.chebyshev.chebvander(x_check, degree)
+
+        def _values(trk, geo, sl):
+            return numpy.array([trk.ra[sl], trk.dec[sl], geo[sl],
+                                trk.az[sl]]).T
+
+        nspan = max(1, int(round((mjd[-1] - mjd[0]) * 1440.0 / span)))
+        edges = numpy.linspace(0, n, nspan + 1).astype(int)
+        pending = list(zip(edges[:-1], edges[1:]))
+        while len(pending) > 0:
+            # gather the full calculations for all pending pieces
+            exact, pieces, times = [], [], []
+            for i0, i1 in pending:
+                if i1 - i0 <= nexact:
+                    exact.append((i0, i1))
+                    times.append(mjd[i0:i1])
+                else:
+                    t0, t1 = mjd[i0], mjd[i1 - 1]
+                    mid, half = 0.5 * (t0 + t1), 0.5 * (t1 - t0)
+                    pieces.append((i0, i1, mid, half))
+                    times.extend([mid + half * x_knot, mid + half * x_check])
+            trk = self.calc_track_exact(observer, TimeGrid(
+                numpy.concatenate(times), tz_local=grid.tz_local))
+            geo = apparent.unrefract(trk.alt, pressure, temp)
+
+            pending, j = [], 0
+            for i0, i1 in exact:
+                k = j + i1 - i0
+                vals[i0:i1] = _values(trk, geo, slice(j, k))
+                alt[i0:i1] = trk.alt[j:k]
+                j = k
+
+            for i0, i1, mid, half in pieces:
+                k, m = j + npts, j + nexact
+                knots = _values(trk, geo, slice(j, k))
+                knots = numpy.unwrap(knots, axis=0)
+                coef = numpy.dot(v_inv, knots)
+                # the altitude is checked before refraction, which only
+                # stretches errors by a few percent near the horizon
+                c_ra, c_dec, c_alt, c_az = numpy.dot(v_check, coef).T
+                c_pang = apparent.parallactic(
+                    c_dec, apparent.wrap_pi(trk.lst[k:m] - c_ra), lat, c_az)
+                sl = slice(k, m)
+                err = max(
+                    numpy.max(numpy.abs(apparent.wrap_pi(c_ra - trk.ra[sl])) *
+                              numpy.cos(trk.dec[sl])),
+                    numpy.max(numpy.abs(c_dec - trk.dec[sl])),
+                    numpy.max(numpy.abs(c_alt - geo[sl])),
+                    numpy.max(numpy.abs(apparent.wrap_pi(c_az - trk.az[sl])) *
+                              numpy.cos(trk.alt[sl])),
+                    numpy.max(numpy.abs(apparent.wrap_pi(c_pang -
+                                                         trk.pang[sl]))))
+                j = m
+
+                if err > tol:
+                    i2 = (i0 + i1) // 2
+                    pending.extend([(i0, i2), (i2, i1)])
+                    continue
+                x = (mjd[i0:i1] - mid) / half
+                vander = numpy.polynomial.chebyshev.chebvander(x, degree)
+                vals[i0:i1] = numpy.dot(vander, coef)
+                fitted[i0:i1] = True
+
+        # refraction is put back in one go
+        alt[fitted] = apparent.refract(vals[fitted, 2], pressure, temp)
+        ra = numpy.mod(vals[:, 0], apparent.twopi)
+        dec = vals[:, 1]
+        az = numpy.mod(vals[:, 3], apparent.twopi)
+        lst = apparent.last(grid, lon)
+        return TargetTrack(self, grid, ra, dec, alt, az, lst, lat)
+
+class SiderealTarget(BaseTarget):
     def __init__(self, name=None, ra=None, dec=None, equinox=2000.0):
         super(SiderealTarget, self).__init__()
         self.name = name
@@ -32,6 +188,12 @@ class SiderealTarget(object):
         if self.ra is not None:
             self._recalc_body()
 
+    @classmethod
+    def from_radians(cls, name, ra, dec, equinox=2000.0):
+        """Make a target from `ra`, `dec` given in radians."""
+        return cls(name=name, ra=misc.ra_rad2str(ra),
+                   dec=misc.dec_rad2str(dec), equinox=equinox)
+
     def _recalc_body(self):
         self.xeph_line = "%s,f|A,%s,%s,0.0,%s" % (
             self.name[:20], self.ra, self.dec, self.equinox)
@@ -57,9 +219,23 @@ class SiderealTarget(object):
         self._recalc_body()
         return code
 
+    def compute(self, site):
+        """Compute our body for pyephem observer `site`."""
+        self.body.compute(site)
+        return self.body
+
     def calc(self, observer, time_start):
         return CalculationResult(self, observer, time_start)
 
+    def calc_track(self, observer, grid):
+        """
+        Returns a TargetTrack for `observer` at the samples of TimeGrid
+        `grid`, from our apparent place (see Observer.get_catalog_track).
+        """
+        if not isinstance(self.body, ephem.FixedBody):
+            return self.calc_track_exact(observer, grid)
+        return observer.get_catalog_track([self], grid)[0]
+
     # for pickling
 
     def __getstate__(self):
@@ -73,6 +249,232 @@ class SiderealTarget(object):
         self.body = ephem.readdb(self.xeph_line)
 
 
+class NonSiderealTarget(BaseTarget):
+    """
+    A target that moves against the stars (planet, comet, asteroid...),
+    defined either by a pyephem `body` or by an ephemeris table of
+    geocentric astrometric positions `ra`, `dec` (radians, for
+    `equinox`) at UTC MJDs `mjd` (or the samples of a TimeGrid).
+
+    Positions over a TimeGrid are evaluated from piecewise Chebyshev
+    fits of the apparent topocentric RA/Dec, made once per site for
+    each `fit_days` long interval, so that a track costs `degree` + 1
+    pyephem calculations per interval regardless of its number of
+    samples.
+    """
+    def __init__(self, name=None, body=None, mjd=None, ra=None, dec=None,
+                 equinox=2000.0, degree=10, fit_days=1.0):
+        super(NonSiderealTarget, self).__init__()
+        self.name = name
+        self.equinox = equinox
+        self.degree = degree
+        self.fit_days = fit_days
+
+        if isinstance(mjd, TimeGrid):
+            mjd = mjd.mjd
+        if body is None:
+            order = numpy.argsort(mjd)
+            self.mjd = numpy.asarray(mjd, dtype=numpy.float64)[order]
+            self.tbl_ra = numpy.unwrap(numpy.asarray(ra, dtype=numpy.float64)[order])
+            self.tbl_dec = numpy.asarray(dec, dtype=numpy.float64)[order]
+        else:
+            self.mjd = None
+        self._init_body(body)
+
+    def _init_body(self, body):
+        if body is None:
+            # body is positioned from the table at each calculation
+            body = ephem.FixedBody()
+            body._epoch = ephem.Date('%d/1/1' % int(self.equinox))
+        self.body = body
+
+        # Chebyshev fits, keyed by segment (table) or by site and
+        # segment (apparent places)
+        self._tbl_fits = {}
+        self._fits = {}
+
+    def _segment_domain(self, seg):
+        return [seg * self.fit_days, (seg + 1) * self.fit_days]
+
+    def _table_fit(self, seg):
+        try:
+            return self._tbl_fits[seg]
+
+        except KeyError:
+            t1, t2 = self._segment_domain(seg)
+            # table rows covering the segment, plus a couple on each side
+            i = max(numpy.searchsorted(self.mjd, t1) - 2, 0)
+            j = min(numpy.searchsorted(self.mjd, t2) + 2, len(self.mjd))
+            if j - i < 2:
+                raise ValueError("%s: no ephemeris table entries near MJD %f" % (
+                    self.name, t1))
+            deg = min(self.degree, j - i - 1)
+            x = self.mjd[i:j]
+            domain = [min(t1, x[0]), max(t2, x[-1])]
+            fits = (Chebyshev.fit(x, self.tbl_ra[i:j], deg, domain=domain),
+                    Chebyshev.fit(x, self.tbl_dec[i:j], deg, domain=domain))
+            self._tbl_fits[seg] = fits
+            return fits
+
+    def radec(self, mjd):
+        """
+        Astrometric RA/Dec (radians) from the ephemeris table at UTC
+        MJD(s) `mjd`.  Returns a tuple of arrays (ra, dec).
+        """
+        mjd = numpy.atleast_1d(numpy.asarray(mjd, dtype=numpy.float64))
+        ra, dec = numpy.empty(len(mjd)), numpy.empty(len(mjd))
+        segs = numpy.floor(mjd / self.fit_days)
+        for seg in numpy.unique(segs):
+            idx = segs == seg
+            ra_fit, dec_fit = self._table_fit(seg)
+            ra[idx], dec[idx] = ra_fit(mjd[idx]), dec_fit(mjd[idx])
+        return (numpy.mod(ra, apparent.twopi), dec)
+
+    def compute(self, site):
+        """Compute our body for pyephem observer `site`."""
+        if self.mjd is not None:
+            ra, dec = self.radec(float(site.date) - timegrid.DJD_MJD_OFFSET)
+            self.body._ra = float(ra[0])
+            self.body._dec = float(dec[0])
+        self.body.compute(site)
+        return self.body
+
+    def _apparent_fit(self, site, seg):
+        key = (float(site.lon), float(site.lat), float(site.elevation), seg)
+        try:
+            return self._fits[key]
+
+        except KeyError:
+            t1, t2 = self._segment_domain(seg)
+            # interpolate at the Chebyshev points of the segment
+            n = self.degree + 1
+            x = numpy.cos(numpy.pi * (numpy.arange(n) + 0.5) / n)
+            mjd = t1 + (x + 1.0) * 0.5 * (t2 - t1)
+            ra, dec = numpy.empty(n), numpy.empty(n)
+            for i in range(n):
+                site.date = mjd[i] + timegrid.DJD_MJD_OFFSET
+                body = self.compute(site)
+                ra[i], dec[i] = body.ra, body.dec
+            order = numpy.argsort(mjd)
+            mjd, ra, dec = mjd[order], numpy.unwrap(ra[order]), dec[order]
+            fits = (Chebyshev.fit(mjd, ra, self.degree, domain=[t1, t2]),
+                    Chebyshev.fit(mjd, dec, self.degree, domain=[t1, t2]))
+            self._fits[key] = fits
+            return fits
+
+    def apparent_radec(self, observer, grid):
+        """
+        Apparent topocentric RA/Dec (radians) at `observer` for the
+        samples of TimeGrid `grid`.  Returns a tuple of arrays (ra, dec).
+        """
+        site = observer.get_site(date=grid)
+        mjd = grid.mjd
+        ra, dec = numpy.empty(len(mjd)), numpy.empty(len(mjd))
+        segs = numpy.floor(mjd / self.fit_days)
+        for seg in numpy.unique(segs):
+            idx = segs == seg
+            ra_fit, dec_fit = self._apparent_fit(site, seg)
+            ra[idx], dec[idx] = ra_fit(mjd[idx]), dec_fit(mjd[idx])
+        return (numpy.mod(ra, apparent.twopi), dec)
+
+    def calc(self, observer, time_start):
+        return CalculationResult(self, observer, time_start)
+
+    def calc_track(self, observer, grid):
+        """
+        Returns a TargetTrack for `observer` at the samples of TimeGrid
+        `grid`.
+        """
+        ra, dec = self.apparent_radec(observer, grid)
+        lst, alt, az = observer.calc_altaz(ra, dec, grid)
+        return TargetTrack(self, grid, ra, dec, alt, az, lst,
+                           float(observer.site.lat))
+
+    def clear_cache(self):
+        """Discard all the fits made so far."""
+        self._tbl_fits = {}
+        self._fits = {}
+
+    # for pickling
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        # ephem objects can't be pickled
+        body = d.pop('body')
+        d['body_class'] = d['body_line'] = None
+        if self.mjd is None:
+            if isinstance(body, (ephem.FixedBody, ephem.EllipticalBody,
+                                 ephem.HyperbolicBody, ephem.ParabolicBody)):
+                d['body_line'] = body.writedb()
+            else:
+                # planet, Sun or Moon
+                d['body_class'] = body.__class__.__name__
+        d['_tbl_fits'] = d['_fits'] = None
+        return d
+
+    def __setstate__(self, state):
+        body_class = state.pop('body_class')
+        body_line = state.pop('body_line')
+        self.__dict__.update(state)
+        body = None
+        if body_class is not None:
+            body = getattr(ephem, body_class)()
+        elif body_line is not None:
+            body = ephem.readdb(body_line)
+        self._init_body(body)
+
+
+class TargetTrack(object):
+    """
+    Values for a target at the samples of a TimeGrid, held as arrays.
+    Angles are in radians; `lst` is the local apparent sidereal time
+    and `lat` the observer's latitude.
+
+    A catalog track has a list of targets as `target` and arrays of
+    shape (N, T) for N targets; indexing it gives the track of one
+    target.
+    """
+    def __init__(self, target, grid, ra, dec, alt, az, lst, lat):
+        super(TargetTrack, self).__init__()
+        self.target = target
+        self.grid = grid
+        self.ra = ra
+        self.dec = dec
+        self.alt = alt
+        self.az = az
+        self.lst = lst
+        self.lat = lat
+
+    @property
+    def alt_deg(self):
+        return numpy.degrees(self.alt)
+
+    @property
+    def az_deg(self):
+        return numpy.degrees(self.az)
+
+    @property
+    def ha(self):
+        return apparent.wrap_pi(self.lst - self.ra)
+
+    @property
+    def airmass(self):
+        return apparent.airmass(self.alt)
+
+    @property
+    def pang(self):
+        return apparent.parallactic(self.dec, self.ha, self.lat, self.az)
+
+    def __len__(self):
+        return len(self.grid)
+
+    def __getitem__(self, idx):
+        # for a catalog track, returns the track of target `idx`
+        return TargetTrack(self.target[idx], self.grid, self.ra[idx],
+                           self.dec[idx], self.alt[idx], self.az[idx],
+                           self.lst, self.lat)
+
+
 class ObservableResult(object):
     def __init__(self, **kwdargs):
         self.__dict__.update(kwdargs)
@@ -81,95 +483,204 @@ class ObservableResult(object):
 class Constraints(object):
     """
     Constraints describe the conditions under which a target can be
-    observed.
+    observed.  `step` (minutes) is the sampling used when the windows
+    have to be searched for (see crossing.WindowCache).
     """
     def __init__(self, time_start, time_stop,
                  el_min_deg, el_max_deg, duration,
-                 airmass=None):
+                 airmass=None, step=None):
         self.time_start = time_start
         self.time_stop = time_stop
         self.el_min_deg = el_min_deg
         self.el_max_deg = el_max_deg
         self.duration = duration
         self.airmass = airmass
+        self.step = step
 
     def observable(self, observer, target):
         """
         Return True if `target` is observable with our constraints
-        at `observer`.
-        """
-        # set observer's horizon to elevation for el_min or to achieve
-        # desired airmass
-        if self.airmass != None:
-            # compute desired altitude from airmass
-            alt_deg = misc.airmass2alt(self.airmass)
-            min_alt_deg = max(alt_deg, self.el_min_deg)
-        else:
-            min_alt_deg = self.el_min_deg
+        at `observer`.  The target's windows for the night come from the
+        observer's window cache.
+        """
+        mjd_windows = observer.window_cache.get_windows(
+            target, timegrid.datetime2mjd(self.time_start),
+            timegrid.datetime2mjd(self.time_stop),
+            el_min_deg=self.el_min_deg, el_max_deg=self.el_max_deg,
+            airmass=self.airmass, step=self.step)
+        windows = [(TimeGrid([t1])[0], TimeGrid([t2])[0])
+                   for t1, t2 in mjd_windows]
+        if len(windows) == 0:
+            return ObservableResult(observable=False, time_rise=None,
+                                    time_set=None, windows=windows)
+
+        # object is observable as long as one window in which it is up
+        # is as long or longer than the time needed
+        for time_rise, time_end in windows:
+            duration = (time_end - time_rise).total_seconds()
+            if duration >= self.duration:
+                return ObservableResult(observable=True, time_rise=time_rise,
+                                        time_set=time_end, windows=windows)
+
+        time_rise, time_end = windows[0]
+        return ObservableResult(observable=False, time_rise=time_rise,
+                                time_set=time_end, windows=windows)
+
+class SunMoonTrack(object):
+    """
+    Positions of the Sun and Moon for an observer at the samples of
+    TimeGrid `grid` (arrays with a value per sample, radians): `moon_ra`
+    and `moon_dec` are apparent topocentric, `moon_illum` is the
+    illuminated fraction of the Moon.
+    """
+    def __init__(self, grid, sun_alt, sun_az, moon_ra, moon_dec, moon_alt,
+                 moon_az, moon_illum):
+        super(SunMoonTrack, self).__init__()
+        self.grid = grid
+        self.sun_alt = sun_alt
+        self.sun_az = sun_az
+        self.moon_ra = moon_ra
+        self.moon_dec = moon_dec
+        self.moon_alt = moon_alt
+        self.moon_az = moon_az
+        self.moon_illum = moon_illum
+
+    def moon_sep(self, ra, dec):
+        """
+        Separation (radians) of the Moon from apparent topocentric
+        `ra`, `dec` (scalars, or arrays with a value per sample).
+        """
+        ra = ra + numpy.zeros(len(self.grid))
+        dec = dec + numpy.zeros(len(self.grid))
+        cos_sep = (apparent.radec2vec(ra, dec) *
+                   apparent.radec2vec(self.moon_ra, self.moon_dec)).sum(axis=-1)
+        return numpy.arccos(numpy.clip(cos_sep, -1.0, 1.0))
 
-        site = observer.get_site(date=self.time_start, horizon_deg=min_alt_deg)
+    def __len__(self):
+        return len(self.grid)
 
-        d1 = observer.calc(target, self.time_start)
 
-        # TODO: worry about self.el_max_deg
+class EphemerisBackend(object):
+    """
+    Calculates the positions used by an Observer (see its `backend`).
+    The methods take a TimeGrid and return arrays with a value per
+    sample of apparent geocentric positions (radians).  `vectorized`
+    backends work on whole arrays at once, and are used for the whole
+    grid of Observer.get_target_info() as well.
+    """
+    name = None
+    vectorized = False
 
-        # important: pyephem only deals with UTC!!
-        time_start_utc = ephem.Date(self.time_start.astimezone(observer.tz_utc))
-        time_stop_utc = ephem.Date(self.time_stop.astimezone(observer.tz_utc))
-        #print "period (UT): %s to %s" % (time_start_utc, time_stop_utc)
+    def sun_radec(self, grid):
+        """Returns a tuple of arrays (ra, dec, distance in AU)."""
+        raise NotImplementedError
 
-        if d1.alt_deg >= min_alt_deg:
-            # body is above desired altitude at start of period
-            # so calculate next setting
-            time_rise = time_start_utc
-            time_set = site.next_setting(target.body, start=time_start_utc)
-            #print "body already up: set=%s" % (time_set)
+    def moon_radec(self, grid):
+        """
+        Returns a tuple of arrays (ra, dec, distance in AU, illuminated
+        fraction).
+        """
+        raise NotImplementedError
+
+    def catalog_radec(self, targets, grid):
+        """
+        Apparent places of sidereal `targets`, as arrays (ra, dec) of
+        shape (N, T).
+        """
+        raise NotImplementedError
+
+    def calc_sun_moon(self, observer, grid):
+        """
+        Returns a SunMoonTrack for `observer` at the samples of `grid`.
+        """
+        lat = float(observer.site.lat)
+        ra, dec, dist = self.sun_radec(grid)
+        lst, sun_alt, sun_az = observer.calc_altaz(ra, dec, grid)
+        ra, dec, dist, illum = self.moon_radec(grid)
+        ra, dec = apparent.topocentric(ra, dec,
+                                       dist / apparent.earth_radius_au,
+                                       lst, lat, observer.elevation)
+        ra = numpy.mod(ra, apparent.twopi)
+        lst, moon_alt, moon_az = observer.calc_altaz(ra, dec, grid)
+        return SunMoonTrack(grid, sun_alt, sun_az, ra, dec, moon_alt,
+                            moon_az, illum)
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.name)
 
-        else:
-            # body is below desired altitude at start of period
-            try:
-                time_rise = site.next_rising(target.body, start=time_start_utc)
-                time_set = site.next_setting(target.body, start=time_start_utc)
-            except ephem.NeverUpError:
-                return ObservationResult(observable=False, time_rise=None,
-                                         time_set=None)
-
-            #print "body not up: rise=%s set=%s" % (time_rise, time_set)
-            ## if time_rise < time_set:
-            ##     print "body still rising, below threshold"
-            ##     # <-- body is still rising, just not high enough yet
-            ## else:
-            ##     # <-- body is setting
-            ##     print "body setting, below threshold"
-            ##     # calculate rise time backward from end of period
-            ##     #time_rise = site.previous_rising(target.body, start=time_stop_utc)
-            ##     pass
-
-        if time_rise < time_start_utc:
-            raise AssertionError("time rise (%s) < time start (%s)" % (
-                time_rise, time_start))
-
-        # last observable time is setting or end of period,
-        # whichever comes first
-        time_end = min(time_set, time_stop_utc)
-        # calculate duration in seconds (subtracting two pyephem Date
-        # objects seems to give a fraction in days)
-        duration = (time_end - time_rise) * 86400.0
-        # object is observable as long as the duration that it is
-        # up is as long or longer than the time needed
-        ## diff = duration - float(self.duration)
-        ## can_obs = diff > -0.001
-        can_obs = duration >= self.duration
-        #print "can_obs=%s duration=%f needed=%f diff=%f" % (
-        #    can_obs, duration, self.duration, diff)
-
-        # convert time_rise back to a datetime (and add timezone
-        # info for easy conversion to other timezones)
-        time_rise = observer.tz_utc.localize(time_rise.datetime())
-        time_end = observer.tz_utc.localize(time_end.datetime())
-
-        return ObservableResult(observable=can_obs, time_rise=time_rise,
-                                time_set=time_end)
+
+class PyEphemBackend(EphemerisBackend):
+    """
+    Positions from pyephem, calculated one sample at a time (accurate
+    to about an arcsecond).
+    """
+    name = 'ephem'
+
+    def _body_radec(self, body, grid, nvals):
+        vals = numpy.empty((len(grid), nvals))
+        for i, djd in enumerate(grid.djd):
+            body.compute(ephem.Date(djd))
+            vals[i, :2] = (body.g_ra, body.g_dec)
+            if nvals > 2:
+                vals[i, 2] = body.earth_distance
+            if nvals > 3:
+                vals[i, 3] = body.moon_phase
+        return tuple(vals.T)
+
+    def sun_radec(self, grid):
+        return self._body_radec(ephem.Sun(), grid, 3)
+
+    def moon_radec(self, grid):
+        return self._body_radec(ephem.Moon(), grid, 4)
+
+    def catalog_radec(self, targets, grid):
+        shape = (len(targets), len(grid))
+        ra, dec = numpy.empty(shape), numpy.empty(shape)
+        for i, target in enumerate(targets):
+            ra[i], dec[i] = self._body_radec(target.body, grid, 2)
+        return (ra, dec)
+
+
+class NumpyBackend(EphemerisBackend):
+    """
+    Low precision positions calculated as arrays (see lowprec): the
+    Sun to about 0.5 arcmin and the Moon to about 2 arcmin, at a small
+    fraction of the cost of pyephem.  Catalog places are computed as
+    for Observer.get_catalog_track.
+    """
+    name = 'numpy'
+    vectorized = True
+
+    def sun_radec(self, grid):
+        return lowprec.sun_radec(grid.jd)
+
+    def moon_radec(self, grid):
+        return lowprec.moon_radec(grid.jd)
+
+    def catalog_radec(self, targets, grid):
+        ra, dec = apparent.catalog_radec(targets, grid)
+        shape = (len(targets), len(grid))
+        return (numpy.broadcast_to(ra, shape), numpy.broadcast_to(dec, shape))
+
+
+# backends by name, for Observer(backend=...)
+backends = {
+    'ephem': PyEphemBackend(),
+    'numpy': NumpyBackend(),
+    }
+
+def get_backend(backend):
+    """
+    Returns the EphemerisBackend named `backend` (or `backend` itself if
+    it is one already).
+    """
+    if isinstance(backend, EphemerisBackend):
+        return backend
+    try:
+        return backends[backend]
+    except KeyError:
+        raise ValueError("unknown ephemeris backend %r (one of %s)" % (
+            backend, ', '.join(sorted(backends))))
 
 class Observer(object):
     """
@@ -177,7 +688,8 @@ class Observer(object):
     """
     def __init__(self, name, timezone=None, longitude=None, latitude=None,
                  elevation=None, pressure=None, temperature=None,
-                 date=None, description=None):
+                 date=None, description=None, horizon_mask=None,
+                 backend='ephem'):
         super(Observer, self).__init__()
         self.name = name
         self.timezone = timezone
@@ -188,9 +700,18 @@ class Observer(object):
         self.temperature = temperature
         self.date = date
         self.horizon = -1 * numpy.sqrt(2 * elevation / ephem.earth_radius)
+        # azimuth dependent limits (a horizon.HorizonMask), if any
+        self.horizon_mask = horizon_mask
+        # windows of targets by night, for Constraints.observable
+        self.window_cache = crossing.WindowCache(self)
+        # airmass and parallactic angle by dec and HA, if enabled
+        self.lookup_table = None
+        # EphemerisBackend for the positions of the Sun, Moon and targets
+        self.backend = get_backend(backend)
 
         self.tz_local = pytz.timezone(self.timezone)
         self.tz_utc = pytz.timezone('UTC')
+        self._init_sites()
         self.site = self.get_site(date=date)
 
         # used for sunset, sunrise calculations
@@ -201,35 +722,196 @@ class Observer(object):
         self.sun.compute(self.site)
         self.moon.compute(self.site)
 
-    def get_site(self, date=None, horizon_deg=None):
+    # number of pre-configured sites kept by get_site()
+    site_pool_size = 32
+
+    def _init_sites(self):
+        # our coordinates are parsed once, into a site that all the
+        # others are cloned from
         site = ephem.Observer()
         site.lon = self.longitude
         site.lat = self.latitude
         site.elevation = self.elevation
         site.pressure = self.pressure
         site.temp = self.temperature
-        if horizon_deg != None:
-            site.horizon = math.radians(horizon_deg)
+        site.horizon = self.horizon
+        self._base_site = site
+        self._site_key = self._site_params()
+        # sites by (horizon, date), least recently used first
+        self._site_pool = OrderedDict()
+        # private sites for rise/set calculations, by horizon
+        self._event_sites = {}
+
+    def _site_params(self):
+        # what our sites are made from
+        return (self.longitude, self.latitude, self.elevation,
+                self.pressure, self.temperature, self.horizon)
+
+    def _check_sites(self):
+        # rebuild our sites if the attributes they are made from changed
+        if self._site_key == self._site_params():
+            return
+        self._init_sites()
+        date = self._site.date
+        self._site = self._base_site.copy()
+        self._site.date = date
+
+    @property
+    def site(self):
+        # our current pyephem site; everything that reads our location
+        # from it sees changes to our attributes
+        self._check_sites()
+        return self._site
+
+    @site.setter
+    def site(self, site):
+        self._site = site
+
+    def get_site(self, date=None, horizon_deg=None):
+        """
+        Returns a pyephem Observer for our site at `date` (default: now)
+        with a horizon of `horizon_deg` (default: the geometric horizon
+        for our elevation).  The caller is free to modify it: it is a
+        clone of a pre-configured site kept for each horizon and date.
+        """
+        if horizon_deg is not None:
+            horizon = math.radians(horizon_deg)
         else:
-            site.horizon = self.horizon
-        #site.epoch = ephem.Date("2000/1/1 12:00:00")
-        if date == None:
+            horizon = self.horizon
+        if date is None:
             date = datetime.now()
             date.replace(tzinfo=self.tz_utc)
-        site.date = ephem.Date(date)
-        return site
+        date = self._ephem_date(date)
+        self._check_sites()
+
+        key = (float(horizon), float(date))
+        try:
+            site = self._site_pool.pop(key)
+        except KeyError:
+            site = self._base_site.copy()
+            site.horizon = horizon
+            site.date = date
+            if len(self._site_pool) >= self.site_pool_size:
+                self._site_pool.popitem(last=False)
+        self._site_pool[key] = site
+        return site.copy()
+
+    def _event_site(self, horizon):
+        # site used only for rise/set times with `horizon`, so that we
+        # don't disturb the horizon or date of our own
+        self._check_sites()
+        try:
+            return self._event_sites[horizon]
+        except KeyError:
+            site = self._base_site.copy()
+            site.horizon = horizon
+            self._event_sites[horizon] = site
+            return site
+
+    def _next_event(self, body, horizon, date, rising):
+        # next rising (or setting) of `body` through `horizon` after
+        # `date` (default: our date), in UTC
+        if date is None:
+            date = self.date
+        site = self._event_site(horizon)
+        site.date = self._ephem_date(date)
+        if rising:
+            r_date = site.next_rising(body)
+        else:
+            r_date = site.next_setting(body)
+        return self.tz_utc.localize(r_date.datetime())
+
+    def _ephem_date(self, date):
+        # `date` may be a datetime, a pyephem date or a TimeGrid, in
+        # which case the first sample is used
+        if isinstance(date, TimeGrid):
+            return ephem.Date(date.djd[0])
+        return ephem.Date(date)
 
     def set_date(self, date):
+        if isinstance(date, TimeGrid):
+            date = date.start
         try:
             date = date.astimezone(self.tz_utc)
         except Exception:
             date = self.tz_utc.localize(date)
         self.date = date
-        self.site.date = ephem.Date(date)
+        self._check_sites()
+        self.site.date = self._ephem_date(date)
 
     def calc(self, body, time_start):
+        """
+        Calculate values for `body` at `time_start`.  If `time_start`
+        is a TimeGrid, a list of results for each sample is returned.
+        """
+        if isinstance(time_start, TimeGrid):
+            return [body.calc(self, dt) for dt in time_start.datetimes()]
         return body.calc(self, time_start)
 
+    def calc_altaz(self, ra, dec, grid):
+        """
+        Convert apparent topocentric `ra`, `dec` (radians; scalars or
+        arrays) to our horizon frame at the samples of TimeGrid `grid`,
+        including refraction.  Returns a tuple of arrays (lst, alt, az).
+        """
+        lst = apparent.last(grid, float(self.site.lon))
+        alt, az = apparent.hadec2altaz(lst - ra, dec, float(self.site.lat))
+        alt = apparent.refract(alt, self.pressure, self.temperature)
+        return (lst, alt, az)
+
+    def use_lookup_table(self, path=None, **kwdargs):
+        """
+        Enable a lookup.LookupTable of airmass and parallactic angle for
+        this site, used by calc_airmass_pang().  If file `path` exists
+        and holds a table for our site it is read, otherwise the table
+        is built (taking a second or two) and written there.  Other
+        keyword arguments are passed to LookupTable.
+        """
+        lat = float(self.site.lat)
+        table = None
+        if path is not None and os.path.exists(path):
+            table = lookup.LookupTable.load(path)
+            if not table.matches(lat, self.pressure, self.temperature):
+                table = None
+        if table is None:
+            table = lookup.LookupTable(lat, self.pressure, self.temperature,
+                                       **kwdargs)
+            if path is not None:
+                table.save(path)
+        self.lookup_table = table
+        return table
+
+    def calc_airmass_pang(self, ra, dec, grid):
+        """
+        Airmass and parallactic angle (radians) of apparent topocentric
+        `ra`, `dec` (as for calc_altaz()) at the samples of TimeGrid
+        `grid`, without working out the altitude and azimuth.  Uses the
+        lookup table if one is enabled for the current site values (see
+        use_lookup_table()).
+        Returns a tuple of arrays (airmass, pang).
+        """
+        lst = apparent.last(grid, float(self.site.lon))
+        ha = apparent.wrap_pi(lst - ra)
+        dec = dec + numpy.zeros(numpy.shape(ha))
+        lat = float(self.site.lat)
+        table = self.lookup_table
+        if table is not None and table.matches(lat, self.pressure,
+                                               self.temperature):
+            return table.lookup(dec, ha)
+        alt, az = apparent.hadec2altaz(ha, dec, lat)
+        alt = apparent.refract(alt, self.pressure, self.temperature)
+        return (apparent.airmass(alt),
+                apparent.parallactic(dec, ha, lat, az))
+
+    def get_night_context(self, date=None):
+        """
+        Returns a NightContext to be shared by compact results computed
+        for the night of `date`.
+        """
+        if date is None:
+            date = self.date
+        return NightContext(self, date=date)
+
     def get_date(self, date_str, timezone=None):
         if timezone == None:
             timezone = self.tz_local
@@ -254,13 +936,59 @@ class Observer(object):
         """
         return cts.observable(self, target)
 
+    def get_windows(self, targets, time_start, time_stop, el_min_deg=None,
+                    el_max_deg=None, airmass=None, step=10.0):
+        """
+        Find all the windows between `time_start` and `time_stop` in
+        which each of `targets` is between `el_min_deg` and `el_max_deg`
+        degrees of altitude, below `airmass` and above our horizon mask
+        (if we have one).  Returns a list with, for each target, a list
+        of (start, stop) UTC datetimes.
+
+        All the targets are solved for together: altitudes are sampled
+        every `step` minutes and the crossings refined to within a
+        second (see crossing.find_windows).
+        """
+        targets = list(targets)
+        mjd1 = timegrid.datetime2mjd(time_start)
+        mjd2 = timegrid.datetime2mjd(time_stop)
+        func = crossing.altitude_func(self, targets, el_min_deg=el_min_deg,
+                                      el_max_deg=el_max_deg, airmass=airmass,
+                                      horizon_mask=self.horizon_mask)
+        res = crossing.find_windows(func, len(targets), mjd1, mjd2,
+                                    step=step)
+        return [[(TimeGrid([t1])[0], TimeGrid([t2])[0])
+                 for t1, t2 in windows]
+                for windows in res]
+
+    def fill_windows(self, targets, time_start, time_stop, el_min_deg=None,
+                     el_max_deg=None, airmass=None, step=None):
+        """
+        Solve the windows of `targets` for the whole nights between
+        `time_start` and `time_stop` and keep them in our window cache,
+        so that later observable() queries within those nights are
+        answered from it.  The arguments are as for get_windows();
+        `step` defaults to that of the cache.
+        """
+        self.window_cache.fill(targets, timegrid.datetime2mjd(time_start),
+                               timegrid.datetime2mjd(time_stop),
+                               el_min_deg=el_min_deg, el_max_deg=el_max_deg,
+                               airmass=airmass, step=step)
+
     def distance(self, tgt1, tgt2, time_start):
         """
         Calculate the distance from observer's position between two
         targets at the given time.
 
-        Returns a tuple (alt sep deg, az sep deg)
+        Returns a tuple (alt sep deg, az sep deg).  If `time_start` is
+        a TimeGrid, the elements of the tuple are arrays.
         """
+        if isinstance(time_start, TimeGrid):
+            res = [self.distance(tgt1, tgt2, dt)
+                   for dt in time_start.datetimes()]
+            d_alt, d_az = zip(*res)
+            return (numpy.array(d_alt), numpy.array(d_az))
+
         c1 = self.calc(tgt1, time_start)
         c2 = self.calc(tgt2, time_start)
 
@@ -270,57 +998,27 @@ class Observer(object):
 
     def sunset(self, date=None):
         """Sunset in UTC"""
-        self.site.horizon = self.horizon
-        if date is None:
-            date = self.date
-        self.site.date = ephem.Date(date)
-        r_date = self.site.next_setting(self.sun)
-        return self.tz_utc.localize(r_date.datetime())
+        return self._next_event(self.sun, self.horizon, date, False)
 
     def sunrise(self, date=None):
         """Sunrise in UTC"""
-        self.site.horizon = self.horizon
-        if date is None:
-            date = self.date
-        self.site.date = ephem.Date(date)
-        r_date = self.site.next_rising(self.sun)
-        return self.tz_utc.localize(r_date.datetime())
+        return self._next_event(self.sun, self.horizon, date, True)
 
     def evening_twilight_12(self, date=None):
         """Evening 12 degree (nautical) twilight in UTC"""
-        self.site.horizon = self.horizon12
-        if date is None:
-            date = self.date
-        self.site.date = ephem.Date(date)
-        r_date = self.site.next_setting(self.sun)
-        return self.tz_utc.localize(r_date.datetime())
+        return self._next_event(self.sun, self.horizon12, date, False)
 
     def evening_twilight_18(self, date=None):
         """Evening 18 degree (civil) twilight"""
-        self.site.horizon = self.horizon18
-        if date is None:
-            date = self.date
-        self.site.date = ephem.Date(date)
-        r_date = self.site.next_setting(self.sun)
-        return self.tz_utc.localize(r_date.datetime())
+        return self._next_event(self.sun, self.horizon18, date, False)
 
     def morning_twilight_12(self, date=None):
         """Morning 12 degree (nautical) twilight in UTC"""
-        self.site.horizon = self.horizon12
-        if date is None:
-            date = self.date
-        self.site.date = ephem.Date(date)
-        r_date = self.site.next_rising(self.sun)
-        return self.tz_utc.localize(r_date.datetime())
+        return self._next_event(self.sun, self.horizon12, date, True)
 
     def morning_twilight_18(self, date=None):
         """Morning 18 degree (civil) twilight in UTC"""
-        self.site.horizon = self.horizon18
-        if date is None:
-            date = self.date
-        self.site.date = ephem.Date(date)
-        r_date = self.site.next_rising(self.sun)
-        return self.tz_utc.localize(r_date.datetime())
+        return self._next_event(self.sun, self.horizon18, date, True)
 
     def sun_set_rise_times(self, date):
         """
@@ -336,24 +1034,32 @@ class Observer(object):
                    )
         return rstimes
 
+    def get_almanac(self, date_start, date_stop, **kwdargs):
+        """
+        Sun and Moon events for every night starting on the local dates
+        `date_start` through `date_stop`, computed together.  Returns
+        an almanac.Almanac (see almanac.calc_almanac).
+        """
+        return almanac.calc_almanac(self, date_start, date_stop, **kwdargs)
+
+    def calc_pairs(self, targets, target_idx, times):
+        """
+        Evaluate sidereal targets at scattered times, e.g. the rows of an
+        observation log: target `targets[target_idx[i]]` at `times[i]`.
+        Returns a pairs.PairResult of arrays (see pairs.calc_pairs).
+        """
+        return pairs.calc_pairs(self, targets, target_idx, times)
+
     def moon_rise(self, date=None):
         """Moon rise time in UTC"""
-        if date is None:
-            date = self.date
-        self.site.date = date
-        moonrise = self.site.next_rising(self.moon)
-        moonrise = self.tz_utc.localize(moonrise.datetime())
+        moonrise = self._next_event(self.moon, self.horizon, date, True)
         if moonrise < self.sunset(date):
             None
         return moonrise
 
     def moon_set(self, date=None):
         """Moon set time in UTC"""
-        if date is None:
-            date = self.date
-        self.site.date = date
-        moonset = self.site.next_setting(self.moon)
-        moonset = self.tz_utc.localize(moonset.datetime())
+        moonset = self._next_event(self.moon, self.horizon, date, False)
         if moonset > self.sunrise(date):
             moonset = None
         return moonset
@@ -362,7 +1068,9 @@ class Observer(object):
         """Moon percentage of illumination"""
         if date is None:
             date = self.date
-        self.site.date = ephem.Date(date)
+        site = self._event_site(self.horizon)
+        site.date = self._ephem_date(date)
+        self.moon.compute(site)
         return self.moon.moon_phase
 
     def night_center(self, date=None):
@@ -391,6 +1099,8 @@ class Observer(object):
     def get_text_almanac(self, date, tz=None):
         if tz == None:
             tz = self.tz_local
+        if isinstance(date, TimeGrid):
+            date = date.start
         date_s = date.astimezone(tz).strftime("%Y-%m-%d")
         text = ''
         text += 'Almanac for the night of %s\n' % date_s.split()[0]
@@ -404,9 +1114,13 @@ class Observer(object):
         text += '18d: %s\n12d: %s\nSunrise: %s\n' % (rst[3], rst[4], rst[5])
         return text
 
-    def get_target_info(self, target, time_start=None, time_stop=None,
-                        time_interval=5):
-        """Compute various values for a target from sunrise to sunset"""
+    def get_time_grid(self, time_start=None, time_stop=None,
+                      time_interval=5):
+        """
+        Returns a TimeGrid every `time_interval` minutes from a little
+        before `time_start` (default: sunset) to a little after
+        `time_stop` (default: the following sunrise).
+        """
 
         def _set_time(dtime):
             # Sets time to nice rounded value
@@ -431,38 +1145,123 @@ class Observer(object):
         t_range = _set_data_range(ephem.Date(time_start.astimezone(self.tz_utc)),
                                   ephem.Date(time_stop.astimezone(self.tz_utc)),
                                   time_interval*ephem.minute)
+        return TimeGrid.from_ephem(t_range, tz_local=self.tz_local)
+
+    def get_target_info(self, target, time_start=None, time_stop=None,
+                        time_interval=5, compact=False):
+        """
+        Compute various values for a target from sunrise to sunset.
+        If `time_start` is a TimeGrid, values are computed at its
+        samples instead.
+        If `compact` is True, the history is made up of CompactResult
+        objects sharing one NightContext instead of CalculationResults.
+        With a vectorized backend, the CalculationResults of sidereal
+        targets are filled in from arrays for the whole grid.
+        """
+        if isinstance(time_start, TimeGrid):
+            grid = time_start
+        else:
+            grid = self.get_time_grid(time_start=time_start,
+                                      time_stop=time_stop,
+                                      time_interval=time_interval)
 
         # TODO: this should probably return a generator
-        ## def history():
-        ##     for ut in t_range:
-        ##         # ugh
-        ##         tup = ephem.Date(ut).tuple()
-        ##         args = tup[:-1] + (int(tup[-1]),)
-        ##         ut_with_tz = datetime(*args,
-        ##                               tzinfo=self.tz_utc)
-        ##         info = target.calc(self, ut_with_tz)
-        ##         yield info
-
-        ## return history()
-
-        history = []
-        for ut in t_range:
-            # ugh
-            tup = ephem.Date(ut).tuple()
-            args = tup[:-1] + (int(tup[-1]),)
-            ut_with_tz = datetime(*args,
-                                  tzinfo=self.tz_utc)
-            info = target.calc(self, ut_with_tz)
-            history.append(info)
+        if compact:
+            ctx = self.get_night_context(date=grid.start)
+            return [ctx.calc(target, ut) for ut in grid.djd]
+
+        if (self.backend.vectorized and
+            isinstance(target.body, ephem.FixedBody)):
+            return self._calc_target_info(target, grid)
+
+        history = [target.calc(self, ut_with_tz)
+                   for ut_with_tz in grid.datetimes(self.tz_utc)]
         return history
 
+    def _calc_target_info(self, target, grid):
+        # CalculationResults for a sidereal target from the arrays of our
+        # backend, calculated for the whole grid at once
+        ra, dec = self.backend.catalog_radec([target], grid)
+        ra, dec = ra[0], dec[0]
+        lst, alt, az = self.calc_altaz(ra, dec, grid)
+        sm = self.backend.calc_sun_moon(self, grid)
+        moon_sep = sm.moon_sep(ra, dec)
+        return [CalculationResult(target, self, dt, values=(
+            float(ra[i]), float(dec[i]), float(alt[i]), float(az[i]),
+            float(sm.moon_alt[i]), float(sm.moon_illum[i]),
+            float(moon_sep[i])))
+                for i, dt in enumerate(grid.datetimes(self.tz_utc))]
+
+    def get_target_track(self, target, time_start=None, time_stop=None,
+                         time_interval=5, tolerance=None):
+        """
+        Like get_target_info(), but returns a TargetTrack holding arrays
+        of values for the whole time range.
+        If `tolerance` (arcsec) is given, the track is interpolated from
+        a sparse set of full calculations to within that accuracy (see
+        BaseTarget.calc_track_interp).
+        """
+        if isinstance(time_start, TimeGrid):
+            grid = time_start
+        else:
+            grid = self.get_time_grid(time_start=time_start,
+                                      time_stop=time_stop,
+                                      time_interval=time_interval)
+        if tolerance is not None:
+            return target.calc_track_interp(self, grid, tolerance=tolerance)
+        return target.calc_track(self, grid)
+
+    def get_catalog_track(self, targets, time_start=None, time_stop=None,
+                          time_interval=5):
+        """
+        Compute the tracks of a list of sidereal targets at once,
+        returning a catalog TargetTrack with arrays of shape (N, T).
+
+        Apparent places are computed for the whole catalog once per day
+        of samples, so that the per-sample work is just the rotation to
+        the horizon frame and refraction.  The results agree with the
+        pyephem path to within about 1.5 arcsec.
+        """
+        if isinstance(time_start, TimeGrid):
+            grid = time_start
+        else:
+            grid = self.get_time_grid(time_start=time_start,
+                                      time_stop=time_stop,
+                                      time_interval=time_interval)
+        ra, dec = apparent.catalog_radec(targets, grid)
+        lst, alt, az = self.calc_altaz(ra, dec, grid)
+        return TargetTrack(list(targets), grid, ra, dec, alt, az, lst,
+                           float(self.site.lat))
+
+    def get_sun_moon(self, time_start=None, time_stop=None, time_interval=5):
+        """
+        Returns a SunMoonTrack of the Sun and Moon over a time range (or
+        the samples of a TimeGrid), as for get_target_track(), calculated
+        by our backend.
+        """
+        if isinstance(time_start, TimeGrid):
+            grid = time_start
+        else:
+            grid = self.get_time_grid(time_start=time_start,
+                                      time_stop=time_stop,
+                                      time_interval=time_interval)
+        return self.backend.calc_sun_moon(self, grid)
 
     def get_target_info_table(self, target, time_start=None, time_stop=None,
                               time_interval=5):
         """Prints a table of hourly airmass data"""
-        history = self.get_target_info(target, time_start=time_start,
-                                       time_stop=time_stop,
-                                       time_interval=time_interval)
+        if isinstance(time_start, TimeGrid):
+            grid = time_start
+        else:
+            grid = self.get_time_grid(time_start=time_start,
+                                      time_stop=time_stop,
+                                      time_interval=time_interval)
+        history = self.get_target_info(target, time_start=grid,
+                                       compact=True)
+        # local and UTC times are converted once for the whole grid
+        lt_dates = grid.datetimes(self.tz_local)
+        ut_dates = grid.datetimes(self.tz_utc)
+
         text = []
         format_hdr = '%(date)-16s  %(utc)5s  %(lmst)5s  %(ha)5s  %(pa)7s %(am)6s %(ma)6s %(ms)7s'
         header = dict(date='Date', utc='UTC', lmst='LMST',
@@ -473,9 +1272,9 @@ class Observer(object):
 
         format_line = '%(date)-16s  %(utc)5s  %(lmst)5s  %(ha)5s  %(pa)7.2f %(am)6.2f %(ma)6.2f %(ms)7.2f'
 
-        for info in history:
-            s_date = info.lt.astimezone(self.tz_local).strftime('%d%b%Y  %H:%M')
-            s_utc = info.lt.astimezone(self.tz_utc).strftime('%H:%M')
+        for info, lt, ut in zip(history, lt_dates, ut_dates):
+            s_date = lt.strftime('%d%b%Y  %H:%M')
+            s_utc = ut.strftime('%H:%M')
             s_ha = ':'.join(str(ephem.hours(info.ha)).split(':')[:2])
             s_lmst = ':'.join(str(ephem.hours(info.lmst)).split(':')[:2])
             pa = float(numpy.degrees(info.pang))
@@ -488,6 +1287,42 @@ class Observer(object):
             text.append(s_data)
         return '\n'.join(text)
 
+    # for pickling
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        # ephem objects can't be pickled
+        d['_site'] = None
+        d['sun'] = None
+        d['moon'] = None
+        for key in ('_base_site', '_site_pool', '_event_sites',
+                    'window_cache'):
+            d.pop(key, None)
+        return d
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.window_cache = crossing.WindowCache(self)
+        self._init_sites()
+        self.site = self.get_site(date=self.date)
+        self.sun = ephem.Sun()
+        self.moon = ephem.Moon()
+        self.sun.compute(self.site)
+        self.moon.compute(self.site)
+
+    def __copy__(self):
+        # the copy shares the base site, which is never modified, but
+        # gets its own pool of sites and bodies to calculate with
+        obs = self.__class__.__new__(self.__class__)
+        obs.__dict__.update(self.__dict__)
+        obs.site = self.site.copy()
+        obs._site_pool = OrderedDict()
+        obs._event_sites = {}
+        obs.window_cache = crossing.WindowCache(obs)
+        obs.sun = self.sun.copy()
+        obs.moon = self.moon.copy()
+        return obs
+
     def __repr__(self):
         return self.name
 
@@ -495,8 +1330,12 @@ class Observer(object):
 
 
 class CalculationResult(object):
-
-    def __init__(self, target, observer, date):
+    """
+    Values for `target` at `date`, calculated with pyephem, or taken
+    from `values` (ra, dec, alt, az, moon_alt, moon_pct, moon_sep) if
+    they have been calculated already.
+    """
+    def __init__(self, target, observer, date, values=None):
         # TODO: make a COPY of observer.site
         self.observer = observer
         self.site = observer.site
@@ -505,13 +1344,17 @@ class CalculationResult(object):
 
         # Can/should this calculation be postponed?
         observer.set_date(date)
-        self.body.compute(self.site)
-
         self.lt = self.date.astimezone(observer.tz_local)
-        self.ra = self.body.ra
-        self.dec = self.body.dec
-        self.alt = float(self.body.alt)
-        self.az = float(self.body.az)
+        if values is None:
+            target.compute(self.site)
+            self.ra = self.body.ra
+            self.dec = self.body.dec
+            self.alt = float(self.body.alt)
+            self.az = float(self.body.az)
+        else:
+            ra, dec, self.alt, self.az = values[:4]
+            self.ra = ephem.hours(ra)
+            self.dec = ephem.degrees(dec)
         # TODO: deprecate
         self.alt_deg = math.degrees(self.alt)
         self.az_deg = math.degrees(self.az)
@@ -526,6 +1369,8 @@ class CalculationResult(object):
         self._moon_alt = None
         self._moon_pct = None
         self._moon_sep = None
+        if values is not None:
+            self._moon_alt, self._moon_pct, self._moon_sep = values[4:]
 
 
     @property
@@ -537,10 +1382,7 @@ class CalculationResult(object):
     @property
     def gmst(self):
         if self._gmst is None:
-            jd = ephem.julian_date(self.ut)
-            T = (jd - 2451545.0)/36525.0
-            gmstdeg = 280.46061837+(360.98564736629*(jd-2451545.0))+(0.000387933*T*T)-(T*T*T/38710000.0)
-            self._gmst = ephem.degrees(gmstdeg*numpy.pi/180.0)
+            self._gmst = calc_gmst(ephem.julian_date(self.ut))
         return self._gmst
 
     @property
@@ -600,11 +1442,7 @@ class CalculationResult(object):
 
     def calc_GMST(self, date):
         """Compute Greenwich Mean Sidereal Time"""
-        jd = ephem.julian_date(date)
-        T = (jd - 2451545.0)/36525.0
-        gmstdeg = 280.46061837+(360.98564736629*(jd-2451545.0))+(0.000387933*T*T)-(T*T*T/38710000.0)
-        gmst = ephem.degrees(gmstdeg*numpy.pi/180.0)
-        return gmst
+        return calc_gmst(ephem.julian_date(date))
 
     def calc_LMST(self, date, longitude):
         """Compute Local Mean Sidereal Time"""
@@ -618,24 +1456,11 @@ class CalculationResult(object):
 
     def calc_parallactic(self, dec, ha, lat, az):
         """Compute parallactic angle"""
-        if numpy.cos(dec) != 0.0:
-            sinp = -1.0*numpy.sin(az)*numpy.cos(lat)/numpy.cos(dec)
-            cosp = -1.0*numpy.cos(az)*numpy.cos(ha)-numpy.sin(az)*numpy.sin(ha)*numpy.sin(lat)
-            parang = ephem.degrees(numpy.arctan2(sinp, cosp))
-        else:
-            if lat > 0.0:
-                parang = numpy.pi
-            else:
-                parang = 0.0
-        return parang
+        return calc_parallactic(dec, ha, lat, az)
 
     def calc_airmass(self, alt):
         """Compute airmass"""
-        if alt < ephem.degrees('03:00:00'):
-            alt = ephem.degrees('03:00:00')
-        sz = 1.0/numpy.sin(alt) - 1.0
-        xp = 1.0 + sz*(0.9981833 - sz*(0.002875 + 0.0008083*sz))
-        return xp
+        return calc_airmass(alt)
 
     def calc_moon(self, site, body):
         """Compute Moon altitude"""
@@ -659,27 +1484,168 @@ class CalculationResult(object):
         delta_alt = float(self.body.alt) - float(target.alt)
         return (delta_alt, delta_az)
 
+
+class NightContext(object):
+    """
+    State shared by all the CompactResult objects calculated for one
+    observer over one night: the observer, its timezones and site
+    coordinates, and a cache of Moon positions keyed by sample time.
+    """
+    def __init__(self, observer, date=None):
+        super(NightContext, self).__init__()
+        self.observer = observer
+        self.date = date
+        self.tz_local = observer.tz_local
+        self.tz_utc = observer.tz_utc
+        self.lon = float(observer.site.lon)
+        self.lat = float(observer.site.lat)
+        # (alt, pct, ra, dec) of the Moon, keyed by Dublin JD
+        self.moon_cache = {}
+
+        self._init_site()
+
+    def _init_site(self):
+        # private site, so that we don't disturb the observer's date
+        self.site = self.observer.get_site(date=self.date)
+        self.moon = ephem.Moon()
+
+    def calc(self, target, date):
+        """
+        Compute a CompactResult for `target` at `date`, which may be a
+        datetime or a pyephem date.
+        """
+        if isinstance(date, datetime):
+            try:
+                date = date.astimezone(self.tz_utc)
+            except Exception:
+                date = self.tz_utc.localize(date)
+        djd = float(ephem.Date(date))
+
+        self.site.date = djd
+        body = target.compute(self.site)
+        return CompactResult(self, djd, float(body.ra), float(body.dec),
+                             float(body.alt), float(body.az))
+
+    def moon_at(self, djd):
+        """
+        Returns a tuple of (alt, pct, ra, dec) for the Moon at Dublin
+        JD `djd`.
+        """
+        try:
+            return self.moon_cache[djd]
+
+        except KeyError:
+            self.site.date = djd
+            self.moon.compute(self.site)
+            tup = (float(self.moon.alt), self.moon.moon_phase,
+                   float(self.moon.ra), float(self.moon.dec))
+            self.moon_cache[djd] = tup
+            return tup
+
+    # for pickling
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        # ephem objects can't be pickled
+        d['site'] = None
+        d['moon'] = None
+        return d
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_site()
+
+
+class CompactResult(object):
+    """
+    A memory-efficient alternative to CalculationResult.  Only the
+    per-sample numbers are stored; everything else is derived on demand
+    or looked up in the shared NightContext `ctx`.
+    """
+    __slots__ = ('ctx', 'djd', 'ra', 'dec', 'alt', 'az')
+
+    def __init__(self, ctx, djd, ra, dec, alt, az):
+        self.ctx = ctx
+        self.djd = djd
+        self.ra = ra
+        self.dec = dec
+        self.alt = alt
+        self.az = az
+
+    @property
+    def ut(self):
+        return self.ctx.tz_utc.localize(ephem.Date(self.djd).datetime())
+
+    date = ut
+
+    @property
+    def lt(self):
+        return self.ut.astimezone(self.ctx.tz_local)
+
+    @property
+    def alt_deg(self):
+        return math.degrees(self.alt)
+
+    @property
+    def az_deg(self):
+        return math.degrees(self.az)
+
+    @property
+    def gmst(self):
+        return calc_gmst(self.djd + DJD_OFFSET)
+
+    @property
+    def lmst(self):
+        lmst = ephem.degrees(self.gmst + self.ctx.lon)
+        return lmst.norm
+
+    @property
+    def ha(self):
+        return self.lmst - self.ra
+
+    @property
+    def pang(self):
+        return calc_parallactic(self.dec, float(self.ha), self.ctx.lat,
+                                self.az)
+
+    @property
+    def airmass(self):
+        return calc_airmass(self.alt)
+
+    @property
+    def moon_alt(self):
+        return self.ctx.moon_at(self.djd)[0]
+
+    @property
+    def moon_pct(self):
+        return self.ctx.moon_at(self.djd)[1]
+
+    @property
+    def moon_sep(self):
+        moon_alt, moon_pct, moon_ra, moon_dec = self.ctx.moon_at(self.djd)
+        return float(ephem.separation((moon_ra, moon_dec),
+                                      (self.ra, self.dec)))
+
+    # for pickling
+
+    def __getstate__(self):
+        return (self.ctx, self.djd, self.ra, self.dec, self.alt, self.az)
+
+    def __setstate__(self, state):
+        (self.ctx, self.djd, self.ra, self.dec, self.alt, self.az) = state
+
+
 # define some common bodies
-moon = SiderealTarget(name="Moon")
-moon.body = ephem.Moon()
-sun = SiderealTarget(name="Sun")
-sun.body = ephem.Sun()
-mercury = SiderealTarget(name="Mercury")
-mercury.body = ephem.Mercury()
-venus = SiderealTarget(name="Venus")
-venus.body = ephem.Venus()
-mars = SiderealTarget(name="Mars")
-mars.body = ephem.Mars()
-jupiter = SiderealTarget(name="Jupiter")
-jupiter.body = ephem.Jupiter()
-saturn = SiderealTarget(name="Saturn")
-saturn.body = ephem.Saturn()
-uranus = SiderealTarget(name="Uranus")
-uranus.body = ephem.Uranus()
-neptune = SiderealTarget(name="Neptune")
-neptune.body = ephem.Neptune()
-pluto = SiderealTarget(name="Pluto")
-pluto.body = ephem.Pluto()
+moon = NonSiderealTarget(name="Moon", body=ephem.Moon())
+sun = NonSiderealTarget(name="Sun", body=ephem.Sun())
+mercury = NonSiderealTarget(name="Mercury", body=ephem.Mercury())
+venus = NonSiderealTarget(name="Venus", body=ephem.Venus())
+mars = NonSiderealTarget(name="Mars", body=ephem.Mars())
+jupiter = NonSiderealTarget(name="Jupiter", body=ephem.Jupiter())
+saturn = NonSiderealTarget(name="Saturn", body=ephem.Saturn())
+uranus = NonSiderealTarget(name="Uranus", body=ephem.Uranus())
+neptune = NonSiderealTarget(name="Neptune", body=ephem.Neptune())
+pluto = NonSiderealTarget(name="Pluto", body=ephem.Pluto())
 
 
 #END
@@ -0,0 +1,88 @@
+#
+# horizon.py -- azimuth dependent horizon masks
+#
+#  Eric Jeschke (eric@naoj.org)
+#
+# A mask is given as a profile of the lowest usable elevation at a set
+# of azimuths, interpolated linearly (and around 360 deg) between them.
+# The profile is tabulated once on a fine azimuth grid, so that looking
+# up the limits for whole alt/az track arrays is a single indexing
+# operation.
+#
+import math
+
+# 3rd party imports
+import numpy
+
+twopi = 2.0 * math.pi
+
+
+class HorizonMaskError(Exception):
+    pass
+
+
+class HorizonMask(object):
+    """
+    Lowest usable elevation as a function of azimuth.  `az_deg` and
+    `el_deg` give the profile (azimuth measured from north through
+    east), which is tabulated every `resolution` degrees of azimuth.
+    """
+    def __init__(self, az_deg, el_deg, resolution=0.1):
+        super(HorizonMask, self).__init__()
+        az = numpy.mod(numpy.asarray(az_deg, dtype=numpy.float64), 360.0)
+        el = numpy.asarray(el_deg, dtype=numpy.float64)
+        if az.shape != el.shape or az.ndim != 1 or len(az) == 0:
+            raise HorizonMaskError("az and el must be equal length lists")
+        idx = numpy.argsort(az)
+        self.az_deg, self.el_deg = az[idx], el[idx]
+        self.resolution = resolution
+
+        # limits at the table points, in radians
+        n = int(round(360.0 / resolution))
+        az_tbl = numpy.arange(n) * (360.0 / n)
+        el_tbl = numpy.interp(az_tbl, self.az_deg, self.el_deg, period=360.0)
+        self._scale = n / twopi
+        self._table = numpy.radians(el_tbl)
+        # highest limit in each table step, so that the lookup never
+        # lets through a position the profile blocks
+        self._table = numpy.maximum(self._table, numpy.roll(self._table, -1))
+        self.max_el = float(self._table.max())
+
+    @classmethod
+    def load(cls, path, **kwdargs):
+        """
+        Read a mask from a text file with an azimuth and an elevation
+        (degrees) on each line.  Blank lines and lines starting with '#'
+        are skipped.
+        """
+        az, el = [], []
+        with open(path, 'r') as in_f:
+            for line in in_f:
+                line = line.strip()
+                if len(line) == 0 or line.startswith('#'):
+                    continue
+                vals = line.split()
+                az.append(float(vals[0]))
+                el.append(float(vals[1]))
+        return cls(az, el, **kwdargs)
+
+    def limit(self, az):
+        """
+        Lowest usable elevation (radians) at azimuths `az` (radians; a
+        scalar or array of any shape).
+        """
+        idx = (numpy.mod(az, twopi) * self._scale).astype(numpy.int64)
+        return self._table[idx % len(self._table)]
+
+    def limit_deg(self, az_deg):
+        return numpy.degrees(self.limit(numpy.radians(az_deg)))
+
+    def visible(self, alt, az):
+        """
+        Boolean array telling which positions `alt`, `az` (radians;
+        arrays of equal shape, e.g. those of a TargetTrack) are above
+        the mask.
+        """
+        return alt >= self.limit(az)
+
+#END
@@ -0,0 +1,200 @@
+#
+# lookup.py -- tables of airmass and parallactic angle by dec and HA
+#
+#  Eric Jeschke (eric@naoj.org)
+#
+# At a fixed site the airmass and parallactic angle of a target depend
+# only on its apparent declination and hour angle.  A LookupTable
+# tabulates both over the whole dec x HA plane once, after which they
+# are read off with bilinear interpolation instead of being calculated
+# with trig and refraction for every sample.
+#
+# When the table is built the interpolation is checked against the full
+# calculation at the centre and edge midpoints of every cell.  Cells
+# where the error there exceeds half the tolerance (near the zenith,
+# where the parallactic angle turns quickly, and near the horizon, where
+# the airmass does) are always calculated in full; the margin covers the
+# larger errors found between the check points, which are up to about
+# 1.6 times those at them.
+#
+import math
+
+# 3rd party imports
+import numpy
+
+# local imports
+from obsplan import apparent
+
+# bumped when the layout of saved tables changes
+table_version = 1
+
+# points in each cell (as fractions of the steps in dec, HA) at which
+# the interpolation is checked
+check_points = ((0.5, 0.5), (0.5, 0.0), (0.0, 0.5), (0.5, 1.0), (1.0, 0.5))
+
+
+class LookupTableError(Exception):
+    pass
+
+
+class LookupTable(object):
+    """
+    Airmass and parallactic angle on a grid of `dec_step_deg` degrees of
+    declination by `ha_step_deg` degrees of hour angle, for latitude
+    `lat` (radians) and refraction for `pressure` (mbar) and `temp`
+    (deg C).
+
+    Results are within a fraction `tol_airmass` of the calculated
+    airmass and `tol_pang_deg` degrees of the parallactic angle.  The
+    largest errors found at the check points are kept as
+    `max_err_airmass` (a fraction) and `max_err_pang` (radians).  With
+    the defaults about 8% of the sky above the horizon is calculated in
+    full.
+    """
+    def __init__(self, lat, pressure, temp, dec_step_deg=0.5,
+                 ha_step_deg=0.5, tol_airmass=1.0e-3, tol_pang_deg=0.05):
+        super(LookupTable, self).__init__()
+        self.lat = float(lat)
+        self.pressure = float(pressure or 0.0)
+        self.temp = float(temp or 0.0)
+        self.dec_step_deg = dec_step_deg
+        self.ha_step_deg = ha_step_deg
+        self.tol_airmass = tol_airmass
+        self.tol_pang_deg = tol_pang_deg
+        self._setup()
+
+        # values at the grid nodes
+        dec = numpy.linspace(-0.5 * math.pi, 0.5 * math.pi, self.n_dec)
+        ha = numpy.linspace(-math.pi, math.pi, self.n_ha)
+        dec, ha = numpy.meshgrid(dec, ha, indexing='ij')
+        self.am_tbl, self.pang_tbl = self._calc(dec, ha)
+
+        # errors at the check points (airmass relative)
+        err_am = numpy.zeros((self.n_dec - 1, self.n_ha - 1))
+        err_pang = numpy.zeros((self.n_dec - 1, self.n_ha - 1))
+        d_dec = math.pi / (self.n_dec - 1)
+        d_ha = 2.0 * math.pi / (self.n_ha - 1)
+        dec0, ha0 = dec[:-1, :-1], ha[:-1, :-1]
+        for u, v in check_points:
+            dec_c, ha_c = dec0 + u * d_dec, ha0 + v * d_ha
+            am, pang = self._calc(dec_c, ha_c)
+            am_i, pang_i = self._interp(*self._cells(dec_c.ravel(),
+                                                     ha_c.ravel()))
+            err_am = numpy.maximum(err_am, numpy.abs(
+                am_i.reshape(am.shape) / am - 1.0))
+            err_pang = numpy.maximum(err_pang, numpy.abs(apparent.wrap_pi(
+                pang_i.reshape(pang.shape) - pang)))
+        self.exact = ((err_am > 0.5 * tol_airmass) |
+                      (err_pang > 0.5 * math.radians(tol_pang_deg)))
+        ok = ~self.exact
+        self.max_err_airmass = float(err_am[ok].max()) if ok.any() else 0.0
+        self.max_err_pang = float(err_pang[ok].max()) if ok.any() else 0.0
+
+    def _setup(self):
+        self.n_dec = int(round(180.0 / self.dec_step_deg)) + 1
+        self.n_ha = int(round(360.0 / self.ha_step_deg)) + 1
+        self._dec_scale = (self.n_dec - 1) / math.pi
+        self._ha_scale = (self.n_ha - 1) / (2.0 * math.pi)
+
+    def _calc(self, dec, ha):
+        # full calculation
+        alt, az = apparent.hadec2altaz(ha, dec, self.lat)
+        alt = apparent.refract(alt, self.pressure, self.temp)
+        return (apparent.airmass(alt),
+                apparent.parallactic(dec, ha, self.lat, az))
+
+    def _cells(self, dec, ha):
+        # the cells holding `dec`, `ha` and the offsets within them
+        x = (numpy.clip(dec, -0.5 * math.pi, 0.5 * math.pi) +
+             0.5 * math.pi) * self._dec_scale
+        y = (apparent.wrap_pi(ha) + math.pi) * self._ha_scale
+        i = numpy.minimum(x.astype(numpy.intp), self.n_dec - 2)
+        j = numpy.minimum(y.astype(numpy.intp), self.n_ha - 2)
+        return i, j, x - i, y - j
+
+    def _interp(self, i, j, u, v):
+        # bilinear interpolation within cells `i`, `j`
+        k = i * self.n_ha + j
+        w00, w01 = (1.0 - u) * (1.0 - v), (1.0 - u) * v
+        w10, w11 = u * (1.0 - v), u * v
+        k01, k10, k11 = k + 1, k + self.n_ha, k + self.n_ha + 1
+
+        tbl = self.am_tbl.ravel()
+        am = tbl[k] * w00 + tbl[k01] * w01 + tbl[k10] * w10 + tbl[k11] * w11
+
+        # the angle wraps at +/-pi: interpolate offsets from one corner
+        tbl = self.pang_tbl.ravel()
+        p00 = tbl[k]
+        dp = (apparent.wrap_pi(tbl[k01] - p00) * w01 +
+              apparent.wrap_pi(tbl[k10] - p00) * w10 +
+              apparent.wrap_pi(tbl[k11] - p00) * w11)
+        return am, apparent.wrap_pi(p00 + dp)
+
+    def lookup(self, dec, ha):
+        """
+        Returns arrays of the airmass and parallactic angle (radians)
+        for apparent declinations `dec` and hour angles `ha` (radians;
+        arrays of equal shape).
+        """
+        dec = numpy.asarray(dec, dtype=numpy.float64)
+        ha = numpy.asarray(ha, dtype=numpy.float64)
+        shape = dec.shape
+        dec, ha = dec.ravel(), ha.ravel()
+        i, j, u, v = self._cells(dec, ha)
+        am, pang = self._interp(i, j, u, v)
+        sel = self.exact[i, j]
+        if sel.any():
+            am[sel], pang[sel] = self._calc(dec[sel], ha[sel])
+        return am.reshape(shape), pang.reshape(shape)
+
+    def airmass(self, dec, ha):
+        return self.lookup(dec, ha)[0]
+
+    def pang(self, dec, ha):
+        return self.lookup(dec, ha)[1]
+
+    def matches(self, lat, pressure, temp):
+        """Tell whether the table was made for these site values."""
+        return (self.lat == float(lat) and
+                self.pressure == float(pressure or 0.0) and
+                self.temp == float(temp or 0.0))
+
+    def save(self, path):
+        """Write the table to file `path` (in numpy .npz format)."""
+        with open(path, 'wb') as out_f:
+            numpy.savez(out_f, version=table_version,
+                        site=numpy.array([self.lat, self.pressure,
+                                          self.temp]),
+                        params=numpy.array([self.dec_step_deg,
+                                            self.ha_step_deg,
+                                            self.tol_airmass,
+                                            self.tol_pang_deg]),
+                        errors=numpy.array([self.max_err_airmass,
+                                            self.max_err_pang]),
+                        am_tbl=self.am_tbl, pang_tbl=self.pang_tbl,
+                        exact=self.exact)
+
+    @classmethod
+    def load(cls, path):
+        """Read a table written by save()."""
+        with open(path, 'rb') as in_f:
+            data = numpy.load(in_f, allow_pickle=False)
+            if int(data['version']) != table_version:
+                raise LookupTableError("%s: unsupported table version %d" % (
+                    path, int(data['version'])))
+            self = cls.__new__(cls)
+            self.lat, self.pressure, self.temp = [float(val)
+                                                  for val in data['site']]
+            (self.dec_step_deg, self.ha_step_deg, self.tol_airmass,
+             self.tol_pang_deg) = [float(val) for val in data['params']]
+            self.max_err_airmass, self.max_err_pang = [
+                float(val) for val in data['errors']]
+            self.am_tbl = data['am_tbl']
+            self.pang_tbl = data['pang_tbl']
+            self.exact = data['exact']
+        self._setup()
+        if self.am_tbl.shape != (self.n_dec, self.n_ha):
+            raise LookupTableError("%s: table has the wrong shape" % (path))
+        return self
+
+#END
@@ -0,0 +1,198 @@
+#
+# lowprec.py -- low precision positions of the Sun and Moon
+#
+#  Eric Jeschke (eric@naoj.org)
+#
+# Closed form series for the Sun (good to about 0.5 arcmin) and the Moon
+# (the largest terms of the ELP-2000/82 based series in Meeus,
+# "Astronomical Algorithms", ch. 47; good to about 2 arcmin), written as
+# array operations so that whole grids of times are done at once.
+# Positions are apparent geocentric, for the true equator and equinox
+# of date, as the g_ra and g_dec of the pyephem bodies.
+#
+import math
+
+# 3rd party imports
+import numpy
+
+# local imports
+from obsplan import apparent
+
+deg = math.pi / 180.0
+km_per_au = 149597870.7
+
+# periodic terms of the Moon's longitude (1e-6 deg) and distance
+# (0.001 km): multiples of D, M, M', F and the coefficients
+moon_lr_terms = numpy.array([
+    (0, 0, 1, 0, 6288774, -20905355),
+    (2, 0, -1, 0, 1274027, -3699111),
+    (2, 0, 0, 0, 658314, -2955968),
+    (0, 0, 2, 0, 213618, -569925),
+    (0, 1, 0, 0, -185116, 48888),
+    (0, 0, 0, 2, -114332, -3149),
+    (2, 0, -2, 0, 58793, 246158),
+    (2, -1, -1, 0, 57066, -152138),
+    (2, 0, 1, 0, 53322, -170733),
+    (2, -1, 0, 0, 45758, -204586),
+    (0, 1, -1, 0, -40923, -129620),
+    (1, 0, 0, 0, -34720, 108743),
+    (0, 1, 1, 0, -30383, 104755),
+    (2, 0, 0, -2, 15327, 10321),
+    (0, 0, 1, 2, -12528, 0),
+    (0, 0, 1, -2, 10980, 79661),
+    (4, 0, -1, 0, 10675, -34782),
+    (0, 0, 3, 0, 10034, -23210),
+    (4, 0, -2, 0, 8548, -21636),
+    (2, 1, -1, 0, -7888, 24208),
+    (2, 1, 0, 0, -6766, 30824),
+    (1, 0, -1, 0, -5163, -8379),
+    (1, 1, 0, 0, 4987, -16675),
+    (2, -1, 1, 0, 4036, -12831),
+    (2, 0, 2, 0, 3994, -10445),
+    (4, 0, 0, 0, 3861, -11650),
+    (2, 0, -3, 0, 3665, 14403),
+    (0, 1, -2, 0, -2689, -7003),
+    (2, 0, -1, 2, -2602, 0),
+    (2, -1, -2, 0, 2390, 10056),
+    (1, 0, 1, 0, -2348, 6322),
+    (2, -2, 0, 0, 2236, -9884),
+    ], dtype=numpy.float64)
+
+# periodic terms of the Moon's latitude (1e-6 deg)
+moon_b_terms = numpy.array([
+    (0, 0, 0, 1, 5128122),
+    (0, 0, 1, 1, 280602),
+    (0, 0, 1, -1, 277693),
+    (2, 0, 0, -1, 173237),
+    (2, 0, -1, 1, 55413),
+    (2, 0, -1, -1, 46271),
+    (2, 0, 0, 1, 32573),
+    (0, 0, 2, 1, 17198),
+    (2, 0, 1, -1, 9266),
+    (0, 0, 2, -1, 8822),
+    (2, -1, 0, -1, 8216),
+    (2, 0, -2, -1, 4324),
+    (2, 0, 1, 1, 4200),
+    (2, 1, 0, -1, -3359),
+    (2, -1, -1, 1, 2463),
+    (2, -1, 0, 1, 2211),
+    (2, -1, -1, -1, 2065),
+    (0, 1, -1, -1, -1870),
+    (4, 0, -1, -1, 1828),
+    (0, 1, 0, 1, -1794),
+    ], dtype=numpy.float64)
+
+
+def _centuries(jd):
+    return (numpy.asarray(jd, dtype=numpy.float64) - 2451545.0) / 36525.0
+
+def _ecl2radec(lon, lat, eps):
+    # ecliptic longitude, latitude to RA, Dec for obliquity `eps`
+    sin_lon = numpy.sin(lon)
+    ra = numpy.arctan2(sin_lon * numpy.cos(eps) -
+                       numpy.tan(lat) * numpy.sin(eps), numpy.cos(lon))
+    dec = numpy.arcsin(numpy.sin(lat) * numpy.cos(eps) +
+                       numpy.cos(lat) * numpy.sin(eps) * sin_lon)
+    return (numpy.mod(ra, apparent.twopi), dec)
+
+def sun_lon(jd, nut=None):
+    """
+    Apparent ecliptic longitude (radians) and distance (AU) of the Sun
+    at Julian Date(s) `jd`.  `nut` is apparent.nutation(jd), if it is
+    at hand.
+    """
+    lon, e, peri = apparent.sun_longitude(jd)
+    # true anomaly (the Sun's perihelion is opposite the Earth's)
+    v = lon - peri - math.pi
+    R = 1.000001018 * (1.0 - e * e) / (1.0 + e * numpy.cos(v))
+    # aberration and nutation in longitude
+    if nut is None:
+        nut = apparent.nutation(jd)
+    dpsi, deps, eps0 = nut
+    lon = lon - 0.00569 * deg + dpsi
+    return (numpy.mod(lon, apparent.twopi), R)
+
+def sun_radec(jd):
+    """
+    Apparent geocentric RA, Dec (radians) and distance (AU) of the Sun
+    at Julian Date(s) `jd`.
+    """
+    nut = apparent.nutation(jd)
+    lon, R = sun_lon(jd, nut=nut)
+    dpsi, deps, eps0 = nut
+    ra, dec = _ecl2radec(lon, 0.0 * lon, eps0 + deps)
+    return (ra, dec, R)
+
+def moon_ecliptic(jd, nut=None):
+    """
+    Apparent ecliptic longitude, latitude (radians) and distance (km)
+    of the Moon at Julian Date(s) `jd`.  `nut` is as for sun_lon().
+    """
+    T = _centuries(jd)
+    Lp = (218.3164477 + T * (481267.88123421 + T * (-0.0015786 + T * (
+        1.0 / 538841 - T / 65194000.0))))
+    D = (297.8501921 + T * (445267.1114034 + T * (-0.0018819 + T * (
+        1.0 / 545868 - T / 113065000.0))))
+    M = 357.5291092 + T * (35999.0502909 + T * (-0.0001536 + T / 24490000.0))
+    Mp = (134.9633964 + T * (477198.8675055 + T * (0.0087414 + T * (
+        1.0 / 69699 - T / 14712000.0))))
+    F = (93.2720950 + T * (483202.0175233 + T * (-0.0036539 + T * (
+        -1.0 / 3526000 + T / 863310000.0))))
+    E = 1.0 - T * (0.002516 + 0.0000074 * T)
+    A1 = (119.75 + 131.849 * T) * deg
+    A2 = (53.09 + 479264.290 * T) * deg
+    A3 = (313.45 + 481266.484 * T) * deg
+
+    args = numpy.array([D, M, Mp, F]) * deg
+    shape = args.shape[1:]
+    args = args.reshape(4, -1)
+
+    # terms with M are scaled by E for each multiple of it
+    E = numpy.asarray(E, dtype=numpy.float64).reshape(-1)
+    e_pow = numpy.array([numpy.ones_like(E), E, E * E])
+
+    def _terms(terms):
+        arg = numpy.dot(terms[:, :4], args)
+        return arg, e_pow[numpy.abs(terms[:, 1]).astype(numpy.int64)]
+
+    arg, e_fac = _terms(moon_lr_terms)
+    s_l = numpy.dot(moon_lr_terms[:, 4], e_fac * numpy.sin(arg)).reshape(shape)
+    s_r = numpy.dot(moon_lr_terms[:, 5], e_fac * numpy.cos(arg)).reshape(shape)
+    arg, e_fac = _terms(moon_b_terms)
+    s_b = numpy.dot(moon_b_terms[:, 4], e_fac * numpy.sin(arg)).reshape(shape)
+
+    Lp_r, Mp_r, F_r = Lp * deg, Mp * deg, F * deg
+    s_l = s_l + (3958 * numpy.sin(A1) + 1962 * numpy.sin(Lp_r - F_r) +
+                 318 * numpy.sin(A2))
+    s_b = s_b + (-2235 * numpy.sin(Lp_r) + 382 * numpy.sin(A3) +
+                 175 * numpy.sin(A1 - F_r) + 175 * numpy.sin(A1 + F_r) +
+                 127 * numpy.sin(Lp_r - Mp_r) - 115 * numpy.sin(Lp_r + Mp_r))
+
+    if nut is None:
+        nut = apparent.nutation(jd)
+    dpsi, deps, eps0 = nut
+    lon = (Lp + s_l * 1.0e-6) * deg + dpsi
+    lat = s_b * 1.0e-6 * deg
+    dist = 385000.56 + s_r * 0.001
+    return (numpy.mod(lon, apparent.twopi), lat, dist)
+
+def moon_radec(jd):
+    """
+    Apparent geocentric RA, Dec (radians), distance (AU) and
+    illuminated fraction of the Moon at Julian Date(s) `jd`.
+    """
+    nut = apparent.nutation(jd)
+    lon, lat, dist = moon_ecliptic(jd, nut=nut)
+    dpsi, deps, eps0 = nut
+    ra, dec = _ecl2radec(lon, lat, eps0 + deps)
+
+    # phase angle from the elongation (Meeus ch. 48)
+    sun_l, R = sun_lon(jd, nut=nut)
+    cos_psi = numpy.cos(lat) * numpy.cos(lon - sun_l)
+    sin_psi = numpy.sqrt(numpy.maximum(1.0 - cos_psi * cos_psi, 0.0))
+    R_km = R * km_per_au
+    i = numpy.arctan2(R_km * sin_psi, dist - R_km * cos_psi)
+    illum = (1.0 + numpy.cos(i)) / 2.0
+    return (ra, dec, dist / km_per_au, illum)
+
+#END
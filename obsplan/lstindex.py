@@ -0,0 +1,206 @@
+#
+# lstindex.py -- index of catalog targets by sidereal visibility
+#
+#  Eric Jeschke (eric@naoj.org)
+#
+# At a fixed site, a sidereal target is above a given altitude during
+# the same range of local sidereal time every day: the hour angles
+# within its half arc around transit.  The ranges of a whole catalog
+# are computed once and kept in an interval tree, so the targets that
+# are up during an LST range are found without calculating any of the
+# others.
+#
+# The sidereal circle is handled by storing each range three times,
+# shifted by -24h, 0h and +24h, and querying with a start within
+# [0, 24h).
+#
+import math
+
+# 3rd party imports
+import numpy
+
+# local imports
+from obsplan import apparent, crossing, timegrid
+
+twopi = 2.0 * math.pi
+# ratio of sidereal to solar time
+sidereal_rate = 1.00273790935
+
+# intervals per leaf of the tree
+leaf_size = 64
+
+
+class IntervalTree(object):
+    """
+    A static centered interval tree of the intervals [`start`, `end`]
+    (arrays of equal length).  Queries return the indices of the
+    intervals that overlap a range.
+    """
+    def __init__(self, start, end):
+        super(IntervalTree, self).__init__()
+        self.start = numpy.asarray(start, dtype=numpy.float64)
+        self.end = numpy.asarray(end, dtype=numpy.float64)
+        self.root = self._build(numpy.arange(len(self.start)))
+
+    def _build(self, idx):
+        if len(idx) == 0:
+            return None
+        start, end = self.start[idx], self.end[idx]
+        if len(idx) <= leaf_size:
+            return (None, idx, None, None, None, None)
+        center = numpy.median(0.5 * (start + end))
+        left = end < center
+        right = start > center
+        here = idx[~(left | right)]
+        # the intervals containing the center, by start and by end
+        by_start = here[numpy.argsort(self.start[here])]
+        by_end = here[numpy.argsort(self.end[here])]
+        # (the median keeps both sides smaller than the node)
+        return (center, by_start, by_end,
+                self.start[by_start], self.end[by_end],
+                (self._build(idx[left]), self._build(idx[right])))
+
+    def overlapping(self, a, b):
+        """
+        Returns an array of the indices of the intervals overlapping
+        [`a`, `b`].
+        """
+        res = []
+        stack = [self.root]
+        while len(stack) > 0:
+            node = stack.pop()
+            if node is None:
+                continue
+            center, by_start, by_end, starts, ends, children = node
+            if center is None:
+                # leaf: check them all
+                idx = by_start
+                ok = (self.start[idx] <= b) & (self.end[idx] >= a)
+                res.append(idx[ok])
+                continue
+            if b < center:
+                res.append(by_start[:numpy.searchsorted(starts, b,
+                                                        side='right')])
+                stack.append(children[0])
+            elif a > center:
+                res.append(by_end[numpy.searchsorted(ends, a):])
+                stack.append(children[1])
+            else:
+                res.append(by_start)
+                stack.extend(children)
+        if len(res) == 0:
+            return numpy.zeros(0, dtype=numpy.int64)
+        return numpy.concatenate(res)
+
+    def __len__(self):
+        return len(self.start)
+
+
+class LSTIndex(object):
+    """
+    Index of the sidereal `targets` by the range of local apparent
+    sidereal time in which each is between `el_min_deg` and
+    `el_max_deg` degrees of altitude (and below `airmass`) at
+    `observer`.
+
+    Positions are the apparent places at `date` (a datetime, by default
+    the observer's date); precession moves the ranges by about 3 sec of
+    LST a month away from it.
+    """
+    def __init__(self, observer, targets, el_min_deg=15.0, el_max_deg=None,
+                 airmass=None, date=None):
+        super(LSTIndex, self).__init__()
+        self.observer = observer
+        self.targets = list(targets)
+        if date is None:
+            date = observer.date
+        self.lon = float(observer.site.lon)
+        lat = float(observer.site.lat)
+
+        mjd = timegrid.datetime2mjd(date)
+        places = apparent.ApparentPlaces.from_targets(
+            self.targets, mjd + timegrid.MJD_OFFSET)
+        ra, dec = places.ra, places.dec
+
+        # apparent altitude limits, to geometric
+        el_min_deg = crossing.fold_airmass(el_min_deg, airmass)
+        pressure, temp = observer.pressure, observer.temperature
+        el_min = float(apparent.unrefract(math.radians(el_min_deg),
+                                          pressure, temp))
+        ha_max = self._half_arc(dec, lat, el_min)
+        if el_max_deg is not None:
+            el_max = float(apparent.unrefract(math.radians(el_max_deg),
+                                              pressure, temp))
+            ha_min = self._half_arc(dec, lat, el_max)
+        else:
+            ha_min = numpy.zeros(len(dec))
+
+        # up to two ranges per target, either side of transit if it
+        # goes too high; ranges of 24h are always up
+        self.always = numpy.nonzero((ha_max >= math.pi) & (ha_min <= 0.0))[0]
+        ok = (ha_max > ha_min) & (ha_max < math.pi)
+        ok_min = ha_min > 0.0
+        ids, starts, ends = [], [], []
+        for sel, s, e in ((ok & ~ok_min, ra - ha_max, ra + ha_max),
+                          (ok & ok_min, ra - ha_max, ra - ha_min),
+                          (ok & ok_min, ra + ha_min, ra + ha_max),
+                          # too high around transit, but never sets
+                          ((ha_max >= math.pi) & ok_min, ra + ha_min,
+                           ra - ha_min + twopi)):
+            s0 = numpy.mod(s[sel], twopi)
+            ids.append(numpy.nonzero(sel)[0])
+            starts.append(s0)
+            ends.append(s0 + (e[sel] - s[sel]))
+        ids, starts, ends = [numpy.concatenate(arr)
+                             for arr in (ids, starts, ends)]
+
+        self._ids = numpy.concatenate([ids] * 3)
+        self._start = numpy.concatenate([starts - twopi, starts,
+                                         starts + twopi])
+        self._end = numpy.concatenate([ends - twopi, ends, ends + twopi])
+        self.tree = IntervalTree(self._start, self._end)
+
+    def _half_arc(self, dec, lat, el):
+        # hour angle (radians) at which targets at `dec` cross `el`: 0
+        # if they never reach it, pi if they never go below it
+        cos_h = ((math.sin(el) - math.sin(lat) * numpy.sin(dec)) /
+                 numpy.maximum(math.cos(lat) * numpy.cos(dec), 1.0e-12))
+        return numpy.arccos(numpy.clip(cos_h, -1.0, 1.0))
+
+    def query(self, lst_start, lst_stop, duration=0.0):
+        """
+        Returns the sorted indices of the targets that are within the
+        limits for at least `duration` minutes (of solar time) without
+        a break, between local sidereal times `lst_start` and `lst_stop`
+        (radians; the range may wrap through 0h).
+        """
+        a = lst_start % twopi
+        b = a + (lst_stop - lst_start) % twopi
+        if lst_stop != lst_start and b == a:
+            b = a + twopi
+        d = duration * sidereal_rate * twopi / 1440.0
+        if b - a < d:
+            return numpy.zeros(0, dtype=numpy.int64)
+
+        # ranges overlapping the query by `d` must reach into it
+        idx = self.tree.overlapping(a + d, b - d)
+        overlap = (numpy.minimum(self._end[idx], b) -
+                   numpy.maximum(self._start[idx], a))
+        ids = self._ids[idx[overlap >= d]]
+        return numpy.union1d(ids, self.always)
+
+    def query_time(self, time_start, time_stop, duration=0.0):
+        """
+        Like query(), for the period between datetimes `time_start` and
+        `time_stop` (at most a sidereal day long).
+        """
+        grid = timegrid.TimeGrid.from_datetimes([time_start, time_stop])
+        lst = apparent.last(grid, self.lon)
+        if timegrid.datetime2mjd(time_stop) - grid.mjd[0] >= 1.0 / sidereal_rate:
+            return self.query(0.0, twopi, duration=duration)
+        return self.query(lst[0], lst[1], duration=duration)
+
+    def get_targets(self, idx):
+        return [self.targets[i] for i in idx]
+
+#END
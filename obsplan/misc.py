@@ -3,6 +3,8 @@
 #
 import math
 
+import numpy
+
 def alt2airmass(alt_deg):
     xp = 1.0 / math.sin(math.radians(alt_deg + 244.0/(165.0 + 47*alt_deg**1.1)))
     return xp
@@ -21,11 +23,37 @@ def airmass2alt(am):
 
 def calc_slew_time(d_az, d_el, rate_az=0.5, rate_el=0.5):
     """Calculate slew time given a delta in azimuth aand elevation.
+    The deltas may also be arrays.
     """
-    time_sec = max(math.fabs(d_el) / rate_el,
-                   math.fabs(d_az) / rate_az)
+    time_sec = numpy.maximum(numpy.abs(d_el) / rate_el,
+                             numpy.abs(d_az) / rate_az)
     return time_sec
 
+def ra_rad2str(ra_rad, prec=4):
+    """Format RA `ra_rad` (radians) as a sexagesimal hours string."""
+    hours = (math.degrees(ra_rad) / 15.0) % 24.0
+    return _sexagesimal(hours, prec, sign=False, modulus=24)
+
+def dec_rad2str(dec_rad, prec=3):
+    """Format Dec `dec_rad` (radians) as a sexagesimal degrees string."""
+    return _sexagesimal(math.degrees(dec_rad), prec, sign=True)
+
+def _sexagesimal(val, prec, sign=False, modulus=None):
+    sgn = '-' if val < 0.0 else '+'
+    # round once, in units of the last digit, to avoid 60.0 seconds
+    scale = 10 ** prec
+    units = int(round(abs(val) * 3600.0 * scale))
+    if modulus is not None:
+        units %= modulus * 3600 * scale
+    secs = units % (60 * scale)
+    mins = (units // (60 * scale)) % 60
+    degs = units // (3600 * scale)
+    res = "%02d:%02d:%0*.*f" % (degs, mins, prec + 3, prec,
+                                float(secs) / scale)
+    if sign:
+        res = sgn + res
+    return res
+
 
 class Bunch(object):
     def __init__(self, **kwdargs):
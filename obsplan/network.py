@@ -0,0 +1,171 @@
+#
+# network.py -- evaluate a catalog for several sites at once
+#
+#  Eric Jeschke (eric@naoj.org)
+#
+import math
+
+# 3rd party imports
+import ephem
+import numpy
+
+# local imports
+from obsplan import apparent, crossing
+from obsplan.entity import TargetTrack
+
+
+class NetworkResult(object):
+    """
+    Values for N targets at M sites at the T samples of a TimeGrid.
+    Arrays are of shape (M, N, T) for the targets and (M, T) for the
+    Sun and Moon; angles are in radians.
+    """
+    def __init__(self, network, targets, grid, ra, dec, alt, az, lst,
+                 sun_alt, moon_alt, moon_sep, moon_pct):
+        super(NetworkResult, self).__init__()
+        self.network = network
+        self.sites = [obs.name for obs in network.observers]
+        self.targets = targets
+        self.grid = grid
+        self.ra = ra
+        self.dec = dec
+        self.alt = alt
+        self.az = az
+        self.lst = lst
+        self.sun_alt = sun_alt
+        self.moon_alt = moon_alt
+        self.moon_sep = moon_sep
+        self.moon_pct = moon_pct
+
+    @property
+    def airmass(self):
+        return apparent.airmass(self.alt)
+
+    def get_site_index(self, site):
+        if isinstance(site, int):
+            return site
+        return self.sites.index(site)
+
+    def get_track(self, site):
+        """
+        Returns a catalog TargetTrack of the targets at `site` (a site
+        name or index).
+        """
+        i = self.get_site_index(site)
+        obs = self.network.observers[i]
+        return TargetTrack(self.targets, self.grid, self.ra, self.dec,
+                           self.alt[i], self.az[i], self.lst[i],
+                           float(obs.site.lat))
+
+    def observable(self, el_min_deg=15.0, el_max_deg=89.0, airmass=None,
+                   sun_alt_deg=-12.0, moon_sep_deg=None):
+        """
+        Returns a boolean array of shape (M, N, T) telling whether each
+        target is observable at each site and sample: within the
+        elevation (and airmass) limits and above the site's horizon
+        mask, with the Sun below `sun_alt_deg` and at least
+        `moon_sep_deg` from the Moon.
+        """
+        el_min_deg = crossing.fold_airmass(el_min_deg, airmass)
+        res = ((self.alt >= math.radians(el_min_deg)) &
+               (self.alt <= math.radians(el_max_deg)))
+        for i, obs in enumerate(self.network.observers):
+            if obs.horizon_mask is not None:
+                res[i] &= obs.horizon_mask.visible(self.alt[i], self.az[i])
+        night = self.sun_alt < math.radians(sun_alt_deg)
+        res &= night[:, numpy.newaxis, :]
+        if moon_sep_deg is not None:
+            moon_ok = ((self.moon_sep >= math.radians(moon_sep_deg)) |
+                       (self.moon_alt < 0.0)[:, numpy.newaxis, :])
+            res &= moon_ok
+        return res
+
+    def observable_time(self, **kwdargs):
+        """
+        Returns an array of shape (M, N) with the time (sec) each
+        target is observable at each site.  Takes the same keyword
+        arguments as observable().
+        """
+        obs = self.observable(**kwdargs)
+        return obs.sum(axis=2) * self.grid.interval * 60.0
+
+
+class Network(object):
+    """
+    A network of observers (sites) for which catalogs are evaluated
+    together.  Work that doesn't depend on the site is done once: the
+    apparent places of the targets, the geocentric positions of the Sun
+    and Moon, and the time conversions.
+    """
+    def __init__(self, observers):
+        super(Network, self).__init__()
+        self.observers = list(observers)
+
+    def get_observer(self, name):
+        for obs in self.observers:
+            if obs.name == name:
+                return obs
+        raise KeyError(name)
+
+    def _geocentric(self, body, grid):
+        # geocentric apparent RA/Dec, distance (AU) and phase (percent
+        # illuminated) of a pyephem body
+        n = len(grid)
+        ra, dec, dist, phase = (numpy.empty(n), numpy.empty(n),
+                                numpy.empty(n), numpy.empty(n))
+        for i, djd in enumerate(grid.djd):
+            body.compute(ephem.Date(djd))
+            ra[i], dec[i] = body.g_ra, body.g_dec
+            dist[i], phase[i] = body.earth_distance, body.phase
+        return (ra, dec, dist, phase)
+
+    def calc(self, targets, grid):
+        """
+        Evaluate sidereal `targets` at every site for the samples of
+        TimeGrid `grid`.  Returns a NetworkResult.
+        """
+        targets = list(targets)
+        nsites, ntgts, nt = len(self.observers), len(targets), len(grid)
+
+        # site independent
+        ra, dec = apparent.catalog_radec(targets, grid)
+        gast = apparent.last(grid, 0.0)
+        sun_ra, sun_dec, sun_dist, _ = self._geocentric(ephem.Sun(), grid)
+        moon_ra, moon_dec, moon_dist, moon_pct = self._geocentric(
+            ephem.Moon(), grid)
+        moon_pct = moon_pct / 100.0
+        moon_dist = moon_dist / apparent.earth_radius_au
+        tgt_vec = apparent.radec2vec(ra.ravel(), dec.ravel()).reshape(
+            ra.shape + (3,))
+
+        alt = numpy.empty((nsites, ntgts, nt))
+        az = numpy.empty((nsites, ntgts, nt))
+        lst = numpy.empty((nsites, nt))
+        sun_alt = numpy.empty((nsites, nt))
+        moon_alt = numpy.empty((nsites, nt))
+        moon_sep = numpy.empty((nsites, ntgts, nt))
+
+        for i, obs in enumerate(self.observers):
+            lon, lat = float(obs.site.lon), float(obs.site.lat)
+            pressure, temp = obs.pressure, obs.temperature
+            lst[i] = numpy.mod(gast + lon, apparent.twopi)
+
+            _alt, az[i] = apparent.hadec2altaz(lst[i] - ra, dec, lat)
+            alt[i] = apparent.refract(_alt, pressure, temp)
+
+            _alt, _az = apparent.hadec2altaz(lst[i] - sun_ra, sun_dec, lat)
+            sun_alt[i] = apparent.refract(_alt, pressure, temp)
+
+            # the Moon is close enough to need topocentric positions
+            t_ra, t_dec = apparent.topocentric(moon_ra, moon_dec, moon_dist,
+                                               lst[i], lat, obs.elevation)
+            _alt, _az = apparent.hadec2altaz(lst[i] - t_ra, t_dec, lat)
+            moon_alt[i] = apparent.refract(_alt, pressure, temp)
+            moon_vec = apparent.radec2vec(t_ra, t_dec)
+            cos_sep = numpy.clip((tgt_vec * moon_vec).sum(axis=-1), -1.0, 1.0)
+            moon_sep[i] = numpy.arccos(cos_sep)
+
+        return NetworkResult(self, targets, grid, ra, dec, alt, az, lst,
+                             sun_alt, moon_alt, moon_sep, moon_pct)
+
+#END
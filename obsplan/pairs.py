@@ -0,0 +1,121 @@
+#
+# pairs.py -- evaluate targets at scattered times
+#
+#  Eric Jeschke (eric@naoj.org)
+#
+# Observation logs give (target, time) pairs at irregular times, so
+# there is no grid of samples to share between the targets.  The work
+# is grouped instead: the apparent place of each target is computed
+# once per day in which it appears, the Moon once per distinct time
+# (interpolated, see almanac.Ephemeris), and the rest is done for all
+# the pairs at once as arrays.
+#
+# 3rd party imports
+import numpy
+
+# local imports
+from obsplan import apparent, almanac, timegrid
+from obsplan.timegrid import TimeGrid
+
+
+class PairResult(object):
+    """
+    Values for sidereal targets at scattered times: the arrays each
+    have a value per pair.  `target` holds the target indices and
+    `grid` the times, `ra`, `dec` are the apparent places and `lst` the
+    local apparent sidereal times; angles are in radians.
+    """
+    def __init__(self, targets, target, grid, ra, dec, alt, az, lst, lat,
+                 moon_alt, moon_sep, moon_pct):
+        super(PairResult, self).__init__()
+        self.targets = targets
+        self.target = target
+        self.grid = grid
+        self.ra = ra
+        self.dec = dec
+        self.alt = alt
+        self.az = az
+        self.lst = lst
+        self.lat = lat
+        self.moon_alt = moon_alt
+        self.moon_sep = moon_sep
+        self.moon_pct = moon_pct
+
+    @property
+    def ha(self):
+        return apparent.wrap_pi(self.lst - self.ra)
+
+    @property
+    def airmass(self):
+        return apparent.airmass(self.alt)
+
+    @property
+    def pang(self):
+        return apparent.parallactic(self.dec, self.ha, self.lat, self.az)
+
+    def __len__(self):
+        return len(self.grid)
+
+
+def calc_pairs(observer, targets, target_idx, times):
+    """
+    Evaluate the pairs of sidereal targets (`target_idx`, indices into
+    the list `targets`) and `times` (a TimeGrid, or a sequence of UTC
+    datetimes) for `observer`.  Returns a PairResult.
+
+    Altitudes agree with target.calc to about 0.5 arcsec, and the Moon
+    to about 1 arcsec.
+    """
+    targets = list(targets)
+    if not isinstance(times, TimeGrid):
+        times = TimeGrid.from_datetimes(times)
+    idx = numpy.asarray(target_idx, dtype=numpy.int64).ravel()
+    if len(idx) != len(times):
+        raise ValueError("%d target indices for %d times" % (
+            len(idx), len(times)))
+    mjd = times.mjd
+    lon, lat = float(observer.site.lon), float(observer.site.lat)
+    pressure, temp = observer.pressure, observer.temperature
+    if len(idx) == 0:
+        empty = numpy.zeros(0)
+        return PairResult(targets, idx, times, empty, empty, empty, empty,
+                          empty, lat, empty, empty, empty)
+
+    # apparent places, per day for the targets seen that day
+    cat_ra, cat_dec, epoch_jd = apparent.target_arrays(targets)
+    ra, dec = numpy.empty(len(idx)), numpy.empty(len(idx))
+    days = numpy.floor(mjd)
+    order = numpy.argsort(days, kind='mergesort')
+    starts = numpy.unique(days[order], return_index=True)[1]
+    for i, j in zip(starts, list(starts[1:]) + [len(order)]):
+        rows = order[i:j]
+        tgts, inv = numpy.unique(idx[rows], return_inverse=True)
+        places = apparent.ApparentPlaces(
+            cat_ra[tgts], cat_dec[tgts], epoch_jd[tgts],
+            mjd[rows].mean() + timegrid.MJD_OFFSET)
+        ra[rows] = places.ra[inv]
+        dec[rows] = places.dec[inv]
+
+    lst = apparent.last(times, lon)
+    _alt, az = apparent.hadec2altaz(lst - ra, dec, lat)
+    alt = apparent.refract(_alt, pressure, temp)
+
+    # the Moon, once per distinct time
+    t, inv = numpy.unique(mjd, return_inverse=True)
+    eph = almanac.Ephemeris(t[0], t[-1])
+    m_ra, m_dec, _radius, m_dist, m_phase = eph.moon_at(t)
+    t_lst = apparent.last(TimeGrid(t), lon)
+    m_ra, m_dec = apparent.topocentric(m_ra, m_dec,
+                                       m_dist / apparent.earth_radius_au,
+                                       t_lst, lat, observer.elevation)
+    _alt, _az = apparent.hadec2altaz(t_lst - m_ra, m_dec, lat)
+    moon_alt = apparent.refract(_alt, pressure, temp)
+
+    moon_vec = apparent.radec2vec(m_ra, m_dec)[inv]
+    tgt_vec = apparent.radec2vec(ra, dec)
+    cos_sep = numpy.clip((tgt_vec * moon_vec).sum(axis=-1), -1.0, 1.0)
+
+    return PairResult(targets, idx, times, ra, dec, alt, az, lst, lat,
+                      moon_alt[inv], numpy.arccos(cos_sep), m_phase[inv])
+
+#END
@@ -16,6 +16,7 @@ import matplotlib.dates as mpl_dt
 import matplotlib as mpl
 
 from obsplan import misc
+from obsplan.plots.decimate import DecimatedCurve
 
 class AirMassPlot(object):
 
@@ -23,6 +24,14 @@ class AirMassPlot(object):
         # time increments, by minute
         self.time_inc_min = 15
 
+        # curves are thinned to about this many points per pixel of
+        # width (see decimate.py), keeping where they cross these
+        # airmasses
+        self.points_per_pixel = 1.0
+        self.am_thresholds = (1.5, 2.0)
+        # (line, DecimatedCurve) of each plotted curve
+        self._curves = []
+
         # create matplotlib figure
         self.fig = figure.Figure(figsize=(width, height), dpi=dpi)
 
@@ -51,8 +60,10 @@ class AirMassPlot(object):
         target_data = []
         lengths = []
         if num_tgts > 0:
+            # evaluate all targets over the same grid of times
+            grid = site.get_time_grid()
             for tgt in targets:
-                info_list = site.get_target_info(tgt)
+                info_list = site.get_target_info(tgt, time_start=grid)
                 target_data.append(misc.Bunch(history=info_list, target=tgt))
                 lengths.append(len(info_list))
 
@@ -90,22 +101,28 @@ class AirMassPlot(object):
 
         #lstyle = 'o'
         lstyle = '-'
-        lt_data = map(lambda info: info.ut.astimezone(tz),
-                      tgt_data[0].history)
+        lt_data = [info.ut.astimezone(tz) for info in tgt_data[0].history]
+        # (plotted as date numbers, as plot_date does)
+        x_data = mpl_dt.date2num(lt_data)
+        ax1.xaxis_date(tz)
+        self._curves = []
+        nbuckets = ax1.bbox.width * self.points_per_pixel
         # sanity check on dates in preferred timezone
         ## for dt in lt_data[:10]:
         ##     print(dt.strftime("%Y-%m-%d %H:%M:%S"))
 
         # plot targets airmass vs. time
         for i, info in enumerate(tgt_data):
-            am_data = numpy.array(map(lambda info: info.airmass, info.history))
+            am_data = numpy.array([info.airmass for info in info.history])
             am_min = numpy.argmin(am_data)
-            am_data_dots = am_data
+            curve = DecimatedCurve(x_data, am_data,
+                                   thresholds=self.am_thresholds)
             color = self.colors[i % len(self.colors)]
             lc = color + lstyle
             # ax1.plot_date(lt_data, am_data, lc, linewidth=1.0, alpha=0.3, aa=True, tz=tz)
-            ax1.plot_date(lt_data, am_data_dots, lc, linewidth=2.0,
-                          aa=True, tz=tz)
+            xs, ys = curve.get(nbuckets)
+            line, = ax1.plot(xs, ys, lc, linewidth=2.0, aa=True)
+            self._curves.append((line, curve))
             #xs, ys = mpl.mlab.poly_between(lt_data, 2.02, am_data)
             #ax1.fill(xs, ys, facecolor=self.colors[i], alpha=0.2)
 
@@ -139,13 +156,14 @@ class AirMassPlot(object):
 
         # Plot moon altitude and degree scale
         ax2 = ax1.twinx()
-        moon_data = numpy.array(map(lambda info: numpy.degrees(info.moon_alt),
-                                    tgt_data[0].history))
+        moon_data = numpy.array([numpy.degrees(info.moon_alt)
+                                 for info in tgt_data[0].history])
         #moon_illum = site.moon_phase()
-        ax2.plot_date(lt_data, moon_data, '#666666', linewidth=2.0,
-                      alpha=0.5, aa=True, tz=tz)
-        mxs, mys = mpl.mlab.poly_between(lt_data, 0, moon_data)
-        # ax2.fill(mxs, mys, facecolor='#666666', alpha=moon_illum)
+        curve = DecimatedCurve(x_data, moon_data)
+        xs, ys = curve.get(nbuckets)
+        line, = ax2.plot(xs, ys, color='#666666', linewidth=2.0,
+                         alpha=0.5, aa=True)
+        self._curves.append((line, curve))
         ax2.set_ylabel('Moon Altitude (deg)', color='#666666')
         ax2.set_ylim(0, 90)
         ax2.set_xlim(lt_data[0], lt_data[-1])
@@ -155,10 +173,19 @@ class AirMassPlot(object):
         ax2.set_xlabel('')
         ax2.yaxis.tick_right()
 
+        # thin the curves again from the full data when zoomed
+        ax1.callbacks.connect('xlim_changed', self._redecimate)
+
         canvas = self.fig.canvas
         if canvas is not None:
             canvas.draw()
 
+    def _redecimate(self, ax):
+        x_min, x_max = ax.get_xlim()
+        nbuckets = ax.bbox.width * self.points_per_pixel
+        for line, curve in self._curves:
+            line.set_data(*curve.get(nbuckets, x_min=x_min, x_max=x_max))
+
 if __name__ == '__main__':
     import sys
     from obsplan import entity
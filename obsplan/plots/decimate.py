@@ -0,0 +1,86 @@
+#
+# decimate.py -- thin out curves for plotting
+#
+#  Eric Jeschke (eric@naoj.org)
+#
+# A curve with many more samples than the plot has pixels across is cut
+# into buckets of equal width in x (about one per pixel), and only the
+# first, last, lowest and highest sample of each bucket is kept.  The
+# plotted line then covers exactly the same pixels as the full one,
+# including the extremes (e.g. the best airmass of a target).  Samples
+# either side of where the curve crosses any of a set of thresholds are
+# kept as well, so crossings are drawn where they happen.
+#
+# 3rd party imports
+import numpy
+
+
+def decimate(x, y, nbuckets, thresholds=()):
+    """
+    Returns the sorted indices of the samples of the curve `x`, `y`
+    (arrays, `x` ascending) to plot it `nbuckets` pixels wide.
+    """
+    n = len(x)
+    if n <= 4 * nbuckets:
+        return numpy.arange(n)
+    x0, x1 = x[0], x[-1]
+    if x1 <= x0:
+        return numpy.arange(n)
+    bucket = ((x - x0) * (nbuckets / (x1 - x0))).astype(numpy.int64)
+    bucket = numpy.minimum(bucket, nbuckets - 1)
+    # NaNs (e.g. gaps) are kept out of the extremes and sort last
+    yy = numpy.where(numpy.isnan(y), numpy.inf, y)
+    order = numpy.lexsort((yy, bucket))
+    starts = numpy.nonzero(numpy.diff(bucket[order]))[0] + 1
+    first = numpy.concatenate(([0], starts))
+    last = numpy.concatenate((starts - 1, [n - 1]))
+    # lowest and highest finite value of each bucket
+    lo = order[first]
+    hi = order[last]
+    fin = numpy.isfinite(yy[order])
+    n_fin = numpy.add.reduceat(fin.astype(numpy.int64), first)
+    hi = numpy.where(n_fin > 0, order[first + numpy.maximum(n_fin - 1, 0)],
+                     hi)
+    # the edges of each bucket, for the line between buckets
+    edges = numpy.nonzero(numpy.diff(bucket))[0]
+    keep = [lo, hi, edges, edges + 1, [0, n - 1]]
+
+    for val in thresholds:
+        above = y > val
+        cross = numpy.nonzero(above[1:] != above[:-1])[0]
+        keep.extend([cross, cross + 1])
+    # a gap must not be bridged
+    nan = numpy.nonzero(numpy.isnan(y))[0]
+    keep.append(nan)
+    return numpy.unique(numpy.concatenate(keep).astype(numpy.int64))
+
+
+class DecimatedCurve(object):
+    """
+    Keeps the full samples of a curve `x`, `y` and gives decimated
+    versions of the part of it within a range of x.
+    """
+    def __init__(self, x, y, thresholds=()):
+        super(DecimatedCurve, self).__init__()
+        self.x = numpy.asarray(x, dtype=numpy.float64)
+        self.y = numpy.asarray(y, dtype=numpy.float64)
+        self.thresholds = thresholds
+
+    def get(self, nbuckets, x_min=None, x_max=None):
+        """
+        Returns arrays (x, y) of the samples to plot between `x_min`
+        and `x_max` (default: all) across `nbuckets` pixels.  A sample
+        beyond each end is included, so the line runs to the edges.
+        """
+        i1, i2 = 0, len(self.x)
+        if x_min is not None:
+            i1 = max(int(numpy.searchsorted(self.x, x_min)) - 1, 0)
+        if x_max is not None:
+            i2 = min(int(numpy.searchsorted(self.x, x_max, side='right')) + 1,
+                     len(self.x))
+        x, y = self.x[i1:i2], self.y[i1:i2]
+        idx = decimate(x, y, max(int(nbuckets), 1),
+                       thresholds=self.thresholds)
+        return x[idx], y[idx]
+
+#END
@@ -1,8 +1,18 @@
 import math
 from datetime import datetime
+import multiprocessing
 
+import numpy
 import matplotlib
 from matplotlib import rc, figure
+import matplotlib.image
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+try:
+    from PIL import Image
+    have_pil = True
+except ImportError:
+    have_pil = False
 
 
 class AZELPlot(object):
@@ -78,13 +88,13 @@ class AZELPlot(object):
         # add compass annotations
         ## for az, d in ((0.0, 'S'), (90.0, 'W'), (180.0, 'N'), (270.0, 'E')):
         ##     ax.annotate(d, xy=self.map_azalt(az, 0.0), textcoords='data')
-        ax.annotate('W', (1.08, 0.5), textcoords='axes fraction',
+        ax.annotate('W', (1.08, 0.5), xycoords='axes fraction',
                     fontsize=16)
-        ax.annotate('E', (-0.1, 0.5), textcoords='axes fraction',
+        ax.annotate('E', (-0.1, 0.5), xycoords='axes fraction',
                     fontsize=16)
-        ax.annotate('N', (0.5, 1.08), textcoords='axes fraction',
+        ax.annotate('N', (0.5, 1.08), xycoords='axes fraction',
                     fontsize=16)
-        ax.annotate('S', (0.5, -0.08), textcoords='axes fraction',
+        ax.annotate('S', (0.5, -0.08), xycoords='axes fraction',
                     fontsize=16)
 
     def redraw(self):
@@ -144,6 +154,170 @@ class AZELPlot(object):
             i = (i+1) % len(colors)
         self.redraw()
 
+
+class AZELFrames(AZELPlot):
+    """
+    Renders a sequence of frames of targets moving across the sky.
+
+    The polar axes, grid and annotations are drawn once and kept as a
+    background image; for each frame only the target points, labels
+    and time stamp are updated from the alt/az arrays and drawn over it.
+    """
+
+    def setup(self):
+        ax = self.fig.add_axes([0.1, 0.1, 0.8, 0.8], projection='polar')
+        ax.set_facecolor('#d5de9c')
+        self.ax = ax
+        self.orient_plot()
+        # keep the radial range when the artists are added
+        ax.set_autoscale_on(False)
+        self.canvas = FigureCanvasAgg(self.fig)
+
+        self.points = None
+        self.labels = []
+        self.stamp = ax.text(0.0, 1.02, '', transform=ax.transAxes,
+                             fontsize=12, animated=True)
+        self.background = None
+
+    def set_data(self, names, az_deg, alt_deg, stamps=None, colors=None):
+        """
+        Set the targets to be shown: `names` of N targets, arrays of
+        shape (N, T) of `az_deg`, `alt_deg` (degrees) for T frames, and
+        optionally a label for each frame in `stamps`.
+        """
+        if colors is None:
+            colors = self.colors
+        self.names = list(names)
+        theta = numpy.radians(numpy.asarray(az_deg) - 180.0)
+        r = 90.0 - numpy.asarray(alt_deg)
+        # targets below the horizon are not shown
+        r = numpy.where(r <= 90.0, r, numpy.nan)
+        self.theta, self.r = theta, r
+        self.stamps = stamps
+
+        n = len(self.names)
+        colors = [colors[i % len(colors)] for i in range(n)]
+        if self.points is not None:
+            self.points.remove()
+        for label in self.labels:
+            label.remove()
+        self.points = self.ax.scatter(numpy.zeros(n), numpy.zeros(n),
+                                      color=colors, animated=True)
+        self.labels = [self.ax.text(0.0, 0.0, name, animated=True)
+                       for name in self.names]
+        self.background = None
+
+    def __len__(self):
+        return self.r.shape[1]
+
+    def update(self, i):
+        """Update the artists for frame `i`."""
+        theta, r = self.theta[:, i], self.r[:, i]
+        self.points.set_offsets(numpy.array([theta, r]).T)
+        for label, th, rr in zip(self.labels, theta, r):
+            up = not numpy.isnan(rr)
+            label.set_visible(up)
+            if up:
+                label.set_position((th, rr))
+        if self.stamps is not None:
+            self.stamp.set_text(self.stamps[i])
+
+    def render(self, i):
+        """Draw frame `i`, returning it as an RGBA array."""
+        canvas = self.canvas
+        if self.background is None:
+            # the animated artists are left out of a full draw
+            canvas.draw()
+            self.background = canvas.copy_from_bbox(self.fig.bbox)
+        canvas.restore_region(self.background)
+        self.update(i)
+        self.ax.draw_artist(self.points)
+        for label in self.labels:
+            self.ax.draw_artist(label)
+        self.ax.draw_artist(self.stamp)
+        width, height = canvas.get_width_height()
+        buf = numpy.frombuffer(canvas.buffer_rgba(), dtype=numpy.uint8)
+        return buf.reshape((height, width, 4))
+
+    def write_frame(self, i, outfile):
+        buf = self.render(i)
+        if have_pil:
+            # fast compression: frames are many and short-lived
+            height, width = buf.shape[:2]
+            img = Image.frombuffer('RGBA', (width, height), buf.tobytes(),
+                                   'raw', 'RGBA', 0, 1)
+            img.save(outfile, compress_level=1)
+        else:
+            matplotlib.image.imsave(outfile, buf)
+
+
+def _render_frames(args):
+    # worker for render_frames(): renders a chunk of the frames
+    (width, height, dpi, names, az_deg, alt_deg, stamps, colors, pattern,
+     start) = args
+    plot = AZELFrames(width, height, dpi=dpi)
+    plot.setup()
+    plot.set_data(names, az_deg, alt_deg, stamps=stamps, colors=colors)
+    outfiles = []
+    for i in range(len(plot)):
+        outfile = pattern % (start + i)
+        plot.write_frame(i, outfile)
+        outfiles.append(outfile)
+    return outfiles
+
+def render_frames(names, az_deg, alt_deg, pattern, stamps=None, colors=None,
+                  width=8, height=8, dpi=96, num_procs=None):
+    """
+    Write the frames of an all-sky animation of N targets to files
+    named by `pattern` (e.g. "frame_%04d.png").  `az_deg` and `alt_deg`
+    are arrays of shape (N, T) for T frames.  The frames are split in
+    chunks among `num_procs` processes (all CPUs by default; 1 renders
+    in this process).  Returns the list of files written.
+    """
+    az_deg, alt_deg = numpy.asarray(az_deg), numpy.asarray(alt_deg)
+    nframes = alt_deg.shape[1]
+    if num_procs is None:
+        num_procs = multiprocessing.cpu_count()
+    num_procs = max(1, min(num_procs, nframes))
+    edges = numpy.linspace(0, nframes, num_procs + 1).astype(int)
+    jobs = []
+    for i0, i1 in zip(edges[:-1], edges[1:]):
+        chunk_stamps = None if stamps is None else list(stamps[i0:i1])
+        jobs.append((width, height, dpi, names, az_deg[:, i0:i1],
+                     alt_deg[:, i0:i1], chunk_stamps, colors, pattern, i0))
+    if num_procs == 1:
+        results = [_render_frames(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(num_procs)
+        try:
+            results = pool.map(_render_frames, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    return [outfile for outfiles in results for outfile in outfiles]
+
+def render_tracks(tracks, pattern, tz=None, **kwdargs):
+    """
+    Like render_frames(), from a list of TargetTracks (single target or
+    catalog tracks) sharing one TimeGrid.  Frames are stamped with the
+    sample times in timezone `tz` (the grid's local timezone by
+    default).
+    """
+    names, az, alt = [], [], []
+    for trk in tracks:
+        if isinstance(trk.target, list):
+            names.extend([tgt.name for tgt in trk.target])
+            az.append(trk.az_deg)
+            alt.append(trk.alt_deg)
+        else:
+            names.append(trk.target.name)
+            az.append(trk.az_deg[numpy.newaxis, :])
+            alt.append(trk.alt_deg[numpy.newaxis, :])
+    grid = tracks[0].grid
+    stamps = [dt.strftime("%Y-%m-%d %H:%M") for dt in grid.datetimes(tz)]
+    return render_frames(names, numpy.concatenate(az), numpy.concatenate(alt),
+                         pattern, stamps=stamps, **kwdargs)
+
 if __name__ == '__main__':
     from obsplan import entity
     import pytz
@@ -0,0 +1,243 @@
+#
+# schedule.py -- night plans that can be repaired in place
+#
+#  Eric Jeschke (eric@naoj.org)
+#
+# A NightPlan is an ordered list of observations laid out on the time
+# slots of a night: each starts at the first slot after the previous
+# one ends (plus the slew between them) from which its target stays
+# within the constraints, and the dome is open, for its whole duration.
+#
+# The visibility and positions of each target over the slots are
+# calculated once and cached, so that inserting or removing an
+# observation, or closing the dome for a while, only lays out the
+# observations from the change onwards, and stops as soon as one of
+# them ends up where it was: everything after it is unchanged.
+#
+import math
+
+# 3rd party imports
+import numpy
+
+# local imports
+from obsplan import misc, timegrid
+from obsplan.timegrid import TimeGrid
+
+
+class Observation(object):
+    """
+    An observation of `target` lasting `duration` seconds.  Once laid
+    out, it occupies slots `start_slot` to `stop_slot` (exclusive) of
+    its plan, after a slew of `slew` seconds; `start_slot` is None if it
+    does not fit in the night.
+    """
+    def __init__(self, target, duration):
+        super(Observation, self).__init__()
+        self.target = target
+        self.duration = duration
+        self.start_slot = None
+        self.stop_slot = None
+        self.slew = 0.0
+
+    @property
+    def scheduled(self):
+        return self.start_slot is not None
+
+
+class _Visibility(object):
+    # a target's usable slots and positions (deg) at the slot times
+
+    def __init__(self, target, up, alt_deg, az_deg):
+        self.target = target
+        self.up = up
+        self.alt_deg = alt_deg
+        self.az_deg = az_deg
+        # first usable slots for each length, for the current version of
+        # the dome closures
+        self.starts = {}
+        self.version = None
+
+
+class NightPlan(object):
+    """
+    A plan for `observer` on the slots of `slot_minutes` between the
+    times of Constraints `cts`, whose limits (but not duration) apply to
+    every observation.  Slews take the time given by
+    misc.calc_slew_time for rates `rate_az`, `rate_el` (deg/sec).
+    """
+    def __init__(self, observer, cts, slot_minutes=1.0, rate_az=0.5,
+                 rate_el=0.5):
+        super(NightPlan, self).__init__()
+        self.observer = observer
+        self.cts = cts
+        self.slot_minutes = slot_minutes
+        self.rate_az = rate_az
+        self.rate_el = rate_el
+        self.grid = TimeGrid.from_range(cts.time_start, cts.time_stop,
+                                        slot_minutes)
+        self.nslots = len(self.grid)
+        self.blocked = numpy.zeros(self.nslots, dtype=bool)
+        self._block_version = 0
+        self.observations = []
+        self._vis = {}
+        # number of observations laid out, for tuning
+        self.layouts = 0
+
+    def _visibility(self, target):
+        key = id(target)
+        vis = self._vis.get(key, None)
+        if vis is not None and vis.target is target:
+            return vis
+        cts = self.cts
+        mjd = self.grid.mjd
+        slot = self.slot_minutes / 1440.0
+        windows = self.observer.window_cache.get_windows(
+            target, mjd[0], mjd[-1] + slot, el_min_deg=cts.el_min_deg,
+            el_max_deg=cts.el_max_deg, airmass=cts.airmass)
+        up = numpy.zeros(self.nslots, dtype=bool)
+        for t1, t2 in windows:
+            up |= (mjd >= t1) & (mjd + slot <= t2)
+        trk = self.observer.get_target_track(target, self.grid)
+        vis = _Visibility(target, up, trk.alt_deg, trk.az_deg)
+        self._vis[key] = vis
+        return vis
+
+    def _first_start(self, vis, nslots, slot_min):
+        # first slot from `slot_min` at which `nslots` usable slots
+        # follow, or None
+        if vis.version != self._block_version:
+            vis.starts = {}
+            vis.version = self._block_version
+        starts = vis.starts.get(nslots, None)
+        if starts is None:
+            ok = vis.up & ~self.blocked
+            count = numpy.concatenate(([0], numpy.cumsum(ok)))
+            starts = numpy.nonzero(count[nslots:] - count[:-nslots] ==
+                                   nslots)[0]
+            vis.starts[nslots] = starts
+        i = numpy.searchsorted(starts, slot_min)
+        if i >= len(starts):
+            return None
+        return int(starts[i])
+
+    def _slew_time(self, prev_vis, prev_slot, vis, slot):
+        d_az = (vis.az_deg[slot] - prev_vis.az_deg[prev_slot] +
+                180.0) % 360.0 - 180.0
+        d_el = vis.alt_deg[slot] - prev_vis.alt_deg[prev_slot]
+        return float(misc.calc_slew_time(d_az, d_el, rate_az=self.rate_az,
+                                         rate_el=self.rate_el))
+
+    def _layout(self, obs, prev):
+        # place `obs` after `prev` (the last scheduled observation
+        # before it, or None); returns True if it moved
+        self.layouts += 1
+        old = (obs.start_slot, obs.slew)
+        vis = self._visibility(obs.target)
+        slot_sec = self.slot_minutes * 60.0
+        nslots = max(int(math.ceil(obs.duration / slot_sec - 1.0e-9)), 1)
+        slot0 = 0 if prev is None else prev.stop_slot
+        slew = 0.0
+        slot = self._first_start(vis, nslots, slot0)
+        # the slew depends on where the target is when we get there
+        for i in range(5):
+            if slot is None or prev is None:
+                break
+            slew = self._slew_time(self._visibility(prev.target),
+                                   prev.stop_slot - 1, vis, slot)
+            ready = slot0 + int(math.ceil(slew / slot_sec - 1.0e-9))
+            if ready <= slot:
+                break
+            slot = self._first_start(vis, nslots, ready)
+        if slot is None:
+            obs.start_slot = obs.stop_slot = None
+            obs.slew = 0.0
+        else:
+            obs.start_slot, obs.stop_slot = slot, slot + nslots
+            obs.slew = slew
+        return (obs.start_slot, obs.slew) != old
+
+    def _repair(self, idx, slot_end=-1):
+        # lay out the observations from `idx` on, until one that stays
+        # put after the changed slots (up to `slot_end`)
+        prev = None
+        for obs in self.observations[:idx]:
+            if obs.scheduled:
+                prev = obs
+        for obs in self.observations[idx:]:
+            moved = self._layout(obs, prev)
+            if obs.scheduled:
+                if not moved and obs.stop_slot > slot_end:
+                    break
+                prev = obs
+
+    def insert(self, idx, target, duration):
+        """
+        Insert an observation of `target` for `duration` seconds at
+        position `idx` of the plan.  Returns the Observation.
+        """
+        obs = Observation(target, duration)
+        self.observations.insert(idx, obs)
+        self._repair(self.observations.index(obs))
+        return obs
+
+    def append(self, target, duration):
+        return self.insert(len(self.observations), target, duration)
+
+    def remove(self, idx):
+        """Remove the observation at position `idx` of the plan."""
+        # the repair needs the position counted from the start
+        idx = range(len(self.observations))[idx]
+        obs = self.observations.pop(idx)
+        self._repair(idx)
+        return obs
+
+    def _slots(self, time_start, time_stop):
+        mjd1 = timegrid.datetime2mjd(time_start)
+        mjd2 = timegrid.datetime2mjd(time_stop)
+        slot = self.slot_minutes / 1440.0
+        # the slots overlapping the period (by more than rounding)
+        eps = 1.0e-8
+        s1 = int(numpy.searchsorted(self.grid.mjd + slot - eps, mjd1,
+                                    side='right'))
+        s2 = int(numpy.searchsorted(self.grid.mjd + eps, mjd2, side='left'))
+        return s1, s2
+
+    def _set_blocked(self, time_start, time_stop, value):
+        s1, s2 = self._slots(time_start, time_stop)
+        if s1 >= s2:
+            return
+        self.blocked[s1:s2] = value
+        self._block_version += 1
+        # observations whose layout looked at the changed slots
+        for i, obs in enumerate(self.observations):
+            if not obs.scheduled or obs.stop_slot > s1:
+                self._repair(i, slot_end=s2)
+                break
+
+    def block(self, time_start, time_stop):
+        """
+        Close the dome between datetimes `time_start` and `time_stop`:
+        the slots overlapping that period are no longer used.
+        """
+        self._set_blocked(time_start, time_stop, True)
+
+    def unblock(self, time_start, time_stop):
+        """Open the dome again between `time_start` and `time_stop`."""
+        self._set_blocked(time_start, time_stop, False)
+
+    def get_schedule(self):
+        """
+        Returns a list of (target, start, stop) UTC datetimes of the
+        observations that fit, in order.
+        """
+        dts = self.grid.datetimes()
+        slot = self.slot_minutes / 1440.0
+        res = []
+        for obs in self.observations:
+            if obs.scheduled:
+                stop = TimeGrid([self.grid.mjd[obs.stop_slot - 1] + slot])
+                res.append((obs.target, dts[obs.start_slot],
+                            stop.datetimes()[0]))
+        return res
+
+#END
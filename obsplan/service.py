@@ -0,0 +1,336 @@
+#
+# service.py -- asyncio front end for observation planning queries
+#
+#  Eric Jeschke (eric@naoj.org)
+#
+# NOTE: this module requires Python 3 (asyncio).
+#
+# Queries are answered by running the usual Observer/Constraints
+# calculations in an executor.  Identical queries that arrive while one
+# is already being computed share its result instead of recomputing it.
+#
+# A minimal HTTP front end is provided, e.g.:
+#
+#   GET /target_info?site=subaru&name=vega&ra=18:36:56.3&dec=+38:47:01
+#       &start=2014-04-28+19:00&format=binary
+#   GET /observable?site=subaru&ra=...&dec=...&start=...&stop=...
+#       &el_min=15&el_max=85&duration=1800
+#   GET /almanac?site=subaru&date=2014-04-28
+#
+import asyncio
+import concurrent.futures
+import json
+import struct
+import threading
+from urllib.parse import urlsplit, parse_qsl
+
+# 3rd party imports
+import numpy
+
+# local imports
+from obsplan import entity, timegrid
+
+
+class ServiceError(Exception):
+    pass
+
+
+# Work functions.  These are run in the executor, so they are module
+# level (picklable for process pools).  They use the site's observer
+# itself, so that its site pool and window cache serve every query; in
+# a thread pool they run with the site's lock held, because the
+# calculations mutate the observer's site date and caches.
+
+def calc_target_info(observer, target, time_start=None, time_stop=None,
+                     time_interval=5):
+    """
+    Returns a dict of arrays of values for `target` over the night.
+    """
+    history = observer.get_target_info(target, time_start=time_start,
+                                       time_stop=time_stop,
+                                       time_interval=time_interval,
+                                       compact=True)
+    fields = ('mjd', 'alt', 'az', 'airmass', 'pang', 'moon_alt', 'moon_sep')
+    res = dict([(name, numpy.empty(len(history))) for name in fields])
+    for i, info in enumerate(history):
+        res['mjd'][i] = info.djd - timegrid.DJD_MJD_OFFSET
+        res['alt'][i] = info.alt
+        res['az'][i] = info.az
+        res['airmass'][i] = info.airmass
+        res['pang'][i] = info.pang
+        res['moon_alt'][i] = info.moon_alt
+        res['moon_sep'][i] = info.moon_sep
+    return res
+
+def calc_observable(observer, target, constraints):
+    """
+    Returns a dict describing whether `target` is observable under
+    `constraints`.
+    """
+    res = observer.observable(target, constraints)
+    return dict(observable=bool(res.observable),
+                time_rise=_isoformat(res.time_rise),
+                time_set=_isoformat(res.time_set))
+
+def calc_almanac(observer, date):
+    """
+    Returns a dict of the sun and moon rise/set times for the night of
+    `date`.
+    """
+    keys = ('sunset', 'twilight_12_evening', 'twilight_18_evening',
+            'twilight_18_morning', 'twilight_12_morning', 'sunrise')
+    res = dict(zip(keys, map(_isoformat, observer.sun_set_rise_times(date))))
+    res['moon_rise'] = _isoformat(observer.moon_rise(date))
+    res['moon_set'] = _isoformat(observer.moon_set(date))
+    res['moon_pct'] = float(observer.moon_phase(date))
+    return res
+
+def _call_locked(lock, func, *args):
+    with lock:
+        return func(*args)
+
+def _isoformat(dt):
+    if dt is None:
+        return None
+    return dt.isoformat()
+
+
+# Serialization
+
+def encode_json(res):
+    """Serialize a query result as compact JSON."""
+    def _default(obj):
+        if isinstance(obj, numpy.ndarray):
+            return obj.tolist()
+        raise TypeError("can't serialize %s" % type(obj))
+    return json.dumps(res, separators=(',', ':'),
+                      default=_default).encode('utf-8')
+
+def encode_binary(res):
+    """
+    Serialize a query result as a binary message: a 4-byte big-endian
+    header length, a JSON header and the concatenated little-endian
+    float64 arrays listed in the header.  Non-array values are carried
+    in the header.
+    """
+    arrays = sorted([key for key, val in res.items()
+                     if isinstance(val, numpy.ndarray)])
+    header = dict(fields=arrays, dtype='<f8',
+                  length=(len(res[arrays[0]]) if arrays else 0),
+                  values=dict([(key, val) for key, val in res.items()
+                               if key not in arrays]))
+    header = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    data = [numpy.ascontiguousarray(res[key], dtype='<f8').tobytes()
+            for key in arrays]
+    return struct.pack('>I', len(header)) + header + b''.join(data)
+
+def decode_binary(buf):
+    """Inverse of encode_binary()."""
+    (hlen,) = struct.unpack('>I', buf[:4])
+    header = json.loads(buf[4:4+hlen].decode('utf-8'))
+    res = dict(header['values'])
+    length, offset = header['length'], 4 + hlen
+    for key in header['fields']:
+        res[key] = numpy.frombuffer(buf, dtype=header['dtype'],
+                                    count=length, offset=offset)
+        offset += length * 8
+    return res
+
+
+class PlanningService(object):
+    """
+    Answers planning queries for a set of observers, offloading the
+    calculations to `executor` (a thread pool by default).  Identical
+    queries in flight at the same time are coalesced into one
+    calculation.
+    """
+    def __init__(self, observers, executor=None):
+        super(PlanningService, self).__init__()
+        if isinstance(observers, entity.Observer):
+            observers = [observers]
+        self.observers = dict([(obs.name, obs) for obs in observers])
+        # serializes the calculations for each site
+        self._locks = dict([(name, threading.Lock())
+                            for name in self.observers])
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor()
+        self.executor = executor
+
+        # futures of the calculations in flight, keyed by query
+        self._inflight = {}
+        self.stats = dict(computed=0, coalesced=0)
+
+    def get_observer(self, name):
+        try:
+            return self.observers[name]
+        except KeyError:
+            raise ServiceError("no such site: '%s'" % (name))
+
+    async def _submit(self, key, func, site, *args):
+        fut = self._inflight.get(key, None)
+        if fut is not None:
+            self.stats['coalesced'] += 1
+            # shield, so that a cancelled client doesn't cancel the
+            # calculation for everyone else waiting on it
+            return await asyncio.shield(fut)
+
+        loop = asyncio.get_running_loop()
+        observer = self.get_observer(site)
+        if isinstance(self.executor, concurrent.futures.ProcessPoolExecutor):
+            # each call gets its own pickled copy of the observer
+            fut = loop.run_in_executor(self.executor, func, observer, *args)
+        else:
+            fut = loop.run_in_executor(self.executor, _call_locked,
+                                       self._locks[site], func, observer,
+                                       *args)
+        self._inflight[key] = fut
+        self.stats['computed'] += 1
+        try:
+            return await asyncio.shield(fut)
+        finally:
+            if self._inflight.get(key, None) is fut:
+                del self._inflight[key]
+
+    def _target_key(self, target):
+        return (target.name, str(target.ra), str(target.dec),
+                str(target.equinox))
+
+    async def target_info(self, site, target, time_start=None,
+                          time_stop=None, time_interval=5):
+        key = ('target_info', site, self._target_key(target),
+               _isoformat(time_start), _isoformat(time_stop), time_interval)
+        return await self._submit(key, calc_target_info, site, target,
+                                  time_start, time_stop, time_interval)
+
+    async def observable(self, site, target, constraints):
+        cts = constraints
+        key = ('observable', site, self._target_key(target),
+               _isoformat(cts.time_start), _isoformat(cts.time_stop),
+               cts.el_min_deg, cts.el_max_deg, cts.duration, cts.airmass)
+        return await self._submit(key, calc_observable, site, target,
+                                  constraints)
+
+    async def almanac(self, site, date):
+        key = ('almanac', site, _isoformat(date))
+        return await self._submit(key, calc_almanac, site, date)
+
+    # HTTP front end
+
+    async def query(self, path, params):
+        """
+        Answer a query for `path` with parameters `params` (a dict of
+        strings, as decoded from a URL query string).
+        """
+        site = params.get('site', None)
+        if site is None:
+            if len(self.observers) != 1:
+                raise ServiceError("please specify a site")
+            site = list(self.observers.keys())[0]
+        observer = self.get_observer(site)
+
+        def _date(name):
+            val = params.get(name, None)
+            if val is None:
+                return None
+            try:
+                return observer.get_date(val)
+            except Exception:
+                raise ServiceError("bad date for %s: '%s'" % (name, val))
+
+        def _target():
+            try:
+                return entity.SiderealTarget(name=params.get('name', 'target'),
+                                             ra=params['ra'],
+                                             dec=params['dec'],
+                                             equinox=params.get('equinox',
+                                                                2000.0))
+            except KeyError as e:
+                raise ServiceError("missing parameter: %s" % (str(e)))
+
+        try:
+            if path == '/target_info':
+                return await self.target_info(
+                    site, _target(), time_start=_date('start'),
+                    time_stop=_date('stop'),
+                    time_interval=int(params.get('interval', 5)))
+
+            elif path == '/observable':
+                airmass = params.get('airmass', None)
+                if airmass is not None:
+                    airmass = float(airmass)
+                time_start, time_stop = _date('start'), _date('stop')
+                if time_start is None or time_stop is None:
+                    raise ServiceError("please specify start and stop")
+                cts = entity.Constraints(
+                    time_start=time_start, time_stop=time_stop,
+                    el_min_deg=float(params.get('el_min', 15.0)),
+                    el_max_deg=float(params.get('el_max', 89.0)),
+                    duration=float(params['duration']), airmass=airmass)
+                return await self.observable(site, _target(), cts)
+
+            elif path == '/almanac':
+                return await self.almanac(site, _date('date'))
+
+        except (KeyError, ValueError) as e:
+            raise ServiceError("bad parameter: %s" % (str(e)))
+
+        raise ServiceError("no such query: '%s'" % (path))
+
+    async def handle_http(self, reader, writer):
+        try:
+            line = await reader.readline()
+            # skip the rest of the request headers
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            try:
+                method, url = line.decode('latin-1').split()[:2]
+                url = urlsplit(url)
+                params = dict(parse_qsl(url.query))
+                fmt = params.pop('format', 'json')
+                res = await self.query(url.path, params)
+                if fmt == 'binary':
+                    ctype, body = 'application/octet-stream', encode_binary(res)
+                else:
+                    ctype, body = 'application/json', encode_json(res)
+                status = '200 OK'
+
+            except (ServiceError, ValueError) as e:
+                status, ctype = '400 Bad Request', 'application/json'
+                body = encode_json(dict(error=str(e)))
+
+            except Exception as e:
+                status, ctype = '500 Internal Server Error', 'application/json'
+                body = encode_json(dict(error=str(e)))
+
+            header = ('HTTP/1.0 %s\r\nContent-Type: %s\r\n'
+                      'Content-Length: %d\r\n\r\n') % (status, ctype, len(body))
+            writer.write(header.encode('latin-1') + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host='localhost', port=8080):
+        """Run the HTTP front end until cancelled."""
+        server = await asyncio.start_server(self.handle_http, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    import sys
+
+    port = 8080
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
+
+    site = entity.Observer('subaru',
+                           longitude='-155:28:48.900',
+                           latitude='+19:49:42.600',
+                           elevation=4163,
+                           pressure=615,
+                           temperature=0,
+                           timezone='US/Hawaii')
+    svc = PlanningService([site])
+    asyncio.run(svc.serve(port=port))
+
+#END
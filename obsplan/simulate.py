@@ -0,0 +1,280 @@
+#
+# simulate.py -- Monte Carlo simulation of observing runs
+#
+#  Eric Jeschke (eric@naoj.org)
+#
+# The catalog's visibility on every night of a run is calculated once,
+# as arrays over time slots between the 18 degree twilights (see
+# Observer.get_almanac and Observer.get_catalog_track).  A simulated run
+# then only draws the weather for each night and steps a scheduling
+# policy through the slots, so many runs are cheap.  Runs are farmed out
+# to worker processes, which receive the precomputed data once; each run
+# draws its random numbers from a generator seeded with (seed, run), so
+# the results do not depend on how the runs are split among processes.
+#
+import math
+import multiprocessing
+
+# 3rd party imports
+import numpy
+
+# local imports
+from obsplan import crossing
+from obsplan.timegrid import TimeGrid
+
+
+class Weather(object):
+    """
+    A simple stochastic weather model.  A night is lost entirely with
+    probability `p_lost`; otherwise the dome closes a Poisson number of
+    times (`closures` per night on average) for exponentially
+    distributed periods (`closure_hours` on average).  Seeing (arcsec
+    at the zenith) is lognormal around `seeing_median`, with a scatter
+    of `seeing_sigma` (in ln) and a correlation time of `seeing_hours`.
+    """
+    def __init__(self, p_lost=0.2, closures=0.5, closure_hours=1.0,
+                 seeing_median=0.7, seeing_sigma=0.3, seeing_hours=1.0):
+        super(Weather, self).__init__()
+        self.p_lost = p_lost
+        self.closures = closures
+        self.closure_hours = closure_hours
+        self.seeing_median = seeing_median
+        self.seeing_sigma = seeing_sigma
+        self.seeing_hours = seeing_hours
+
+    def sample(self, rng, nslots, slot_minutes):
+        """
+        Draw a night of `nslots` slots from random generator `rng`.
+        Returns arrays (dome_open, seeing) with a value per slot.
+        """
+        dome_open = numpy.ones(nslots, dtype=bool)
+        if rng.uniform() < self.p_lost:
+            dome_open[:] = False
+        else:
+            for i in range(rng.poisson(self.closures)):
+                start = rng.randint(nslots)
+                length = rng.exponential(self.closure_hours * 60.0 /
+                                         slot_minutes)
+                dome_open[start:start + int(math.ceil(length))] = False
+
+        # AR(1) process in ln(seeing)
+        phi = math.exp(-slot_minutes / (self.seeing_hours * 60.0))
+        noise = rng.standard_normal(nslots) * self.seeing_sigma
+        ln_s = numpy.empty(nslots)
+        val = noise[0]
+        scale = math.sqrt(1.0 - phi * phi)
+        for i in range(nslots):
+            if i > 0:
+                val = phi * val + scale * noise[i]
+            ln_s[i] = val
+        return dome_open, self.seeing_median * numpy.exp(ln_s)
+
+
+class PriorityPolicy(object):
+    """
+    Observe the candidate with the highest priority, and of those the
+    one with the least time left before it sets (so that targets are
+    caught before they are lost).
+    """
+    def select(self, sim, candidates, slot):
+        prio = sim.priorities[candidates]
+        best = candidates[prio == prio.max()]
+        return best[numpy.argmin(sim.time_left[best, slot])]
+
+
+class SimulationResult(object):
+    """
+    Outcomes of the runs of a Simulation: `completed` (runs x targets,
+    bool), and per run the hours `open_hours` with the dome open,
+    `used_hours` spent on completed observations and `lost_hours` on
+    ones interrupted by the weather.
+    """
+    def __init__(self, sim, completed, open_hours, used_hours, lost_hours):
+        super(SimulationResult, self).__init__()
+        self.sim = sim
+        self.completed = completed
+        self.open_hours = open_hours
+        self.used_hours = used_hours
+        self.lost_hours = lost_hours
+
+    @property
+    def completion(self):
+        """Fraction of runs in which each target was completed."""
+        return self.completed.mean(axis=0)
+
+    def summary(self):
+        """
+        Returns a dict of statistics over the runs: the mean, standard
+        deviation and 10/50/90 percentiles of the number of targets
+        completed, and the mean fraction of the open time used.
+        """
+        n = self.completed.sum(axis=1)
+        p10, p50, p90 = numpy.percentile(n, [10, 50, 90])
+        used = self.used_hours / numpy.maximum(self.open_hours, 1.0e-9)
+        return dict(runs=len(n), completed_mean=float(n.mean()),
+                    completed_std=float(n.std()), completed_p10=float(p10),
+                    completed_p50=float(p50), completed_p90=float(p90),
+                    efficiency=float(used.mean()))
+
+
+class Simulation(object):
+    """
+    Simulated runs observing sidereal `targets` at `observer` on the
+    nights starting on local dates `date_start` through `date_stop`.
+    Each target needs `durations` seconds (a value per target) in one
+    go, above `el_min_deg` (and below `airmass`), and with seeing at its
+    airmass no worse than `seeing_max` arcsec; higher `priorities` are
+    preferred by the default policy.  Time is divided in slots of
+    `slot_minutes`.
+    """
+    def __init__(self, observer, targets, durations, date_start, date_stop,
+                 priorities=None, seeing_max=None, el_min_deg=30.0,
+                 el_max_deg=89.0, airmass=None, slot_minutes=10.0):
+        super(Simulation, self).__init__()
+        self.targets = list(targets)
+        n = len(self.targets)
+        self.slot_minutes = slot_minutes
+        self.need = numpy.maximum(numpy.ceil(
+            numpy.asarray(durations, dtype=numpy.float64) /
+            (slot_minutes * 60.0) - 1.0e-9), 1).astype(numpy.int64)
+        self.need = numpy.broadcast_to(self.need, (n,)).copy()
+        if priorities is None:
+            priorities = numpy.zeros(n)
+        self.priorities = numpy.broadcast_to(
+            numpy.asarray(priorities, dtype=numpy.float64), (n,)).copy()
+        if seeing_max is None:
+            seeing_max = numpy.inf
+        self.seeing_max = numpy.broadcast_to(
+            numpy.asarray(seeing_max, dtype=numpy.float64), (n,)).copy()
+
+        # slots of every night, between the 18 degree twilights
+        alm = observer.get_almanac(date_start, date_stop)
+        slot = slot_minutes / 1440.0
+        mjd, self.nights = [], []
+        i0 = 0
+        for t1, t2 in zip(alm.twilight_18_evening, alm.twilight_18_morning):
+            if numpy.isnan(t1) or numpy.isnan(t2):
+                continue
+            t = numpy.arange(t1, t2 - slot + 1.0e-9, slot)
+            # (first slot, number of slots) of each night
+            self.nights.append((i0, len(t)))
+            mjd.append(t)
+            i0 += len(t)
+        if len(mjd) == 0:
+            raise ValueError("no night from %s to %s has both 18 degree "
+                             "twilights at %s" % (date_start, date_stop,
+                                                  observer))
+        self.grid = TimeGrid(numpy.concatenate(mjd))
+
+        # visibility of every target in every slot
+        trk = observer.get_catalog_track(self.targets, self.grid)
+        el_min_deg = crossing.fold_airmass(el_min_deg, airmass)
+        up = ((trk.alt >= math.radians(el_min_deg)) &
+              (trk.alt <= math.radians(el_max_deg)))
+        if observer.horizon_mask is not None:
+            up &= observer.horizon_mask.visible(trk.alt, trk.az)
+        self.airmass = trk.airmass.astype(numpy.float32)
+
+        # whether each target fits from each slot, and how many slots it
+        # stays up from there
+        self.fits = numpy.zeros(up.shape, dtype=bool)
+        self.time_left = numpy.zeros(up.shape, dtype=numpy.int32)
+        for i0, nslots in self.nights:
+            sl = slice(i0, i0 + nslots)
+            u = up[:, sl]
+            count = numpy.concatenate((numpy.zeros((n, 1), dtype=numpy.int64),
+                                       numpy.cumsum(u, axis=1)), axis=1)
+            end = numpy.minimum(numpy.arange(nslots)[numpy.newaxis, :] +
+                                self.need[:, numpy.newaxis], nslots)
+            got = (numpy.take_along_axis(count, end, axis=1) -
+                   count[:, :nslots])
+            self.fits[:, sl] = got == self.need[:, numpy.newaxis]
+            # run of up slots from each slot
+            left = numpy.zeros((n, nslots + 1), dtype=numpy.int32)
+            for j in range(nslots - 1, -1, -1):
+                left[:, j] = numpy.where(u[:, j], left[:, j + 1] + 1, 0)
+            self.time_left[:, sl] = left[:, :nslots]
+
+    def run_one(self, run, seed, weather, policy):
+        """
+        Simulate run number `run`.  Returns a tuple (completed, open,
+        used, lost) as for SimulationResult.
+        """
+        rng = numpy.random.RandomState([seed, run])
+        done = numpy.zeros(len(self.targets), dtype=bool)
+        hours = self.slot_minutes / 60.0
+        n_open = n_used = n_lost = 0
+        for i0, nslots in self.nights:
+            dome_open, seeing = weather.sample(rng, nslots, self.slot_minutes)
+            n_open += dome_open.sum()
+            j = 0
+            while j < nslots:
+                if not dome_open[j]:
+                    j += 1
+                    continue
+                s = i0 + j
+                # seeing scales as airmass ** 0.6
+                ok = (self.fits[:, s] & ~done &
+                      (seeing[j] * self.airmass[:, s] ** 0.6 <=
+                       self.seeing_max))
+                candidates = numpy.nonzero(ok)[0]
+                if len(candidates) == 0:
+                    j += 1
+                    continue
+                k = policy.select(self, candidates, s)
+                need = self.need[k]
+                closed = numpy.nonzero(~dome_open[j:j + need])[0]
+                if len(closed) > 0:
+                    # interrupted by the weather
+                    n_lost += closed[0]
+                    j += closed[0]
+                    continue
+                done[k] = True
+                n_used += need
+                j += need
+        return (done, n_open * hours, n_used * hours, n_lost * hours)
+
+    def run(self, nruns, seed=0, weather=None, policy=None, num_procs=None):
+        """
+        Simulate `nruns` runs with random `seed` in `num_procs` worker
+        processes (all CPUs by default; 1 runs them in this process).
+        `weather` defaults to Weather() and `policy` to
+        PriorityPolicy().  Returns a SimulationResult.
+        """
+        if weather is None:
+            weather = Weather()
+        if policy is None:
+            policy = PriorityPolicy()
+        if num_procs is None:
+            num_procs = multiprocessing.cpu_count()
+        num_procs = max(1, min(num_procs, nruns))
+        if num_procs == 1:
+            results = [self.run_one(i, seed, weather, policy)
+                       for i in range(nruns)]
+        else:
+            pool = multiprocessing.Pool(num_procs, initializer=_init_worker,
+                                        initargs=(self, weather, policy))
+            try:
+                results = pool.map(_run_worker,
+                                   [(i, seed) for i in range(nruns)])
+            finally:
+                pool.close()
+                pool.join()
+        done, open_h, used_h, lost_h = zip(*results)
+        return SimulationResult(self, numpy.array(done), numpy.array(open_h),
+                                numpy.array(used_h), numpy.array(lost_h))
+
+
+# the simulation of each worker process, sent once
+_worker = None
+
+def _init_worker(sim, weather, policy):
+    global _worker
+    _worker = (sim, weather, policy)
+
+def _run_worker(args):
+    run, seed = args
+    sim, weather, policy = _worker
+    return sim.run_one(run, seed, weather, policy)
+
+#END
@@ -0,0 +1,349 @@
+#
+# slew.py -- order targets to minimize telescope slewing
+#
+#  Eric Jeschke (eric@naoj.org)
+#
+# The targets' positions are taken from a catalog TargetTrack at the
+# times they would be observed, so the ordering follows the sky as the
+# night advances.  A tour is built nearest-neighbour first and improved
+# with 2-opt and or-opt moves on a slew time matrix; each round is
+# checked by simulating the tour with the telescope's azimuth cable
+# wrap, and kept only if it really is faster.
+#
+# 3rd party imports
+import numpy
+
+# local imports
+from obsplan import misc
+
+
+class SlewError(Exception):
+    pass
+
+
+def _argmin(values):
+    # NaN (unreachable) counts as +inf, where numpy.argmin would pick it
+    return int(numpy.argmin(numpy.where(numpy.isnan(values), numpy.inf,
+                                        values)))
+
+
+class SlewModel(object):
+    """
+    Slew times for a telescope moving at `rate_az`, `rate_el`
+    (deg/sec) whose (physical) azimuth is limited to the range
+    [`az_min`, `az_max`] by its cable wrap.  `settle` seconds are added
+    to every slew.
+    """
+    def __init__(self, rate_az=0.5, rate_el=0.5, az_min=-270.0, az_max=270.0,
+                 settle=0.0):
+        super(SlewModel, self).__init__()
+        self.rate_az = rate_az
+        self.rate_el = rate_el
+        self.az_min = az_min
+        self.az_max = az_max
+        self.settle = settle
+
+    def wrap(self, az_from, az_to):
+        """
+        Returns the physical azimuth(s) for sky azimuth(s) `az_to`
+        (degrees) that are reachable and closest to physical azimuth
+        `az_from`.
+        """
+        # every reachable turn of the cable wrap
+        k1 = int(numpy.floor((self.az_min - 360.0) / 360.0))
+        k2 = int(numpy.ceil(self.az_max / 360.0))
+        if numpy.ndim(az_to) == 0:
+            az_to = float(az_to) % 360.0
+            azs = [az_to + 360.0 * k for k in range(k1, k2 + 1)
+                   if self.az_min <= az_to + 360.0 * k <= self.az_max]
+            if len(azs) == 0:
+                return numpy.nan
+            return min(azs, key=lambda az: abs(az - az_from))
+
+        az_to = numpy.mod(az_to, 360.0)
+        best = numpy.full(numpy.shape(az_to), numpy.nan)
+        best_d = numpy.full(numpy.shape(az_to), numpy.inf)
+        for k in range(k1, k2 + 1):
+            az = az_to + 360.0 * k
+            d = numpy.abs(az - az_from)
+            ok = (az >= self.az_min) & (az <= self.az_max) & (d < best_d)
+            best = numpy.where(ok, az, best)
+            best_d = numpy.where(ok, d, best_d)
+        return best
+
+    def slew_time(self, az_from, el_from, az_to, el_to):
+        """
+        Slew time(s) from physical azimuth `az_from` to sky azimuth(s)
+        `az_to`, respecting the cable wrap.  Returns a tuple of
+        (seconds, physical azimuth at the end of the slew).  Azimuths
+        outside the cable wrap take forever to reach (inf seconds, and
+        a NaN physical azimuth).
+        """
+        az_phys = self.wrap(az_from, az_to)
+        secs = misc.calc_slew_time(az_phys - az_from,
+                                   numpy.asarray(el_to) - el_from,
+                                   rate_az=self.rate_az, rate_el=self.rate_el)
+        secs = numpy.where(numpy.isnan(secs), numpy.inf, secs + self.settle)
+        if numpy.ndim(secs) == 0:
+            secs = float(secs)
+        return (secs, az_phys)
+
+    def cost_matrix(self, az, el, physical=False):
+        """
+        Matrix of slew times between all pairs of positions `az`, `el`
+        (degrees).  For sky azimuths the slews take the short way round;
+        if `physical` is True, `az` are physical azimuths and are
+        slewed between directly, as the cable wrap has them.
+        """
+        d_az = numpy.abs(az[:, numpy.newaxis] - az[numpy.newaxis, :])
+        if not physical:
+            d_az = numpy.minimum(d_az % 360.0, 360.0 - d_az % 360.0)
+        d_el = el[:, numpy.newaxis] - el[numpy.newaxis, :]
+        cost = misc.calc_slew_time(d_az, d_el, rate_az=self.rate_az,
+                                   rate_el=self.rate_el) + self.settle
+        numpy.fill_diagonal(cost, 0.0)
+        return cost
+
+
+class SlewPlanner(object):
+    """
+    Orders the targets of catalog TargetTrack `track` (which should
+    cover the whole observing window) to minimize the time spent
+    slewing.  `durations` gives the time on each target (sec; a scalar
+    or an array).
+    """
+    def __init__(self, track, durations, model=None):
+        super(SlewPlanner, self).__init__()
+        self.track = track
+        self.n = len(track.target)
+        self.durations = numpy.broadcast_to(
+            numpy.asarray(durations, dtype=numpy.float64), (self.n,))
+        if model is None:
+            model = SlewModel()
+        self.model = model
+
+        self.mjd = track.grid.mjd
+        # unwrapped azimuths interpolate smoothly
+        self.az = numpy.degrees(numpy.unwrap(numpy.broadcast_to(
+            track.az, (self.n, len(self.mjd))), axis=1))
+        self.el = numpy.broadcast_to(track.alt_deg, self.az.shape)
+
+    def positions(self, mjd, idx=None):
+        """
+        Sky positions (az, el) in degrees of targets `idx` (all by
+        default) at time(s) `mjd`, which may be a scalar or an array
+        matching `idx`.
+        """
+        if idx is None:
+            idx = numpy.arange(self.n)
+        mjd = numpy.clip(mjd, self.mjd[0], self.mjd[-1])
+        k = numpy.clip(numpy.searchsorted(self.mjd, mjd), 1,
+                       len(self.mjd) - 1)
+        frac = (mjd - self.mjd[k - 1]) / (self.mjd[k] - self.mjd[k - 1])
+        az = self.az[idx, k - 1] * (1.0 - frac) + self.az[idx, k] * frac
+        el = self.el[idx, k - 1] * (1.0 - frac) + self.el[idx, k] * frac
+        return (numpy.mod(az, 360.0), el)
+
+    def simulate(self, order, mjd_start, az_start, el_start):
+        """
+        Follow the tour `order` from physical azimuth `az_start`,
+        elevation `el_start` at `mjd_start`, with the cable wrap.
+        Returns a Bunch with the start time (MJD), sky position and
+        physical azimuth of each observation, and the total slew and
+        elapsed times (sec).
+        """
+        n = len(order)
+        res = misc.Bunch(order=numpy.asarray(order), mjd=numpy.empty(n),
+                         az=numpy.empty(n), el=numpy.empty(n),
+                         az_phys=numpy.empty(n), slew=numpy.empty(n))
+        t, az_p, el_p = mjd_start, az_start, el_start
+        for j, i in enumerate(order):
+            # aim for where the target will be when the slew ends
+            az, el = self.positions(t, i)
+            secs, _ = self.model.slew_time(az_p, el_p, az, el)
+            az, el = self.positions(t + secs / 86400.0, i)
+            secs, az_phys = self.model.slew_time(az_p, el_p, az, el)
+            t += secs / 86400.0
+            res.mjd[j], res.az[j], res.el[j] = t, az, el
+            res.az_phys[j], res.slew[j] = az_phys, secs
+            t += self.durations[i] / 86400.0
+            az_p, el_p = float(az_phys), float(el)
+        res.slew_time = float(res.slew.sum())
+        res.total_time = (t - mjd_start) * 86400.0
+        return res
+
+    def nearest_neighbour(self, mjd_start, az_start, el_start):
+        """
+        Build a tour by always slewing to the target that is quickest
+        to reach from where the telescope is, at the current time.
+        Raises SlewError if the targets left are all outside the cable
+        wrap.
+        """
+        left = numpy.ones(self.n, dtype=bool)
+        order = []
+        t, az_p, el_p = mjd_start, az_start, el_start
+        for j in range(self.n):
+            idx = numpy.nonzero(left)[0]
+            az, el = self.positions(t, idx)
+            secs, az_phys = self.model.slew_time(az_p, el_p, az, el)
+            best = _argmin(secs)
+            if not numpy.isfinite(secs[best]):
+                raise SlewError("targets %s cannot be reached within the "
+                                "cable wrap" % (list(idx),))
+            i = idx[best]
+            order.append(i)
+            left[i] = False
+            t += (secs[best] + self.durations[i]) / 86400.0
+            az_p, el_p = float(az_phys[best]), float(el[best])
+        return order
+
+    def _matrix(self, sim, az_start, el_start):
+        # slew times between targets at their scheduled positions, with
+        # the starting position as the last node.  Physical azimuths
+        # keep the moves from winding up the cable.
+        az = numpy.append(sim.az_phys, az_start)
+        el = numpy.append(sim.el, el_start)
+        return self.model.cost_matrix(az, el, physical=True)
+
+    def two_opt(self, cost, mjd, window):
+        """
+        Improve the open tour 0..N-1 (node N being the fixed start) by
+        reversing segments, using slew time matrix `cost`.  Nodes are
+        scheduled at times `mjd` and are not moved by more than `window`
+        minutes, so that the positions the matrix was made from still
+        hold.  Returns the new order of the nodes, as indices into the
+        matrix.
+        """
+        n = len(cost) - 1
+        window = window / 1440.0
+        # times of the places in the tour
+        slots = numpy.sort(mjd)
+        # the last place each node may go to
+        last = numpy.searchsorted(slots, mjd + window, side='right') - 1
+        tour = numpy.append(n, numpy.arange(n))
+        improved = True
+        while improved:
+            improved = False
+            for i in range(1, n):
+                a, b = tour[i - 1], tour[i]
+                j_max = last[b]
+                if j_max <= i:
+                    continue
+                c = tour[i + 1:j_max + 1]
+                d = tour[i + 2:j_max + 2]
+                if len(d) < len(c):
+                    d = numpy.append(d, -1)
+                # gain of reversing tour[i..j] for every j > i
+                old = cost[a, b] + numpy.where(d >= 0, cost[c, d], 0.0)
+                new = cost[a, c] + numpy.where(d >= 0, cost[b, d], 0.0)
+                # c moves to place i
+                new[numpy.abs(slots[i] - mjd[c]) > window] = numpy.inf
+                delta = new - old
+                j = _argmin(delta)
+                if delta[j] < -1.0e-6:
+                    j += i + 1
+                    tour[i:j + 1] = tour[i:j + 1][::-1].copy()
+                    improved = True
+        return tour[1:]
+
+    def or_opt(self, cost, mjd, window, seg_max=3):
+        """
+        Improve the open tour 0..N-1 (node N being the fixed start) by
+        moving segments of up to `seg_max` nodes elsewhere, possibly
+        reversed, by no more than `window` minutes from their scheduled
+        times `mjd`.  Returns the new order of the nodes.
+        """
+        n = len(cost) - 1
+        window = window / 1440.0
+        slots = numpy.sort(mjd)
+        # the places each node may go to
+        first = numpy.searchsorted(slots, mjd - window)
+        last = numpy.searchsorted(slots, mjd + window, side='right') - 1
+        tour = numpy.append(n, numpy.arange(n))
+        improved = True
+        while improved:
+            improved = False
+            for seg_len in range(1, seg_max + 1):
+                for i in range(1, n + 2 - seg_len):
+                    seg = tour[i:i + seg_len].copy()
+                    a, b = seg[0], seg[-1]
+                    p = tour[i - 1]
+                    nxt = tour[i + seg_len] if i + seg_len <= n else -1
+                    gain = cost[p, a] - (cost[p, nxt] if nxt >= 0 else 0.0)
+                    if nxt >= 0:
+                        gain += cost[b, nxt]
+                    # slew times obey the triangle inequality, so there
+                    # is nothing to gain unless the segment is a detour
+                    if gain <= 1.0e-6:
+                        continue
+                    # inserted after rest[k], the segment starts at place
+                    # k + 1, which must be within the window
+                    k1 = max(first[a] - 1, 0)
+                    k2 = min(last[a], n + 1 - seg_len)
+                    if k2 <= k1:
+                        continue
+                    rest = numpy.append(tour[:i], tour[i + seg_len:])
+                    # cost of inserting it between each q and r
+                    q = rest[k1:k2]
+                    r = rest[k1 + 1:k2 + 1]
+                    if len(r) < len(q):
+                        r = numpy.append(r, -1)
+                    has_r = r >= 0
+                    r_ = numpy.where(has_r, r, 0)
+                    base = numpy.where(has_r, cost[q, r_], 0.0)
+                    fwd = cost[q, a] + numpy.where(has_r, cost[b, r_], 0.0) - base
+                    rev = cost[q, b] + numpy.where(has_r, cost[a, r_], 0.0) - base
+                    # don't put it back where it was
+                    if k1 <= i - 1 < k2:
+                        fwd[i - 1 - k1] = rev[i - 1 - k1] = numpy.inf
+                    k_f, k_r = _argmin(fwd), _argmin(rev)
+                    if min(fwd[k_f], rev[k_r]) < gain - 1.0e-6:
+                        if fwd[k_f] <= rev[k_r]:
+                            k, ins = k1 + k_f, seg
+                        else:
+                            k, ins = k1 + k_r, seg[::-1]
+                        tour = numpy.concatenate((rest[:k + 1], ins,
+                                                  rest[k + 1:]))
+                        improved = True
+        return tour[1:]
+
+    def plan(self, mjd_start, az_start=None, el_start=None, window=10.0,
+             max_rounds=5, two_opt=True, or_opt=True):
+        """
+        Order the targets for observation starting at `mjd_start` from
+        physical azimuth `az_start` and elevation `el_start` (by
+        default, at the first target's position).
+
+        The nearest-neighbour tour is improved in rounds: the slew time
+        matrix is made from the targets' positions at their scheduled
+        times, targets are moved by up to `window` minutes with 2-opt
+        and or-opt, and the new tour is simulated to schedule it again.
+        A round that does not shorten the tour is discarded and tried
+        again with half the window.  Returns the Bunch of simulate() for
+        the best tour found.
+        """
+        if az_start is None:
+            az, el = self.positions(mjd_start, numpy.arange(1))
+            az_start, el_start = float(az[0]), float(el[0])
+        order = self.nearest_neighbour(mjd_start, az_start, el_start)
+        best = self.simulate(order, mjd_start, az_start, el_start)
+
+        for i in range(max_rounds):
+            cost = self._matrix(best, az_start, el_start)
+            mjd = numpy.append(best.mjd, mjd_start)
+            perm = numpy.arange(len(order))
+            if two_opt:
+                perm = self.two_opt(cost, mjd, window)
+            if or_opt:
+                nodes = numpy.append(perm, len(perm))
+                perm = perm[self.or_opt(cost[nodes][:, nodes], mjd[nodes],
+                                        window)]
+            res = self.simulate(best.order[perm], mjd_start, az_start,
+                                el_start)
+            if res.total_time < best.total_time - 1.0e-3:
+                best = res
+            else:
+                window *= 0.5
+        return best
+
+#END
@@ -0,0 +1,62 @@
+import unittest
+from datetime import timedelta
+
+import numpy
+
+from obsplan import entity, almanac, timegrid
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class TestAlmanac(unittest.TestCase):
+
+    def setUp(self):
+        self.obs = entity.Observer('subaru',
+                                   longitude='-155:28:48.900',
+                                   latitude='+19:49:42.600',
+                                   elevation=4163,
+                                   pressure=615,
+                                   temperature=0,
+                                   timezone='US/Hawaii')
+
+    def test_matches_ephem(self):
+        alm = self.obs.get_almanac('2014-04-01', '2014-05-31')
+        self.assertEqual(len(alm), 61)
+        for i in range(0, len(alm), 10):
+            noon = self.obs.get_date(alm.dates[i].strftime('%Y-%m-%d 12:00'))
+            for dt1, dt2 in zip(self.obs.sun_set_rise_times(noon),
+                                alm.night(i)):
+                self.assertTrue(abs((dt1 - dt2).total_seconds()) < 2.0)
+
+            next_noon = noon + timedelta(days=1)
+            for name, rising in (('moonrise', True), ('moonset', False)):
+                dt1 = self.obs._next_event(self.obs.moon, self.obs.horizon,
+                                           noon, rising)
+                dt2 = alm.datetimes(name)[i]
+                if dt1 < next_noon:
+                    self.assertTrue(abs((dt1 - dt2).total_seconds()) < 2.0)
+                else:
+                    self.assertTrue(dt2 is None)
+
+            mid = timegrid.TimeGrid([0.5 * (alm.sunset[i] + alm.sunrise[i])])
+            self.assertAlmostEqual(alm.moon_illum[i],
+                                   self.obs.moon_phase(mid.datetimes()[0]),
+                                   places=4)
+
+    def test_write(self):
+        alm = almanac.calc_almanac(self.obs, '2014-04-28', '2014-04-30')
+        out_f = StringIO()
+        alm.write(out_f)
+        lines = out_f.getvalue().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].startswith('2014-04-28'))
+        # as in get_text_almanac()
+        self.assertTrue('18:54' in lines[1])
+        self.assertTrue(numpy.all(numpy.diff(alm.sunset) > 0.99))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import math
+
+import ephem
+import numpy
+
+from obsplan import entity, apparent
+
+
+class TestApparent(unittest.TestCase):
+
+    def setUp(self):
+        self.obs = entity.Observer('subaru',
+                                   longitude='-155:28:48.900',
+                                   latitude='+19:49:42.600',
+                                   elevation=4163,
+                                   pressure=615,
+                                   temperature=0,
+                                   timezone='US/Hawaii')
+        rs = numpy.random.RandomState(42)
+        ra = rs.uniform(0.0, 2*math.pi, 50)
+        dec = numpy.arcsin(rs.uniform(-0.7, 1.0, 50))
+        self.targets = [entity.SiderealTarget(name="t%d" % i,
+                                              ra=str(ephem.hours(ra[i])),
+                                              dec=str(ephem.degrees(dec[i])),
+                                              equinox=(2000, 1950)[i % 2])
+                        for i in range(len(ra))]
+
+    def test_apparent_radec(self):
+        site = self.obs.get_site(date=ephem.Date('2014/4/29 10:00'))
+        jd = ephem.julian_date(site.date)
+        places = apparent.ApparentPlaces.from_targets(self.targets, jd)
+        for i, tgt in enumerate(self.targets):
+            tgt.body.compute(site)
+            sep = ephem.separation((places.ra[i], places.dec[i]),
+                                   (tgt.body.ra, tgt.body.dec))
+            self.assertTrue(sep < 1.0 * apparent.arcsec)
+
+    def test_catalog_track(self):
+        grid = self.obs.get_time_grid(
+            time_start=self.obs.get_date("2014-04-28 19:00"),
+            time_interval=10)
+        tracks = self.obs.get_catalog_track(self.targets, grid)
+        self.assertEqual(tracks.alt.shape, (len(self.targets), len(grid)))
+        for i, tgt in enumerate(self.targets[:10]):
+            trk1 = tracks[i]
+            trk2 = tgt.calc_track_exact(self.obs, grid)
+            up = trk2.alt > math.radians(5.0)
+            err = numpy.abs(trk1.alt - trk2.alt)[up]
+            self.assertTrue(numpy.all(err < 1.5 * apparent.arcsec))
+            d_az = apparent.wrap_pi(trk1.az - trk2.az) * numpy.cos(trk2.alt)
+            self.assertTrue(numpy.all(numpy.abs(d_az[up]) <
+                                      1.5 * apparent.arcsec))
+            self.assertTrue(numpy.allclose(trk1.airmass[up],
+                                           trk2.airmass[up], atol=1e-4))
+
+    def test_multi_night(self):
+        time1 = self.obs.get_date("2014-04-28 19:00")
+        grid = self.obs.get_time_grid(time_start=time1,
+                                      time_stop=self.obs.get_date("2014-05-02 06:00"),
+                                      time_interval=30)
+        trk1 = self.targets[0].calc_track(self.obs, grid)
+        trk2 = self.targets[0].calc_track_exact(self.obs, grid)
+        up = trk2.alt > math.radians(5.0)
+        err = numpy.abs(trk1.alt - trk2.alt)[up]
+        self.assertTrue(numpy.all(err < 1.5 * apparent.arcsec))
+
+
+if __name__ == "__main__":
+    unittest.main()
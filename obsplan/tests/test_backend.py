@@ -0,0 +1,127 @@
+import unittest
+import math
+import pickle
+from datetime import datetime
+
+import numpy
+import pytz
+
+from obsplan import entity, lowprec, timegrid
+from obsplan.timegrid import TimeGrid
+
+arcmin = math.radians(1.0 / 60.0)
+
+
+def sep(ra1, dec1, ra2, dec2):
+    cos_sep = (numpy.sin(dec1) * numpy.sin(dec2) +
+               numpy.cos(dec1) * numpy.cos(dec2) * numpy.cos(ra1 - ra2))
+    return numpy.arccos(numpy.clip(cos_sep, -1.0, 1.0))
+
+
+class TestBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.hst = pytz.timezone('US/Hawaii')
+        kwds = dict(longitude='-155:28:48.900', latitude='+19:49:42.600',
+                    elevation=4163, pressure=615, temperature=0,
+                    timezone='US/Hawaii')
+        self.obs = entity.Observer('subaru', **kwds)
+        self.obs_np = entity.Observer('subaru', backend='numpy', **kwds)
+        # a few years, at odd times
+        self.grid = TimeGrid(57000.0 + numpy.linspace(0.0, 1500.0, 401))
+        self.ephem = entity.get_backend('ephem')
+        self.numpy = entity.get_backend('numpy')
+
+    def test_get_backend(self):
+        self.assertTrue(self.obs.backend is self.ephem)
+        self.assertTrue(self.obs_np.backend is self.numpy)
+        self.assertTrue(entity.get_backend(self.numpy) is self.numpy)
+        self.assertRaises(ValueError, entity.get_backend, 'bogus')
+
+    def test_sun(self):
+        ra1, dec1, dist1 = self.ephem.sun_radec(self.grid)
+        ra2, dec2, dist2 = self.numpy.sun_radec(self.grid)
+        self.assertTrue(sep(ra1, dec1, ra2, dec2).max() < 1.0 * arcmin)
+        self.assertTrue(numpy.abs(dist1 - dist2).max() < 1.0e-4)
+
+    def test_moon(self):
+        ra1, dec1, dist1, illum1 = self.ephem.moon_radec(self.grid)
+        ra2, dec2, dist2, illum2 = self.numpy.moon_radec(self.grid)
+        self.assertTrue(sep(ra1, dec1, ra2, dec2).max() < 2.0 * arcmin)
+        self.assertTrue(numpy.abs(dist2 / dist1 - 1.0).max() < 5.0e-4)
+        self.assertTrue(numpy.abs(illum1 - illum2).max() < 0.005)
+
+    def test_lowprec_scalar(self):
+        jd = 2457000.5
+        ra, dec, dist, illum = lowprec.moon_radec(jd)
+        self.assertEqual(numpy.shape(ra), ())
+        ra2, dec2, dist2, illum2 = lowprec.moon_radec(numpy.array([jd]))
+        self.assertAlmostEqual(float(ra), ra2[0], places=12)
+
+    def test_catalog(self):
+        targets = [entity.SiderealTarget(name='t1', ra='10:00:00',
+                                         dec='+20:00:00'),
+                   entity.SiderealTarget(name='t2', ra='23:30:00',
+                                         dec='-45:00:00')]
+        grid = TimeGrid(self.grid.mjd[:20])
+        ra1, dec1 = self.ephem.catalog_radec(targets, grid)
+        ra2, dec2 = self.numpy.catalog_radec(targets, grid)
+        self.assertEqual(ra2.shape, (2, 20))
+        self.assertTrue(sep(ra1, dec1, ra2, dec2).max() <
+                        math.radians(2.0 / 3600.0))
+
+    def test_sun_moon(self):
+        sm1 = self.obs.get_sun_moon(self.grid)
+        sm2 = self.obs_np.get_sun_moon(self.grid)
+        self.assertEqual(len(sm2), len(self.grid))
+        self.assertTrue(numpy.abs(sm1.sun_alt - sm2.sun_alt).max() < arcmin)
+        self.assertTrue(numpy.abs(sm1.moon_alt - sm2.moon_alt).max() <
+                        2.0 * arcmin)
+
+        # against pyephem at the site, through the scalar results
+        tgt = entity.SiderealTarget(name='t1', ra='10:00:00', dec='+20:00:00')
+        for mjd in self.grid.mjd[::50]:
+            date = TimeGrid([mjd]).datetimes(pytz.utc)[0]
+            res = tgt.calc(self.obs, date)
+            i = numpy.searchsorted(self.grid.mjd, mjd)
+            self.assertTrue(abs(res.moon_alt - sm2.moon_alt[i]) < 2.0 * arcmin)
+            self.assertTrue(abs(res.moon_sep -
+                                sm2.moon_sep(float(res.ra),
+                                             float(res.dec))[i]) <
+                            2.0 * arcmin)
+
+    def test_target_info(self):
+        tgt = entity.SiderealTarget(name='t1', ra='10:00:00', dec='+20:00:00')
+        date = self.hst.localize(datetime(2015, 3, 1, 18, 0, 0))
+        history1 = self.obs.get_target_info(tgt, time_start=date)
+        history2 = self.obs_np.get_target_info(tgt, time_start=date)
+        self.assertEqual(len(history1), len(history2))
+        for res1, res2 in zip(history1, history2):
+            self.assertEqual(res1.lt, res2.lt)
+            self.assertTrue(abs(res1.alt - res2.alt) < 0.1 * arcmin)
+            self.assertTrue(abs(res1.az - res2.az) < 0.1 * arcmin)
+            self.assertTrue(abs(float(res1.ha) - float(res2.ha)) <
+                            0.1 * arcmin)
+            self.assertTrue(abs(res2.airmass / res1.airmass - 1.0) < 1.0e-5)
+            self.assertTrue(abs(res1.moon_alt - res2.moon_alt) < 2.0 * arcmin)
+            self.assertTrue(abs(res1.moon_sep - res2.moon_sep) < 2.0 * arcmin)
+            self.assertAlmostEqual(res1.moon_pct, res2.moon_pct, places=2)
+
+        # single results and non-sidereal targets stay with pyephem
+        res1 = tgt.calc(self.obs, date)
+        res2 = tgt.calc(self.obs_np, date)
+        self.assertEqual(res1.alt, res2.alt)
+        self.assertEqual(res1.moon_sep, res2.moon_sep)
+        history1 = self.obs.get_target_info(entity.mars, time_start=date)
+        history2 = self.obs_np.get_target_info(entity.mars, time_start=date)
+        self.assertEqual(history1[10].alt, history2[10].alt)
+
+    def test_pickle(self):
+        obs = pickle.loads(pickle.dumps(self.obs_np))
+        self.assertTrue(obs.backend.vectorized)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+#END
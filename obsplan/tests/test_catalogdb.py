@@ -0,0 +1,98 @@
+import unittest
+import math
+from datetime import timedelta
+
+import numpy
+
+from obsplan import entity, catalogdb
+
+
+class TestCatalogDB(unittest.TestCase):
+
+    def setUp(self):
+        if not catalogdb.have_sqlite:
+            self.skipTest("sqlite3 not available")
+        self.obs = entity.Observer('subaru',
+                                   longitude='-155:28:48.900',
+                                   latitude='+19:49:42.600',
+                                   elevation=4163,
+                                   pressure=615,
+                                   temperature=0,
+                                   timezone='US/Hawaii')
+        rnd = numpy.random.RandomState(42)
+        n = 500
+        self.ra = rnd.uniform(0.0, 2 * math.pi, n)
+        self.dec = numpy.arcsin(rnd.uniform(-1.0, 1.0, n))
+        self.db = catalogdb.CatalogDB(':memory:')
+        self.ids = self.db.add_rows([("t%d" % i, ra, dec, 2000.0, i % 5)
+                                     for i, (ra, dec) in
+                                     enumerate(zip(self.ra, self.dec))])
+        self.time_start = self.obs.get_date("2014-04-28 20:00")
+        self.time_stop = self.time_start + timedelta(hours=3)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_add_targets(self):
+        tgt = entity.SiderealTarget(name="vega", ra="18:36:56.3",
+                                    dec="+38:47:01")
+        (tid,) = self.db.add_targets([tgt], priorities=[3.0])
+        self.assertEqual(len(self.db), len(self.ids) + 1)
+        row = self.db.get([tid])[0]
+        self.assertEqual(row.name, "vega")
+        tgt2 = self.db.to_targets([row])[0]
+        self.assertAlmostEqual(float(tgt2.body._ra), float(tgt.body._ra),
+                               places=8)
+        self.assertAlmostEqual(float(tgt2.body._dec), float(tgt.body._dec),
+                               places=8)
+
+    def test_query(self):
+        rows = self.db.query(dec_min=0.0, dec_max=0.5, ra_min=6.0,
+                             ra_max=0.5, priority_min=2)
+        exp = set([i + 1 for i in range(len(self.ra))
+                   if 0.0 <= self.dec[i] <= 0.5 and i % 5 >= 2 and
+                   (self.ra[i] >= 6.0 or self.ra[i] <= 0.5)])
+        self.assertEqual(set([row.id for row in rows]), exp)
+
+    def test_query_observable(self):
+        rows = self.db.query_observable(self.obs, self.time_start,
+                                        self.time_stop, el_min_deg=30.0)
+        self.assertTrue(len(rows) < len(self.ids) / 2)
+        # every target that is actually up is among the candidates
+        targets = self.db.to_targets(self.db.get(self.ids))
+        windows = self.obs.get_windows(targets, self.time_start,
+                                       self.time_stop, el_min_deg=30.0,
+                                       step=5)
+        up = set([tid for tid, wins in zip(self.ids, windows)
+                  if len(wins) > 0])
+        self.assertTrue(len(up) > 0)
+        self.assertTrue(up.issubset(set([row.id for row in rows])))
+
+    def test_visibility_cache(self):
+        res = self.db.calc_visibility(self.obs, "2014-04-28", self.time_start,
+                                      self.time_stop, el_min_deg=30.0)
+        cached = self.db.get_visibility("subaru", "2014-04-28",
+                                        self.time_start, self.time_stop, 30.0)
+        self.assertEqual(sorted(res.keys()), sorted(cached.keys()))
+        tid = [tid for tid, val in res.items() if val[0] > 0.0][0]
+        self.assertEqual(res[tid], cached[tid])
+
+        # another period of the same night is calculated afresh
+        time_stop = self.time_start + timedelta(hours=1)
+        rows = self.db.get(list(res.keys()))
+        res2 = self.db.calc_visibility(self.obs, "2014-04-28",
+                                       self.time_start, time_stop,
+                                       el_min_deg=30.0, rows=rows)
+        self.assertTrue(all([res2[i][0] <= min(res[i][0], 3600.0) + 1.0
+                             for i in res]))
+        self.assertTrue(any([res2[i][0] < res[i][0] for i in res]))
+        self.assertEqual(res, self.db.get_visibility(
+            "subaru", "2014-04-28", self.time_start, self.time_stop, 30.0))
+
+        self.db.remove([tid])
+        self.assertTrue(tid not in self.db.get_visibility(
+            "subaru", "2014-04-28", self.time_start, self.time_stop, 30.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
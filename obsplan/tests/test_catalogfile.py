@@ -0,0 +1,68 @@
+import unittest
+import os
+import tempfile
+
+import numpy
+
+from obsplan import entity, catalogfile
+
+
+class TestCatalogFile(unittest.TestCase):
+
+    def setUp(self):
+        self.obs = entity.Observer('subaru',
+                                   longitude='-155:28:48.900',
+                                   latitude='+19:49:42.600',
+                                   elevation=4163,
+                                   pressure=615,
+                                   temperature=0,
+                                   timezone='US/Hawaii')
+        self.targets = [
+            entity.SiderealTarget(name="vega", ra="18:36:56.3",
+                                  dec="+38:47:01"),
+            entity.SiderealTarget(name="altair", ra="19:51:29.74",
+                                  dec="8:54:23.5"),
+            entity.SiderealTarget(name="M31", ra="00:42:44.3",
+                                  dec="+41:16:09", equinox=1950),
+            ]
+        fd, self.path = tempfile.mkstemp(suffix='.cat')
+        os.close(fd)
+        catalogfile.write_catalog(self.path, self.targets)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_roundtrip(self):
+        cat = catalogfile.MappedCatalog(self.path)
+        self.assertEqual(len(cat), 3)
+        self.assertTrue(isinstance(cat.ra, numpy.memmap))
+        self.assertEqual(cat.names, ['vega', 'altair', 'M31'])
+        self.assertEqual(cat.find('altair'), 1)
+        for tgt1, tgt2 in zip(self.targets, cat[:]):
+            self.assertEqual(tgt1.name, tgt2.name)
+            self.assertAlmostEqual(float(tgt1.body._ra),
+                                   float(tgt2.body._ra), places=8)
+            self.assertAlmostEqual(float(tgt1.body._dec),
+                                   float(tgt2.body._dec), places=8)
+            self.assertAlmostEqual(float(tgt1.body._epoch),
+                                   float(tgt2.body._epoch), places=6)
+        cat.close()
+
+    def test_track(self):
+        cat = catalogfile.MappedCatalog(self.path)
+        grid = self.obs.get_time_grid(
+            time_start=self.obs.get_date("2014-04-28 20:00"))
+        trk1 = cat.get_track(self.obs, grid)
+        trk2 = self.obs.get_catalog_track(self.targets, grid)
+        self.assertTrue(numpy.allclose(trk1.alt, trk2.alt, atol=1e-9))
+        self.assertEqual(trk1[2].target.name, 'M31')
+
+    def test_bad_file(self):
+        with open(self.path, 'wb') as out_f:
+            out_f.write(b'x' * 100)
+        self.assertRaises(catalogfile.CatalogFileError,
+                          catalogfile.MappedCatalog, self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
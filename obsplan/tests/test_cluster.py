@@ -0,0 +1,124 @@
+import unittest
+import math
+from multiprocessing.connection import Client
+import threading
+import time
+
+import numpy
+
+from obsplan import cluster, entity, timegrid
+
+
+class TestCluster(unittest.TestCase):
+
+    def setUp(self):
+        self.obs = entity.Observer('subaru',
+                                   longitude='-155:28:48.900',
+                                   latitude='+19:49:42.600',
+                                   elevation=4163,
+                                   pressure=615,
+                                   temperature=0,
+                                   timezone='US/Hawaii')
+        time_start = self.obs.get_date("2014-04-28 20:00")
+        time_stop = self.obs.get_date("2014-04-29 05:00")
+        self.cts = entity.Constraints(time_start, time_stop, 15.0, 89.0,
+                                      3600.0)
+        self.targets = [
+            entity.SiderealTarget(name="vega", ra="18:36:56.3",
+                                  dec="+38:47:01"),
+            entity.SiderealTarget(name="m13", ra="16:41:41.2",
+                                  dec="+36:27:35"),
+            entity.SiderealTarget(name="sirius", ra="06:45:08.9",
+                                  dec="-16:42:58"),
+            entity.SiderealTarget(name="m31", ra="00:42:44.3",
+                                  dec="+41:16:09"),
+            entity.SiderealTarget(name="arcturus", ra="14:15:39.7",
+                                  dec="+19:10:57"),
+            entity.SiderealTarget(name="polaris", ra="02:31:49.1",
+                                  dec="+89:15:51"),
+            entity.SiderealTarget(name="canopus", ra="06:23:57.1",
+                                  dec="-52:41:45"),
+            ]
+
+    def _start_worker(self, coord):
+        thread = threading.Thread(target=cluster.run_worker,
+                                  args=(coord.address,))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def test_run(self):
+        coord = cluster.Coordinator(self.obs, self.cts, self.targets,
+                                    shard_size=3, time_interval=30)
+        coord.start()
+        workers = [self._start_worker(coord) for i in range(2)]
+        res = coord.run(timeout=120)
+        for thread in workers:
+            thread.join(10)
+            self.assertFalse(thread.is_alive())
+
+        self.assertEqual(len(res), len(self.targets))
+        for i, tgt in enumerate(self.targets):
+            obs_res = self.obs.observable(tgt, self.cts)
+            self.assertEqual(bool(res.observable[i]), obs_res.observable)
+            if obs_res.time_rise is not None:
+                self.assertAlmostEqual(
+                    res.time_rise[i],
+                    timegrid.datetime2mjd(obs_res.time_rise), delta=2e-5)
+        self.assertEqual(res.alt.shape, (len(self.targets), len(res.mjd)))
+        trk = self.obs.get_catalog_track(self.targets, timegrid.TimeGrid(
+            res.mjd))
+        self.assertTrue(numpy.allclose(res.alt, trk.alt, atol=1e-6))
+
+    def test_empty(self):
+        coord = cluster.Coordinator(self.obs, self.cts, [], time_interval=30)
+        res = coord.run(timeout=10)
+        self.assertEqual(len(res), 0)
+        self.assertEqual(res.observable.shape, (0,))
+        self.assertEqual(res.alt.shape, (0, len(res.mjd)))
+
+    def test_worker_restart(self):
+        coord = cluster.Coordinator(self.obs, self.cts, self.targets,
+                                    shard_size=2)
+        coord.start()
+        # a worker that dies holding a shard
+        conn = Client(coord.address, authkey=cluster.default_authkey)
+        self.assertEqual(conn.recv()[0], 'setup')
+        self.assertEqual(conn.recv()[0], 'shard')
+        conn.close()
+
+        self._start_worker(coord)
+        res = coord.run(timeout=120)
+        self.assertEqual(coord.requeued, 1)
+        self.assertEqual(len(res.observable), len(self.targets))
+        self.assertFalse(numpy.any(numpy.isnan(res.up_time)))
+        # polaris never sets; canopus never rises high enough
+        self.assertTrue(res.up_time[5] > 8 * 3600.0)
+        self.assertFalse(res.observable[6])
+        self.assertTrue(math.isnan(res.time_rise[6]))
+
+    def test_timeout(self):
+        # many quick shards must not use up the timeout
+        coord = cluster.Coordinator(self.obs, self.cts, self.targets * 20,
+                                    shard_size=1)
+        coord.start()
+        self._start_worker(coord)
+        res = coord.run(timeout=60)
+        self.assertEqual(len(res), len(self.targets) * 20)
+
+        # the timeout is in seconds, with no workers at all
+        coord = cluster.Coordinator(self.obs, self.cts, self.targets)
+        t0 = time.time()
+        self.assertRaises(cluster.ClusterError, coord.run, 1.5)
+        self.assertTrue(1.4 < time.time() - t0 < 5.0)
+
+    def test_error(self):
+        cts = entity.Constraints(self.cts.time_start, self.cts.time_stop,
+                                 15.0, 89.0, 3600.0)
+        cts.el_min_deg = 'bad'
+        coord = cluster.Coordinator(self.obs, cts, self.targets[:2])
+        coord.start()
+        self._start_worker(coord)
+        self.assertRaises(cluster.ClusterError, coord.run, 120)
+
+#END
@@ -0,0 +1,54 @@
+import unittest
+import pickle
+
+from obsplan import entity
+
+vega = ("18:36:56.3", "+38:47:01", "2000")
+
+
+class TestCompactResult(unittest.TestCase):
+
+    def setUp(self):
+        self.obs = entity.Observer('subaru',
+                                   longitude='-155:28:48.900',
+                                   latitude='+19:49:42.600',
+                                   elevation=4163,
+                                   pressure=615,
+                                   temperature=0,
+                                   timezone='US/Hawaii')
+        self.tgt = entity.SiderealTarget(name="vega", ra=vega[0], dec=vega[1])
+        self.time1 = self.obs.get_date("2014-04-29 04:00")
+
+    def test_compact_matches_full(self):
+        c1 = self.obs.calc(self.tgt, self.time1)
+        ctx = self.obs.get_night_context(date=self.time1)
+        c2 = ctx.calc(self.tgt, self.time1)
+        self.assertFalse(hasattr(c2, '__dict__'))
+        self.assertAlmostEqual(c1.alt_deg, c2.alt_deg, places=6)
+        self.assertAlmostEqual(c1.airmass, c2.airmass, places=6)
+        self.assertAlmostEqual(float(c1.ha), float(c2.ha), places=6)
+        self.assertAlmostEqual(float(c1.pang), float(c2.pang), places=6)
+        self.assertAlmostEqual(c1.moon_alt, c2.moon_alt, places=6)
+        self.assertAlmostEqual(c1.moon_sep, c2.moon_sep, places=6)
+        self.assertEqual(c1.lt, c2.lt)
+
+    def test_compact_history_shares_context(self):
+        history = self.obs.get_target_info(self.tgt, time_start=self.time1,
+                                           compact=True)
+        self.assertTrue(len(history) > 1)
+        self.assertTrue(history[0].ctx is history[-1].ctx)
+
+    def test_compact_pickle(self):
+        history = self.obs.get_target_info(self.tgt, time_start=self.time1,
+                                           compact=True)
+        buf = pickle.dumps(history, protocol=2)
+        history2 = pickle.loads(buf)
+        self.assertTrue(history2[0].ctx is history2[-1].ctx)
+        self.assertEqual(history[5].airmass, history2[5].airmass)
+        self.assertAlmostEqual(history[5].moon_sep, history2[5].moon_sep)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+#END
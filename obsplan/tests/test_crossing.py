@@ -0,0 +1,279 @@
+import unittest
+import math
+import copy
+import time
+from datetime import timedelta
+
+import ephem
+import numpy
+
+from obsplan import entity, crossing, horizon
+
+
+class TestCrossing(unittest.TestCase):
+
+    def setUp(self):
+        self.obs = entity.Observer('subaru',
+                                   longitude='-155:28:48.900',
+                                   latitude='+19:49:42.600',
+                                   elevation=4163,
+                                   pressure=615,
+                                   temperature=0,
+                                   timezone='US/Hawaii')
+        self.targets = [
+            entity.SiderealTarget(name="vega", ra="18:36:56.3",
+                                  dec="+38:47:01"),
+            entity.SiderealTarget(name="altair", ra="19:51:29.74",
+                                  dec="8:54:23.5"),
+            # circumpolar and never up
+            entity.SiderealTarget(name="polaris", ra="02:31:49.09",
+                                  dec="+89:15:50.8"),
+            entity.SiderealTarget(name="acrux", ra="12:26:35.9",
+                                  dec="-63:05:56.7"),
+            ]
+        self.time_start = self.obs.get_date("2014-04-28 12:00")
+        self.time_stop = self.time_start + timedelta(hours=48)
+
+    def _ephem_crossings(self, target, el_deg):
+        site = self.obs.get_site(date=self.time_start, horizon_deg=el_deg)
+        t, t_stop = ephem.Date(self.time_start), ephem.Date(self.time_stop)
+        res = []
+        while True:
+            try:
+                t1 = site.next_rising(target.body, start=t)
+                t2 = site.next_setting(target.body, start=t)
+            except (ephem.NeverUpError, ephem.AlwaysUpError):
+                return res
+            t = min(t1, t2)
+            if t > t_stop:
+                return res
+            res.append(t)
+            t = ephem.Date(t + ephem.second)
+
+    def test_windows(self):
+        windows = self.obs.get_windows(self.targets, self.time_start,
+                                       self.time_stop, el_min_deg=15.0)
+        self.assertEqual(len(windows), len(self.targets))
+        # vega and altair rise, set and rise again
+        for tgt, wins in zip(self.targets[:2], windows[:2]):
+            self.assertEqual(len(wins), 2)
+            times = [t for win in wins for t in win]
+            times = [t for t in times
+                     if t not in (self.time_start, self.time_stop)]
+            exp = self._ephem_crossings(tgt, 15.0)
+            self.assertEqual(len(times), len(exp))
+            for t1, t2 in zip(times, exp):
+                t2 = self.obs.tz_utc.localize(t2.datetime())
+                self.assertTrue(abs((t1 - t2).total_seconds()) < 5.0)
+        # polaris is up all the time, acrux never
+        self.assertEqual(len(windows[2]), 1)
+        self.assertEqual(windows[2][0][1], self.time_stop)
+        self.assertEqual(windows[3], [])
+
+    def test_el_max_airmass(self):
+        wins1 = self.obs.get_windows(self.targets[:1], self.time_start,
+                                     self.time_stop, el_min_deg=15.0)[0]
+        # vega culminates at about 71 deg, so an upper limit splits
+        # each window in two
+        wins2 = self.obs.get_windows(self.targets[:1], self.time_start,
+                                     self.time_stop, el_min_deg=15.0,
+                                     el_max_deg=65.0)[0]
+        self.assertEqual(len(wins2), 2 * len(wins1))
+        wins3 = self.obs.get_windows(self.targets[:1], self.time_start,
+                                     self.time_stop, airmass=1.5)[0]
+        for t1, t2 in wins3:
+            c1 = self.obs.calc(self.targets[0], t1 + timedelta(seconds=2))
+            c2 = self.obs.calc(self.targets[0], t2 - timedelta(seconds=2))
+            self.assertTrue(c1.airmass < 1.5 and c2.airmass < 1.5)
+
+    def test_nonsidereal(self):
+        wins = self.obs.get_windows([entity.moon, self.targets[0]],
+                                    self.time_start, self.time_stop,
+                                    el_min_deg=0.0)
+        site = self.obs.get_site(date=self.time_start, horizon_deg=0.0)
+        # the Moon is up at the start; compare the crossings of its centre
+        t1 = site.next_setting(ephem.Moon(), start=ephem.Date(self.time_start),
+                               use_center=True)
+        t2 = site.next_rising(ephem.Moon(), start=t1, use_center=True)
+        for t, exp in zip((wins[0][0][1], wins[0][1][0]), (t1, t2)):
+            exp = self.obs.tz_utc.localize(exp.datetime())
+            self.assertTrue(abs((t - exp).total_seconds()) < 5.0)
+
+    def test_find_windows(self):
+        # a plain function with two windows per "target"
+        def func(idx, mjd):
+            return numpy.sin(2 * math.pi * mjd) * (idx + 1)
+        res = crossing.find_windows(func, 2, 0.0, 1.75, step=30.0)
+        for wins in res:
+            self.assertEqual(len(wins), 2)
+            self.assertAlmostEqual(wins[0][0], 0.0)
+            self.assertAlmostEqual(wins[0][1], 0.5, places=4)
+            self.assertAlmostEqual(wins[1][0], 1.0, places=4)
+            self.assertAlmostEqual(wins[1][1], 1.5, places=4)
+
+    def test_window_cache(self):
+        cache = crossing.WindowCache(self.obs)
+        mjd1 = entity.timegrid.datetime2mjd(self.time_start)
+        wins1 = self.obs.get_windows(self.targets, self.time_start,
+                                     self.time_stop, el_min_deg=30.0)
+        for tgt, wins in zip(self.targets, wins1):
+            wins2 = cache.get_windows(tgt, mjd1, mjd1 + 2.0, el_min_deg=30.0)
+            self.assertEqual(len(wins), len(wins2))
+            for (t1, t2), (t3, t4) in zip(wins, wins2):
+                self.assertTrue(abs(entity.timegrid.datetime2mjd(t1) - t3)
+                                < 2.0 / 86400)
+                self.assertTrue(abs(entity.timegrid.datetime2mjd(t2) - t4)
+                                < 2.0 / 86400)
+        # polaris is up all the time, across the nights
+        self.assertEqual(len(cache.get_windows(self.targets[2], mjd1,
+                                               mjd1 + 2.0)), 1)
+
+        # sliding windows within the nights are answered from the cache,
+        # and an airmass limit shares the entries of the same altitude
+        misses = cache.misses
+        am = entity.apparent.airmass(math.radians(30.0))
+        for i in range(46):
+            t = mjd1 + i / 24.0
+            wins = cache.get_windows(self.targets[0], t, t + 0.1,
+                                     el_min_deg=15.0, airmass=am)
+            self.assertTrue(all([t <= t1 < t2 <= t + 0.1
+                                 for t1, t2 in wins]))
+        self.assertEqual(cache.misses, misses)
+
+        # changing the observer empties it
+        size = len(cache)
+        self.assertTrue(size > 0)
+        self.obs.pressure = 600
+        cache.get_windows(self.targets[0], mjd1 + 0.5, mjd1 + 0.6)
+        self.assertEqual(len(cache), 1)
+
+        cache.max_size = 3
+        cache.get_windows(self.targets[1], mjd1, mjd1 + 5.0)
+        self.assertEqual(len(cache), 3)
+
+    def test_sidereal_windows(self):
+        mjd1 = entity.timegrid.datetime2mjd(self.time_start)
+        for el_min, el_max in ((None, None), (0.0, None), (30.0, None),
+                               (15.0, 65.0), (None, 60.0)):
+            func = crossing.altitude_func(self.obs, self.targets,
+                                          el_min_deg=el_min,
+                                          el_max_deg=el_max)
+            res1 = crossing.find_windows(func, len(self.targets), mjd1,
+                                         mjd1 + 1.5, step=5.0)
+            res2 = crossing.sidereal_windows(self.obs, self.targets, mjd1,
+                                             mjd1 + 1.5, el_min_deg=el_min,
+                                             el_max_deg=el_max)
+            for wins1, wins2 in zip(res1, res2):
+                self.assertEqual(len(wins1), len(wins2))
+                for (t1, t2), (t3, t4) in zip(wins1, wins2):
+                    self.assertTrue(abs(t1 - t3) < 2.0 / 86400)
+                    self.assertTrue(abs(t2 - t4) < 2.0 / 86400)
+
+    def test_window_cache_search(self):
+        # the Moon, or anything behind a horizon mask, is searched for
+        # the period asked for only, unless the nights are filled
+        cache = crossing.WindowCache(self.obs)
+        mjd1 = entity.timegrid.datetime2mjd(self.time_start)
+        wins1 = self.obs.get_windows([entity.moon], self.time_start,
+                                     self.time_stop, el_min_deg=15.0)[0]
+        wins2 = cache.get_windows(entity.moon, mjd1, mjd1 + 2.0,
+                                  el_min_deg=15.0)
+        self.assertEqual(len(cache), 0)
+        cache.fill([entity.moon, self.targets[0]], mjd1, mjd1 + 2.0,
+                   el_min_deg=15.0)
+        self.assertEqual(len(cache), 6)
+        misses = cache.misses
+        wins3 = cache.get_windows(entity.moon, mjd1, mjd1 + 2.0,
+                                  el_min_deg=15.0)
+        self.assertEqual(cache.misses, misses)
+        self.assertEqual(len(wins1), len(wins2))
+        self.assertEqual(len(wins1), len(wins3))
+        for (t1, t2), (t3, t4), (t5, t6) in zip(wins1, wins2, wins3):
+            for t, tt in ((t1, t3), (t2, t4), (t1, t5), (t2, t6)):
+                self.assertTrue(abs(entity.timegrid.datetime2mjd(t) - tt)
+                                < 2.0 / 86400)
+
+        self.obs.horizon_mask = horizon.HorizonMask([0.0, 180.0],
+                                                    [20.0, 10.0])
+        wins4 = cache.get_windows(self.targets[1], mjd1, mjd1 + 1.0)
+        self.assertEqual(len(cache), 0)
+        wins5 = self.obs.get_windows(self.targets[1:2], self.time_start,
+                                     self.time_start + timedelta(days=1))[0]
+        self.assertEqual(len(wins4), len(wins5))
+
+    def test_observable_speed(self):
+        # cold single queries against a pyephem rise/set per target, as
+        # Constraints.observable used to do
+        rs = numpy.random.RandomState(1)
+        targets = [entity.SiderealTarget.from_radians(
+            't%d' % i, rs.uniform(0.0, 2 * math.pi),
+            math.asin(rs.uniform(-0.6, 1.0))) for i in range(100)]
+        time_stop = self.time_start + timedelta(hours=10)
+        cts = entity.Constraints(self.time_start, time_stop, 15.0, 89.0,
+                                 3600.0, airmass=1.5)
+        start = ephem.Date(self.time_start)
+
+        def _baseline():
+            site = self.obs.get_site(date=self.time_start, horizon_deg=15.0)
+            for tgt in targets:
+                try:
+                    site.next_rising(tgt.body, start=start)
+                    site.next_setting(tgt.body, start=start)
+                except (ephem.NeverUpError, ephem.AlwaysUpError):
+                    pass
+
+        def _cold():
+            self.obs.window_cache.clear()
+            for tgt in targets:
+                self.obs.observable(tgt, cts)
+
+        def _best(func):
+            res = []
+            for i in range(3):
+                t = time.time()
+                func()
+                res.append(time.time() - t)
+            return min(res)
+
+        _cold()
+        self.assertTrue(_best(_cold) < 5.0 * _best(_baseline))
+
+        # warmed on purpose, the queries are all hits
+        self.obs.window_cache.clear()
+        self.obs.fill_windows(targets, self.time_start, time_stop,
+                              el_min_deg=15.0, el_max_deg=89.0, airmass=1.5)
+        misses = self.obs.window_cache.misses
+        for tgt in targets:
+            self.obs.observable(tgt, cts)
+        self.assertEqual(self.obs.window_cache.misses, misses)
+
+    def test_window_cache_moved(self):
+        mjd1 = entity.timegrid.datetime2mjd(self.time_start)
+        cache = self.obs.window_cache
+        wins1 = cache.get_windows(self.targets[1], mjd1, mjd1 + 1.0,
+                                  el_min_deg=30.0)
+        # move the observer to Cerro Pachon
+        self.obs.longitude = '-70:44:12.0'
+        self.obs.latitude = '-30:14:27.0'
+        wins2 = cache.get_windows(self.targets[1], mjd1, mjd1 + 1.0,
+                                  el_min_deg=30.0)
+        obs2 = entity.Observer('pachon', longitude='-70:44:12.0',
+                               latitude='-30:14:27.0', elevation=4163,
+                               pressure=615, temperature=0,
+                               timezone='America/Santiago')
+        wins3 = obs2.window_cache.get_windows(self.targets[1], mjd1,
+                                              mjd1 + 1.0, el_min_deg=30.0)
+        self.assertNotEqual(wins1, wins2)
+        self.assertEqual(len(wins2), len(wins3))
+        for (t1, t2), (t3, t4) in zip(wins2, wins3):
+            self.assertTrue(abs(t1 - t3) < 1.0 / 86400)
+            self.assertTrue(abs(t2 - t4) < 1.0 / 86400)
+
+    def test_window_cache_copy(self):
+        obs2 = copy.copy(self.obs)
+        self.assertFalse(obs2.window_cache is self.obs.window_cache)
+        self.assertTrue(obs2.window_cache.observer is obs2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+import numpy
+
+from obsplan.plots import decimate
+
+
+class TestDecimate(unittest.TestCase):
+
+    def setUp(self):
+        # airmass-like curves over a few nights at a fine cadence
+        n = 50000
+        self.x = numpy.linspace(0.0, 3.0, n)
+        rng = numpy.random.RandomState(4)
+        self.y = (1.0 + 1.5 * (1.0 - numpy.cos(2 * numpy.pi * self.x)) +
+                  0.01 * rng.standard_normal(n))
+
+    def test_decimate(self):
+        x, y = self.x, self.y
+        idx = decimate.decimate(x, y, 400, thresholds=(1.5, 2.0))
+        self.assertTrue(len(idx) < len(x) // 10)
+        self.assertTrue(numpy.all(numpy.diff(idx) > 0))
+        # extremes are kept, in every bucket
+        self.assertTrue(numpy.argmin(y) in idx)
+        self.assertTrue(numpy.argmax(y) in idx)
+        bucket = numpy.minimum((x * (400 / 3.0)).astype(int), 399)
+        for b in (0, 57, 399):
+            sel = bucket == b
+            self.assertEqual(y[sel].min(), y[idx][bucket[idx] == b].min())
+            self.assertEqual(y[sel].max(), y[idx][bucket[idx] == b].max())
+        # so are the threshold crossings
+        for val in (1.5, 2.0):
+            above, above_d = y > val, y[idx] > val
+            self.assertEqual((above[1:] != above[:-1]).sum(),
+                             (above_d[1:] != above_d[:-1]).sum())
+
+    def test_small(self):
+        idx = decimate.decimate(self.x[:100], self.y[:100], 400)
+        self.assertEqual(len(idx), 100)
+
+    def test_gap(self):
+        y = self.y.copy()
+        y[20000:20100] = numpy.nan
+        idx = decimate.decimate(self.x, y, 400)
+        self.assertTrue(numpy.isnan(y[idx]).sum() == 100)
+        self.assertEqual(numpy.nanmin(y[idx]), numpy.nanmin(y))
+
+    def test_zoom(self):
+        curve = decimate.DecimatedCurve(self.x, self.y)
+        x, y = curve.get(400)
+        self.assertEqual((x[0], x[-1]), (self.x[0], self.x[-1]))
+        # zoomed in, the full data are used again
+        x, y = curve.get(400, x_min=1.0, x_max=1.02)
+        self.assertTrue(x[0] < 1.0 < x[1])
+        self.assertTrue(x[-2] < 1.02 < x[-1])
+        n = ((self.x >= 1.0) & (self.x <= 1.02)).sum()
+        self.assertEqual(len(x), n + 2)
+
+#END
@@ -0,0 +1,83 @@
+import unittest
+import math
+import os
+import tempfile
+
+import numpy
+
+from obsplan import entity, horizon, timegrid
+
+
+class TestHorizonMask(unittest.TestCase):
+
+    def setUp(self):
+        # a dome slit blocking the east below 40 deg
+        self.mask = horizon.HorizonMask([0.0, 45.0, 50.0, 130.0, 135.0],
+                                        [15.0, 15.0, 40.0, 40.0, 15.0])
+        self.obs = entity.Observer('subaru',
+                                   longitude='-155:28:48.900',
+                                   latitude='+19:49:42.600',
+                                   elevation=4163,
+                                   pressure=615,
+                                   temperature=0,
+                                   timezone='US/Hawaii')
+        self.vega = entity.SiderealTarget(name="vega", ra="18:36:56.3",
+                                          dec="+38:47:01")
+        self.time_start = self.obs.get_date("2014-04-28 20:00")
+        self.time_stop = self.obs.get_date("2014-04-29 05:00")
+
+    def test_limit(self):
+        lim = self.mask.limit_deg(numpy.array([10.0, 47.5, 90.0, 200.0,
+                                               359.99, -270.0]))
+        expect = numpy.array([15.0, 27.5, 40.0, 15.0, 15.0, 40.0])
+        # the lookup errs on the high side, by up to a table step
+        self.assertTrue(numpy.all(lim >= expect - 1e-9))
+        self.assertTrue(numpy.all(lim - expect <= 0.1 * 25.0 / 5.0 + 1e-9))
+        self.assertAlmostEqual(math.degrees(self.mask.max_el), 40.0)
+
+    def test_load(self):
+        fd, path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'w') as out_f:
+            out_f.write("# az el\n0 10\n\n180 30\n")
+        try:
+            mask = horizon.HorizonMask.load(path)
+        finally:
+            os.remove(path)
+        self.assertTrue(abs(mask.limit_deg(90.0) - 20.0) < 0.1)
+
+    def test_track(self):
+        grid = self.obs.get_time_grid(time_start=self.time_start,
+                                      time_stop=self.time_stop)
+        trk = self.obs.get_target_track(self.vega, grid)
+        vis = self.mask.visible(trk.alt, trk.az)
+        self.assertEqual(vis.shape, trk.alt.shape)
+        self.assertTrue(numpy.all(vis <= (trk.alt_deg >= 15.0)))
+
+    def test_windows(self):
+        # vega rises in the northeast, behind the dome
+        wins1 = self.obs.get_windows([self.vega], self.time_start,
+                                     self.time_stop, el_min_deg=15.0)[0]
+        self.obs.horizon_mask = self.mask
+        wins2 = self.obs.get_windows([self.vega], self.time_start,
+                                     self.time_stop, el_min_deg=15.0)[0]
+        self.assertEqual(len(wins2), 1)
+        self.assertTrue(wins2[0][0] > wins1[0][0])
+        self.assertEqual(wins2[0][1], wins1[0][1])
+
+        # at the start of the window vega is just clearing the mask
+        grid = timegrid.TimeGrid([timegrid.datetime2mjd(wins2[0][0])])
+        trk = self.obs.get_target_track(self.vega, grid)
+        lim = self.mask.limit(trk.az)
+        self.assertTrue(abs(math.degrees(trk.alt[0] - lim[0])) < 0.05)
+
+        cts = entity.Constraints(time_start=self.time_start,
+                                 time_stop=self.time_stop,
+                                 el_min_deg=15.0, el_max_deg=89.0,
+                                 duration=60.0)
+        res = self.obs.observable(self.vega, cts)
+        self.assertTrue(abs((res.time_rise - wins2[0][0]).total_seconds())
+                        < 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
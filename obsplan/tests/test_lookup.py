@@ -0,0 +1,116 @@
+import unittest
+import math
+import os
+import tempfile
+
+import numpy
+
+from obsplan import apparent, entity, lookup
+
+
+class TestLookupTable(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.obs = entity.Observer('subaru',
+                                  longitude='-155:28:48.900',
+                                  latitude='+19:49:42.600',
+                                  elevation=4163,
+                                  pressure=615,
+                                  temperature=0,
+                                  timezone='US/Hawaii')
+        cls.table = lookup.LookupTable(float(cls.obs.site.lat), 615, 0)
+
+    def _random_sky(self, n=200000):
+        rng = numpy.random.RandomState(2)
+        dec = rng.uniform(-0.5 * math.pi, 0.5 * math.pi, n)
+        ha = rng.uniform(-math.pi, math.pi, n)
+        return dec, ha
+
+    def test_error_bound(self):
+        tbl = self.table
+        dec, ha = self._random_sky()
+        am, pang = tbl.lookup(dec, ha)
+        am0, pang0 = tbl._calc(dec, ha)
+        self.assertTrue(numpy.all(numpy.abs(am / am0 - 1.0) <=
+                                  tbl.tol_airmass))
+        self.assertTrue(numpy.all(numpy.abs(apparent.wrap_pi(pang - pang0)) <=
+                                  math.radians(tbl.tol_pang_deg)))
+        self.assertTrue(0.0 < tbl.max_err_airmass <= 0.5 * tbl.tol_airmass)
+        # most of the sky comes from the table
+        self.assertTrue(tbl.exact.mean() < 0.2)
+
+    def test_shape(self):
+        dec, ha = self._random_sky(12)
+        am, pang = self.table.lookup(dec.reshape(3, 4), ha.reshape(3, 4))
+        self.assertEqual(am.shape, (3, 4))
+        self.assertEqual(pang.shape, (3, 4))
+
+    def test_save_load(self):
+        fd, path = tempfile.mkstemp(suffix='.npz')
+        os.close(fd)
+        try:
+            self.table.save(path)
+            tbl = lookup.LookupTable.load(path)
+            self.assertTrue(tbl.matches(self.obs.site.lat, 615, 0))
+            self.assertFalse(tbl.matches(self.obs.site.lat, 600, 0))
+            dec, ha = self._random_sky(1000)
+            for val, val0 in zip(tbl.lookup(dec, ha),
+                                 self.table.lookup(dec, ha)):
+                self.assertTrue(numpy.array_equal(val, val0))
+            self.assertEqual(tbl.max_err_pang, self.table.max_err_pang)
+        finally:
+            os.remove(path)
+
+    def test_observer(self):
+        obs = self.obs
+        time_start = obs.get_date("2014-04-28 20:00")
+        time_stop = obs.get_date("2014-04-29 05:00")
+        grid = obs.get_time_grid(time_start=time_start, time_stop=time_stop,
+                                 time_interval=10)
+        targets = [entity.SiderealTarget(name="vega", ra="18:36:56.3",
+                                         dec="+38:47:01"),
+                   entity.SiderealTarget(name="m13", ra="16:41:41.2",
+                                         dec="+36:27:35")]
+        trk = obs.get_catalog_track(targets, grid)
+        ra, dec = trk.ra, trk.dec
+
+        am, pang = obs.calc_airmass_pang(ra, dec, grid)
+        up = trk.alt > math.radians(5.0)
+        self.assertTrue(numpy.allclose(am[up], trk.airmass[up], rtol=1e-9))
+        self.assertTrue(numpy.allclose(pang, trk.pang, atol=1e-9))
+
+        obs.lookup_table = self.table
+        try:
+            am, pang = obs.calc_airmass_pang(ra, dec, grid)
+        finally:
+            obs.lookup_table = None
+        self.assertTrue(numpy.all(numpy.abs(am / trk.airmass - 1.0) <=
+                                  self.table.tol_airmass))
+        self.assertTrue(numpy.all(numpy.abs(apparent.wrap_pi(
+            pang - trk.pang)) <= math.radians(self.table.tol_pang_deg)))
+
+    def test_use_lookup_table(self):
+        obs = entity.Observer('subaru',
+                              longitude='-155:28:48.900',
+                              latitude='+19:49:42.600',
+                              elevation=4163,
+                              pressure=615,
+                              temperature=0,
+                              timezone='US/Hawaii')
+        fd, path = tempfile.mkstemp(suffix='.npz')
+        os.close(fd)
+        os.remove(path)
+        try:
+            tbl = obs.use_lookup_table(path, dec_step_deg=2.0,
+                                       ha_step_deg=2.0)
+            self.assertTrue(obs.lookup_table is tbl)
+            self.assertTrue(os.path.exists(path))
+            # read back rather than built again
+            tbl2 = obs.use_lookup_table(path)
+            self.assertEqual(tbl2.dec_step_deg, 2.0)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+#END
@@ -0,0 +1,76 @@
+import unittest
+import math
+from datetime import timedelta
+
+import numpy
+
+from obsplan import entity, lstindex, timegrid
+
+
+class TestLSTIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.obs = entity.Observer('subaru',
+                                   longitude='-155:28:48.900',
+                                   latitude='+19:49:42.600',
+                                   elevation=4163,
+                                   pressure=615,
+                                   temperature=0,
+                                   timezone='US/Hawaii')
+        rnd = numpy.random.RandomState(1)
+        n = 2000
+        ra = rnd.uniform(0.0, 2 * math.pi, n)
+        dec = numpy.arcsin(rnd.uniform(-1.0, 1.0, n))
+        self.targets = [entity.SiderealTarget.from_radians(
+            "t%d" % (i), ra[i], dec[i]) for i in range(n)]
+        self.date = self.obs.get_date("2014-04-28 20:00")
+
+    def test_tree(self):
+        rnd = numpy.random.RandomState(2)
+        start = rnd.uniform(0.0, 100.0, 5000)
+        end = start + rnd.exponential(3.0, 5000)
+        tree = lstindex.IntervalTree(start, end)
+        for a, b in ((10.0, 12.0), (50.0, 50.0), (-5.0, 0.5), (0.0, 200.0)):
+            idx = numpy.sort(tree.overlapping(a, b))
+            brute = numpy.nonzero((start <= b) & (end >= a))[0]
+            self.assertTrue(numpy.array_equal(idx, brute))
+
+    def _longest_up(self, t1, t2, el_min, el_max):
+        # longest time (min) each target is within the limits, sampled
+        grid = timegrid.TimeGrid.from_range(t1, t2, 0.5)
+        trk = self.obs.get_catalog_track(self.targets, grid)
+        up = (trk.alt_deg >= el_min) & (trk.alt_deg <= el_max)
+        best = run = numpy.zeros(len(self.targets))
+        for k in range(up.shape[1]):
+            run = numpy.where(up[:, k], run + 1, 0)
+            best = numpy.maximum(best, run)
+        return (best - 1) * 0.5
+
+    def test_query(self):
+        index = lstindex.LSTIndex(self.obs, self.targets, el_min_deg=30.0,
+                                  el_max_deg=85.0, date=self.date)
+        t1 = self.date
+        t2 = self.date + timedelta(hours=3)
+        res = set(index.query_time(t1, t2, duration=60.0))
+        longest = self._longest_up(t1, t2, 30.0, 85.0)
+        self.assertTrue(len(res) > 0)
+        # allowing for the sampling of the check
+        self.assertTrue(set(numpy.nonzero(longest >= 61.0)[0]) <= res)
+        self.assertTrue(res <= set(numpy.nonzero(longest >= 59.0)[0]))
+
+    def test_wrap(self):
+        index = lstindex.LSTIndex(self.obs, self.targets, el_min_deg=15.0,
+                                  date=self.date)
+        a, b = math.radians(350.0), math.radians(10.0)
+        res = index.query(a, b)
+        res2 = numpy.union1d(index.query(a, 2 * math.pi),
+                             index.query(0.0, b))
+        self.assertTrue(numpy.array_equal(res, res2))
+        # everything that ever gets high enough
+        res3 = index.query(0.0, 2 * math.pi)
+        self.assertTrue(len(res3) > len(res))
+        self.assertEqual(len(index.query(a, b, duration=24 * 60.0)), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import math
+
+import ephem
+import numpy
+
+from obsplan import entity, apparent
+from obsplan.network import Network
+
+
+class TestNetwork(unittest.TestCase):
+
+    def setUp(self):
+        self.subaru = entity.Observer('subaru',
+                                      longitude='-155:28:48.900',
+                                      latitude='+19:49:42.600',
+                                      elevation=4163,
+                                      pressure=615,
+                                      temperature=0,
+                                      timezone='US/Hawaii')
+        self.paranal = entity.Observer('paranal',
+                                       longitude='-70:24:15',
+                                       latitude='-24:37:38',
+                                       elevation=2635,
+                                       pressure=750,
+                                       temperature=10,
+                                       timezone='America/Santiago')
+        self.network = Network([self.subaru, self.paranal])
+        self.targets = [
+            entity.SiderealTarget(name="vega", ra="18:36:56.3",
+                                  dec="+38:47:01"),
+            entity.SiderealTarget(name="altair", ra="19:51:29.74",
+                                  dec="8:54:23.5"),
+            entity.SiderealTarget(name="achernar", ra="01:37:42.85",
+                                  dec="-57:14:12.3"),
+            ]
+        # a UTC day covering the night at both sites
+        self.grid = self.subaru.get_time_grid(
+            time_start=self.subaru.get_date("2014-04-28 14:00"),
+            time_stop=self.subaru.get_date("2014-04-29 12:00"),
+            time_interval=10)
+
+    def test_matches_single_site(self):
+        res = self.network.calc(self.targets, self.grid)
+        self.assertEqual(res.alt.shape, (2, 3, len(self.grid)))
+        for i, obs in enumerate(self.network.observers):
+            trk = obs.get_catalog_track(self.targets, self.grid)
+            self.assertTrue(numpy.allclose(res.alt[i], trk.alt))
+            self.assertTrue(numpy.allclose(res.get_track(obs.name).pang,
+                                           trk.pang))
+
+    def test_sun_moon(self):
+        res = self.network.calc(self.targets, self.grid)
+        for i, obs in enumerate(self.network.observers):
+            site = obs.get_site()
+            for j in (0, 40, 80, 120):
+                site.date = self.grid.djd[j]
+                sun, moon = ephem.Sun(site), ephem.Moon(site)
+                self.assertTrue(abs(res.sun_alt[i, j] - sun.alt) <
+                                10 * apparent.arcsec)
+                # topocentric Moon
+                self.assertTrue(abs(res.moon_alt[i, j] - moon.alt) <
+                                30 * apparent.arcsec)
+                sep = ephem.separation(moon, self.targets[0].compute(site))
+                self.assertTrue(abs(res.moon_sep[i, 0, j] - sep) <
+                                30 * apparent.arcsec)
+
+    def test_observable(self):
+        res = self.network.calc(self.targets, self.grid)
+        secs = res.observable_time(el_min_deg=30.0, sun_alt_deg=-18.0)
+        self.assertEqual(secs.shape, (2, 3))
+        # achernar is never up at night from Mauna Kea in April
+        self.assertEqual(secs[0, 2], 0.0)
+        self.assertTrue(secs[0, 0] > 3600.0)
+        self.assertTrue(secs[1, 1] > 3600.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
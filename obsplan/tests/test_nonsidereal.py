@@ -0,0 +1,80 @@
+import unittest
+import math
+import pickle
+
+import ephem
+import numpy
+
+from obsplan import entity, apparent
+
+
+class TestNonSiderealTarget(unittest.TestCase):
+
+    def setUp(self):
+        self.obs = entity.Observer('subaru',
+                                   longitude='-155:28:48.900',
+                                   latitude='+19:49:42.600',
+                                   elevation=4163,
+                                   pressure=615,
+                                   temperature=0,
+                                   timezone='US/Hawaii')
+        self.grid = self.obs.get_time_grid(
+            time_start=self.obs.get_date("2020-07-15 19:00"),
+            time_interval=1)
+        self.comet = ephem.readdb("C/2020 F3 (NEOWISE),p,07/03.6817/2020,"
+                                  "128.9375,37.2786,0.294655,61.0103,2000,"
+                                  "g  7.0,6.1")
+
+    def _max_err_arcsec(self, trk1, trk2):
+        # compare tracks where the target is above the horizon
+        up = trk2.alt > 0.0
+        return math.degrees(numpy.abs(trk1.alt - trk2.alt)[up].max()) * 3600
+
+    def test_moon_track(self):
+        trk1 = self.obs.get_target_track(entity.moon, self.grid)
+        # exact track, pyephem at every sample
+        trk2 = entity.moon.calc_track_exact(self.obs, self.grid)
+        self.assertEqual(len(trk1), len(self.grid))
+        self.assertTrue(self._max_err_arcsec(trk1, trk2) < 1.0)
+
+    def test_interp_track(self):
+        tgt = entity.NonSiderealTarget(name='neowise', body=self.comet)
+        for tgt in (tgt, entity.moon):
+            trk1 = self.obs.get_target_track(tgt, self.grid, tolerance=0.5)
+            trk2 = tgt.calc_track_exact(self.obs, self.grid)
+            self.assertTrue(self._max_err_arcsec(trk1, trk2) < 0.5)
+            az_err = numpy.abs(apparent.wrap_pi(trk1.az - trk2.az)) * \
+                     numpy.cos(trk2.alt)
+            self.assertTrue(math.degrees(az_err.max()) * 3600 < 0.5)
+
+    def test_table_track(self):
+        mjd = numpy.arange(59040.0, 59050.0)
+        ra, dec = [], []
+        for t in mjd:
+            self.comet.compute(ephem.Date(t + 2400000.5 - ephem.julian_date(0)))
+            ra.append(float(self.comet.a_ra))
+            dec.append(float(self.comet.a_dec))
+        tgt1 = entity.NonSiderealTarget(name='neowise', mjd=mjd,
+                                        ra=ra, dec=dec)
+        tgt2 = entity.NonSiderealTarget(name='neowise', body=self.comet)
+        trk1 = self.obs.get_target_track(tgt1, self.grid)
+        trk2 = self.obs.get_target_track(tgt2, self.grid)
+        # tables are geocentric, so allow for the comet's parallax
+        self.assertTrue(self._max_err_arcsec(trk1, trk2) < 30.0)
+
+        c1 = self.obs.calc(tgt1, self.grid.start)
+        self.assertAlmostEqual(c1.alt, trk1.alt[0], places=4)
+
+    def test_pickle(self):
+        tgt = entity.NonSiderealTarget(name='neowise', body=self.comet)
+        for tgt in (tgt, entity.mars):
+            tgt2 = pickle.loads(pickle.dumps(tgt))
+            c1 = self.obs.calc(tgt, self.grid.start)
+            c2 = self.obs.calc(tgt2, self.grid.start)
+            self.assertAlmostEqual(c1.alt, c2.alt, places=4)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+#END
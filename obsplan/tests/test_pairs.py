@@ -0,0 +1,66 @@
+import unittest
+import math
+
+import numpy
+
+from obsplan import entity, timegrid
+
+
+class TestPairs(unittest.TestCase):
+
+    def setUp(self):
+        self.obs = entity.Observer('subaru',
+                                   longitude='-155:28:48.900',
+                                   latitude='+19:49:42.600',
+                                   elevation=4163,
+                                   pressure=615,
+                                   temperature=0,
+                                   timezone='US/Hawaii')
+        self.targets = [
+            entity.SiderealTarget(name="vega", ra="18:36:56.3",
+                                  dec="+38:47:01"),
+            entity.SiderealTarget(name="m13", ra="16:41:41.2",
+                                  dec="+36:27:35"),
+            entity.SiderealTarget(name="arcturus", ra="14:15:39.7",
+                                  dec="+19:10:57"),
+            ]
+        # a log of observations scattered over a few nights
+        rng = numpy.random.RandomState(3)
+        mjd0 = timegrid.datetime2mjd(self.obs.get_date("2014-04-28 20:00"))
+        self.mjd = mjd0 + numpy.concatenate(
+            [day + rng.uniform(0.0, 0.375, 10) for day in (0, 1, 5)])
+        self.idx = rng.randint(0, len(self.targets), len(self.mjd))
+
+    def test_calc_pairs(self):
+        res = self.obs.calc_pairs(self.targets, self.idx,
+                                  timegrid.TimeGrid(self.mjd))
+        self.assertEqual(len(res), len(self.mjd))
+        airmass, pang = res.airmass, res.pang
+        for k, dt in enumerate(res.grid.datetimes()):
+            info = self.targets[self.idx[k]].calc(self.obs, dt)
+            self.assertAlmostEqual(res.alt[k], info.alt, delta=5e-6)
+            self.assertAlmostEqual(res.az[k], info.az, delta=5e-5)
+            self.assertAlmostEqual(res.moon_alt[k], info.moon_alt, delta=1e-5)
+            self.assertAlmostEqual(res.moon_sep[k], info.moon_sep,
+                                   delta=1e-5)
+            self.assertAlmostEqual(res.moon_pct[k], info.moon_pct,
+                                   delta=1e-4)
+            if info.alt > math.radians(10.0):
+                self.assertAlmostEqual(airmass[k], info.airmass, delta=1e-4)
+                self.assertAlmostEqual(pang[k], info.pang, delta=1e-4)
+
+    def test_datetimes(self):
+        dts = timegrid.TimeGrid(self.mjd[:5]).datetimes()
+        res = self.obs.calc_pairs(self.targets, self.idx[:5], dts)
+        self.assertTrue(numpy.allclose(res.grid.mjd, self.mjd[:5],
+                                       rtol=0.0, atol=1e-8))
+        self.assertRaises(ValueError, self.obs.calc_pairs, self.targets,
+                          self.idx[:4], dts)
+
+    def test_empty(self):
+        res = self.obs.calc_pairs(self.targets, [], timegrid.TimeGrid([]))
+        self.assertEqual(len(res), 0)
+        self.assertEqual(len(res.airmass), 0)
+        self.assertEqual(len(res.moon_sep), 0)
+
+#END
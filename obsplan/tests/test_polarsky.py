@@ -0,0 +1,63 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+import numpy
+import matplotlib.image
+
+from obsplan import entity
+from obsplan.plots import polarsky
+
+
+class TestAZELFrames(unittest.TestCase):
+
+    def setUp(self):
+        self.obs = entity.Observer('subaru',
+                                   longitude='-155:28:48.900',
+                                   latitude='+19:49:42.600',
+                                   elevation=4163,
+                                   pressure=615,
+                                   temperature=0,
+                                   timezone='US/Hawaii')
+        self.targets = [
+            entity.SiderealTarget(name="vega", ra="18:36:56.3",
+                                  dec="+38:47:01"),
+            entity.SiderealTarget(name="altair", ra="19:51:29.74",
+                                  dec="8:54:23.5"),
+            ]
+        self.grid = self.obs.get_time_grid(
+            time_start=self.obs.get_date("2014-04-29 01:00"),
+            time_stop=self.obs.get_date("2014-04-29 02:00"),
+            time_interval=15)
+        self.outdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.outdir)
+
+    def test_render(self):
+        trk = self.obs.get_catalog_track(self.targets, self.grid)
+        plot = polarsky.AZELFrames(4, 4, dpi=50)
+        plot.setup()
+        plot.set_data(['vega', 'altair'], trk.az_deg, trk.alt_deg)
+        self.assertEqual(len(plot), len(self.grid))
+        frame1 = plot.render(0).copy()
+        frame2 = plot.render(len(plot) - 1)
+        self.assertEqual(frame1.shape, (200, 200, 4))
+        # the background is reused, only the targets move
+        self.assertTrue(numpy.any(frame1 != frame2))
+        self.assertTrue(numpy.array_equal(plot.render(0), frame1))
+
+    def test_render_tracks(self):
+        tracks = [self.obs.get_catalog_track(self.targets, self.grid),
+                  entity.moon.calc_track(self.obs, self.grid)]
+        pattern = os.path.join(self.outdir, "frame_%03d.png")
+        files = polarsky.render_tracks(tracks, pattern, width=3, height=3,
+                                       dpi=40, num_procs=2)
+        self.assertEqual(files, [pattern % i for i in range(len(self.grid))])
+        img = matplotlib.image.imread(files[-1])
+        self.assertEqual(img.shape[:2], (120, 120))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+from obsplan import entity, schedule
+
+
+class TestNightPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.obs = entity.Observer('subaru',
+                                   longitude='-155:28:48.900',
+                                   latitude='+19:49:42.600',
+                                   elevation=4163,
+                                   pressure=615,
+                                   temperature=0,
+                                   timezone='US/Hawaii')
+        self.cts = entity.Constraints(self.obs.get_date("2014-04-28 19:30"),
+                                      self.obs.get_date("2014-04-29 05:30"),
+                                      20.0, 85.0, 0)
+        # targets transiting through the night, in order
+        self.targets = [entity.SiderealTarget(name="t%d" % i,
+                                              ra=9.0 + 0.35 * i,
+                                              dec=(-10.0, 30.0, 50.0)[i % 3])
+                        for i in range(30)]
+        self.plan = schedule.NightPlan(self.obs, self.cts)
+        for tgt in self.targets:
+            self.plan.append(tgt, 900)
+
+    def assertSamePlan(self, plan):
+        # compare with the plan laid out from scratch
+        fresh = schedule.NightPlan(self.obs, self.cts)
+        fresh.blocked[:] = plan.blocked
+        for obs in plan.observations:
+            fresh.append(obs.target, obs.duration)
+        self.assertEqual([(obs.start_slot, obs.slew)
+                          for obs in plan.observations],
+                         [(obs.start_slot, obs.slew)
+                          for obs in fresh.observations])
+        for obs in plan.observations:
+            if obs.scheduled:
+                self.assertFalse(plan.blocked[obs.start_slot:
+                                              obs.stop_slot].any())
+
+    def test_layout(self):
+        sched = [obs for obs in self.plan.observations if obs.scheduled]
+        self.assertTrue(len(sched) > 20)
+        for obs1, obs2 in zip(sched[:-1], sched[1:]):
+            self.assertTrue(obs2.start_slot * 60.0 >=
+                            obs1.stop_slot * 60.0 + obs2.slew)
+        self.assertEqual(len(self.plan.get_schedule()), len(sched))
+
+    def test_insert_remove(self):
+        plan = self.plan
+        too = entity.SiderealTarget(name="too", ra="13:00:00",
+                                    dec="+10:00:00")
+        obs = plan.insert(5, too, 1800)
+        self.assertTrue(obs.scheduled)
+        self.assertSamePlan(plan)
+
+        plan.remove(5)
+        self.assertSamePlan(plan)
+        # a change at the end of the night only lays out the end
+        count = plan.layouts
+        plan.remove(len(plan.observations) - 2)
+        self.assertTrue(plan.layouts - count <= 2)
+        self.assertSamePlan(plan)
+
+        # counted from the end
+        target = plan.observations[-10].target
+        obs = plan.remove(-10)
+        self.assertTrue(obs.target is target)
+        self.assertSamePlan(plan)
+
+    def test_block(self):
+        plan = self.plan
+        time_start = self.obs.get_date("2014-04-28 23:00")
+        time_stop = self.obs.get_date("2014-04-29 00:00")
+        plan.block(time_start, time_stop)
+        self.assertTrue(plan.blocked.sum() == 60)
+        self.assertSamePlan(plan)
+        plan.unblock(time_start, time_stop)
+        self.assertFalse(plan.blocked.any())
+        self.assertSamePlan(plan)
+
+#END
@@ -0,0 +1,110 @@
+import unittest
+
+try:
+    import asyncio
+    from obsplan import service
+except (ImportError, SyntaxError):
+    # requires Python 3
+    service = None
+
+from obsplan import entity
+
+
+@unittest.skipIf(service is None, "asyncio is not available")
+class TestService(unittest.TestCase):
+
+    def setUp(self):
+        self.obs = entity.Observer('subaru',
+                                   longitude='-155:28:48.900',
+                                   latitude='+19:49:42.600',
+                                   elevation=4163,
+                                   pressure=615,
+                                   temperature=0,
+                                   timezone='US/Hawaii')
+        self.svc = service.PlanningService([self.obs])
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.tgt = entity.SiderealTarget(name="vega", ra="18:36:56.3",
+                                         dec="+38:47:01")
+
+    def tearDown(self):
+        self.svc.executor.shutdown()
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def test_coalesce(self):
+        time1 = self.obs.get_date("2014-04-28 19:00")
+        results = self.loop.run_until_complete(asyncio.gather(*[
+            self.svc.target_info('subaru', self.tgt, time_start=time1)
+            for i in range(4)]))
+        self.assertEqual(self.svc.stats, dict(computed=1, coalesced=3))
+        self.assertTrue(all([res is results[0] for res in results]))
+        history = self.obs.get_target_info(self.tgt, time_start=time1)
+        self.assertEqual(len(results[0]['alt']), len(history))
+        self.assertAlmostEqual(results[0]['airmass'][10],
+                               history[10].airmass)
+
+    def test_query_observable(self):
+        params = dict(ra="18:36:56.3", dec="+38:47:01",
+                      start="2014-04-29 04:00", stop="2014-04-29 05:00",
+                      el_min='15.0', el_max='85.0', duration='3594')
+        res = self.loop.run_until_complete(
+            self.svc.query('/observable', params))
+        self.assertTrue(res['observable'])
+
+        # the site's observer is shared, so its window cache persists
+        hits = self.obs.window_cache.hits
+        params['stop'] = "2014-04-29 05:30"
+        self.loop.run_until_complete(self.svc.query('/observable', params))
+        self.assertEqual(self.svc.stats['computed'], 2)
+        self.assertTrue(self.obs.window_cache.hits > hits)
+
+        del params['stop']
+        with self.assertRaises(service.ServiceError):
+            self.loop.run_until_complete(
+                self.svc.query('/observable', params))
+
+    def test_query_bad_date(self):
+        params = dict(ra="18:36:56.3", dec="+38:47:01", start="yesterday")
+        with self.assertRaises(service.ServiceError):
+            self.loop.run_until_complete(
+                self.svc.query('/target_info', params))
+
+        run = self.loop.run_until_complete
+        server = run(asyncio.start_server(self.svc.handle_http,
+                                          'localhost', 0))
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = run(asyncio.open_connection('localhost', port))
+        writer.write(b'GET /almanac?date=2014-13-45 HTTP/1.0\r\n\r\n')
+        buf = run(reader.read())
+        writer.close()
+        server.close()
+        run(server.wait_closed())
+        self.assertTrue(buf.startswith(b'HTTP/1.0 400 Bad Request'))
+
+    def test_binary_roundtrip(self):
+        time1 = self.obs.get_date("2014-04-28 19:00")
+        res = service.calc_target_info(self.obs, self.tgt, time_start=time1)
+        res['name'] = 'vega'
+        res2 = service.decode_binary(service.encode_binary(res))
+        self.assertEqual(res2['name'], 'vega')
+        self.assertEqual(list(res2['alt']), list(res['alt']))
+
+    def test_http(self):
+        run = self.loop.run_until_complete
+        server = run(asyncio.start_server(self.svc.handle_http,
+                                          'localhost', 0))
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = run(asyncio.open_connection('localhost', port))
+        writer.write(b'GET /almanac?date=2014-04-28 HTTP/1.0\r\n\r\n')
+        buf = run(reader.read())
+        writer.close()
+        server.close()
+        run(server.wait_closed())
+
+        self.assertTrue(buf.startswith(b'HTTP/1.0 200 OK'))
+        self.assertTrue(b'"sunset":"2014-04-29T04:54' in buf)
+
+
+if __name__ == "__main__":
+    unittest.main()
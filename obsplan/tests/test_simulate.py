@@ -0,0 +1,78 @@
+import unittest
+
+import numpy
+
+from obsplan import entity, simulate
+
+
+class TestSimulation(unittest.TestCase):
+
+    def setUp(self):
+        self.obs = entity.Observer('subaru',
+                                   longitude='-155:28:48.900',
+                                   latitude='+19:49:42.600',
+                                   elevation=4163,
+                                   pressure=615,
+                                   temperature=0,
+                                   timezone='US/Hawaii')
+        self.targets = [
+            entity.SiderealTarget(name="vega", ra="18:36:56.3",
+                                  dec="+38:47:01"),
+            entity.SiderealTarget(name="m13", ra="16:41:41.2",
+                                  dec="+36:27:35"),
+            entity.SiderealTarget(name="arcturus", ra="14:15:39.7",
+                                  dec="+19:10:57"),
+            entity.SiderealTarget(name="m31", ra="00:42:44.3",
+                                  dec="+41:16:09"),
+            ]
+        self.sim = simulate.Simulation(self.obs, self.targets,
+                                       [3600, 7200, 3600, 3600],
+                                       "2014-04-28", "2014-04-30",
+                                       priorities=[1, 0, 0, 0],
+                                       seeing_max=[0.8, 2.0, 2.0, 2.0])
+
+    def test_setup(self):
+        self.assertEqual(len(self.sim.nights), 3)
+        self.assertEqual(self.sim.fits.shape,
+                         (len(self.targets), len(self.sim.grid)))
+        # m31 is not up at night in April
+        self.assertFalse(self.sim.fits[3].any())
+        self.assertTrue(self.sim.fits[0].any())
+
+    def test_no_nights(self):
+        # no astronomical darkness in the arctic summer
+        obs = entity.Observer('svalbard', longitude='15:39:00',
+                              latitude='+78:13:00', elevation=10,
+                              pressure=1010, temperature=5,
+                              timezone='Arctic/Longyearbyen')
+        self.assertRaises(ValueError, simulate.Simulation, obs,
+                          self.targets, 3600, "2014-06-10", "2014-06-12")
+
+    def test_clear(self):
+        weather = simulate.Weather(p_lost=0.0, closures=0.0,
+                                   seeing_median=0.5, seeing_sigma=0.01)
+        res = self.sim.run(3, weather=weather, num_procs=1)
+        self.assertTrue(numpy.all(res.completed[:, :3]))
+        self.assertFalse(numpy.any(res.completed[:, 3]))
+        self.assertTrue(numpy.allclose(res.used_hours, 4.0))
+        self.assertTrue(numpy.all(res.lost_hours == 0.0))
+        self.assertEqual(res.summary()['completed_mean'], 3.0)
+
+    def test_lost(self):
+        weather = simulate.Weather(p_lost=1.0)
+        res = self.sim.run(2, weather=weather, num_procs=1)
+        self.assertFalse(numpy.any(res.completed))
+        self.assertTrue(numpy.all(res.open_hours == 0.0))
+
+    def test_reproducible(self):
+        weather = simulate.Weather(p_lost=0.3, closures=2.0,
+                                   seeing_median=0.8)
+        res1 = self.sim.run(6, seed=7, weather=weather, num_procs=1)
+        res2 = self.sim.run(6, seed=7, weather=weather, num_procs=2)
+        self.assertTrue(numpy.array_equal(res1.completed, res2.completed))
+        self.assertTrue(numpy.array_equal(res1.open_hours, res2.open_hours))
+        res3 = self.sim.run(6, seed=8, weather=weather, num_procs=1)
+        self.assertFalse(numpy.array_equal(res1.open_hours, res3.open_hours))
+        self.assertEqual(res1.completion.shape, (len(self.targets),))
+
+#END
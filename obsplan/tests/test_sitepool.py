@@ -0,0 +1,105 @@
+import unittest
+import math
+import pickle
+import copy
+from datetime import timedelta
+
+from obsplan import entity
+
+
+class TestSitePool(unittest.TestCase):
+
+    def setUp(self):
+        self.obs = entity.Observer('subaru',
+                                   longitude='-155:28:48.900',
+                                   latitude='+19:49:42.600',
+                                   elevation=4163,
+                                   pressure=615,
+                                   temperature=0,
+                                   timezone='US/Hawaii')
+        self.time1 = self.obs.get_date("2014-04-28 18:00")
+
+    def test_get_site(self):
+        site1 = self.obs.get_site(date=self.time1, horizon_deg=15.0)
+        site2 = self.obs.get_site(date=self.time1, horizon_deg=15.0)
+        self.assertFalse(site1 is site2)
+        self.assertEqual(site1.lat, site2.lat)
+        self.assertAlmostEqual(math.degrees(site1.horizon), 15.0)
+        # changing a site handed out leaves the pool alone
+        site1.horizon = 0.0
+        site1.date = 0.0
+        site3 = self.obs.get_site(date=self.time1, horizon_deg=15.0)
+        self.assertEqual(site3.horizon, site2.horizon)
+        self.assertEqual(site3.date, site2.date)
+
+        for i in range(2 * self.obs.site_pool_size):
+            self.obs.get_site(date=self.time1, horizon_deg=float(i))
+        self.assertEqual(len(self.obs._site_pool), self.obs.site_pool_size)
+
+    def test_twilight_keeps_site(self):
+        horizon = self.obs.site.horizon
+        self.obs.set_date(self.time1)
+        date = self.obs.site.date
+        sunset = self.obs.sunset(self.time1)
+        twi18 = self.obs.evening_twilight_18(self.time1)
+        self.assertTrue(sunset < twi18)
+        self.assertEqual(self.obs.site.horizon, horizon)
+        self.assertEqual(self.obs.site.date, date)
+        self.assertEqual(self.obs.sunset(self.time1), sunset)
+
+    def test_copy_and_pickle(self):
+        obs2 = copy.copy(self.obs)
+        self.assertFalse(obs2.site is self.obs.site)
+        self.assertEqual(obs2.sunset(self.time1), self.obs.sunset(self.time1))
+        obs3 = pickle.loads(pickle.dumps(self.obs))
+        self.assertEqual(obs3.sun_set_rise_times(self.time1),
+                         self.obs.sun_set_rise_times(self.time1))
+
+    def test_attribute_change(self):
+        site = self.obs.get_site(date=self.time1)
+        self.assertEqual(site.pressure, 615)
+        self.obs.pressure = 0
+        self.obs.latitude = '+30:00:00'
+        site = self.obs.get_site(date=self.time1)
+        self.assertEqual(site.pressure, 0)
+        self.assertAlmostEqual(math.degrees(site.lat), 30.0)
+        # the current site follows as well
+        self.obs.set_date(self.time1)
+        self.assertEqual(self.obs.site.pressure, 0)
+        self.assertAlmostEqual(math.degrees(self.obs.site.lat), 30.0)
+        # and the events
+        obs2 = entity.Observer('subaru', longitude='-155:28:48.900',
+                               latitude='+30:00:00', elevation=4163,
+                               pressure=0, temperature=0,
+                               timezone='US/Hawaii')
+        self.assertEqual(self.obs.sunset(self.time1), obs2.sunset(self.time1))
+
+    def test_attribute_change_tracks(self):
+        # calculations reading the current site follow as well
+        tgt = entity.SiderealTarget(name="vega", ra="18:36:56.3",
+                                    dec="+38:47:01")
+        grid = self.obs.get_time_grid(
+            time_start=self.time1,
+            time_stop=self.time1 + timedelta(hours=12))
+        self.obs.get_catalog_track([tgt], grid)
+        self.obs.latitude = '-30:14:27.0'
+        trk1 = self.obs.get_catalog_track([tgt], grid)
+        trk2 = tgt.calc_track_exact(self.obs, grid)
+        self.assertAlmostEqual(math.degrees(trk1.lat), -30.2408333, places=6)
+        self.assertTrue(abs(trk1.alt[0] - trk2.alt).max() < 1.0e-4)
+        res = self.obs.calc(tgt, grid[0])
+        self.assertTrue(abs(res.alt - trk2.alt[0]) < 1.0e-4)
+
+    def test_copy_has_own_pool(self):
+        self.obs.get_site(date=self.time1)
+        obs2 = copy.copy(self.obs)
+        self.assertFalse(obs2._site_pool is self.obs._site_pool)
+        obs2.pressure = 0
+        self.assertEqual(obs2.get_site(date=self.time1).pressure, 0)
+        self.assertEqual(self.obs.get_site(date=self.time1).pressure, 615)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+#END
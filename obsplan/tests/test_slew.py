@@ -0,0 +1,96 @@
+import unittest
+import time
+
+import numpy
+
+from obsplan import entity, slew
+
+
+class TestSlew(unittest.TestCase):
+
+    def setUp(self):
+        self.obs = entity.Observer('subaru',
+                                   longitude='-155:28:48.900',
+                                   latitude='+19:49:42.600',
+                                   elevation=4163,
+                                   pressure=615,
+                                   temperature=0,
+                                   timezone='US/Hawaii')
+        self.grid = self.obs.get_time_grid(
+            time_start=self.obs.get_date("2014-04-28 20:00"),
+            time_stop=self.obs.get_date("2014-04-29 05:00"))
+        self.mjd = self.grid.mjd[0] + 2.0 / 24.0
+
+    def _targets(self, n, seed=0):
+        # targets spread over the sky around the meridian
+        rnd = numpy.random.RandomState(seed)
+        ra = rnd.uniform(9.0, 15.0, n)
+        dec = rnd.uniform(-20.0, 60.0, n)
+        return [entity.SiderealTarget.from_radians(
+            "t%d" % (i), numpy.radians(ra[i] * 15.0), numpy.radians(dec[i]))
+            for i in range(n)]
+
+    def test_cable_wrap(self):
+        model = slew.SlewModel(az_min=-270.0, az_max=270.0)
+        # 100 deg is closer as -260, but 280 is past the limit
+        self.assertEqual(model.wrap(-200.0, 100.0), -260.0)
+        self.assertEqual(model.wrap(200.0, 280.0), 260.0 - 340.0)
+        secs, az = model.slew_time(260.0, 60.0, 280.0, 60.0)
+        self.assertEqual(az, -80.0)
+        self.assertAlmostEqual(secs, 340.0 / 0.5)
+
+    def test_unreachable(self):
+        # a cable wrap covering the southern half of the sky only
+        model = slew.SlewModel(az_min=90.0, az_max=270.0)
+        secs, az = model.slew_time(180.0, 60.0, numpy.array([0.0, 200.0]),
+                                   numpy.array([60.0, 60.0]))
+        self.assertEqual(secs[0], numpy.inf)
+        self.assertTrue(numpy.isnan(az[0]))
+        self.assertEqual(az[1], 200.0)
+
+        targets = self._targets(30)
+        track = self.obs.get_catalog_track(targets, self.grid)
+        planner = slew.SlewPlanner(track, 60.0, model=model)
+        az, el = planner.positions(self.mjd)
+        south = (az > 120.0) & (az < 240.0)
+        self.assertTrue(0 < numpy.sum(south) < len(targets))
+        with self.assertRaises(slew.SlewError):
+            planner.plan(self.mjd, az_start=180.0, el_start=60.0)
+
+        # without the unreachable targets, the tour stays within reach
+        idx = numpy.nonzero(south)[0]
+        track = self.obs.get_catalog_track([targets[i] for i in idx],
+                                           self.grid)
+        planner = slew.SlewPlanner(track, 60.0, model=model)
+        res = planner.plan(self.mjd, az_start=180.0, el_start=60.0)
+        self.assertEqual(sorted(res.order), list(range(len(idx))))
+        self.assertTrue(numpy.isfinite(res.slew_time))
+
+    def test_improves(self):
+        targets = self._targets(60)
+        track = self.obs.get_catalog_track(targets, self.grid)
+        planner = slew.SlewPlanner(track, 300.0)
+        res = planner.plan(self.mjd, az_start=0.0, el_start=60.0)
+        self.assertEqual(sorted(res.order), list(range(60)))
+
+        nn = planner.nearest_neighbour(self.mjd, 0.0, 60.0)
+        res_nn = planner.simulate(nn, self.mjd, 0.0, 60.0)
+        res_in = planner.simulate(range(60), self.mjd, 0.0, 60.0)
+        self.assertTrue(res.slew_time < res_nn.slew_time)
+        self.assertTrue(res.slew_time < res_in.slew_time)
+        self.assertTrue(numpy.all(res.az_phys >= -270.0))
+        self.assertTrue(numpy.all(res.az_phys <= 270.0))
+        self.assertTrue(numpy.all(numpy.diff(res.mjd) > 0.0))
+
+    def test_many_targets(self):
+        targets = self._targets(1500)
+        track = self.obs.get_catalog_track(targets, self.grid)
+        planner = slew.SlewPlanner(track, 5.0)
+        time1 = time.time()
+        res = planner.plan(self.mjd, max_rounds=1)
+        self.assertEqual(len(set(res.order)), 1500)
+        self.assertTrue(time.time() - time1 < 60.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+import unittest
+
+import pytz
+import ephem
+import numpy
+
+from obsplan import entity
+from obsplan.timegrid import TimeGrid
+
+
+class TestTimeGrid(unittest.TestCase):
+
+    def setUp(self):
+        self.hst = pytz.timezone('US/Hawaii')
+        self.pst = pytz.timezone('US/Pacific')
+        self.obs = entity.Observer('subaru',
+                                   longitude='-155:28:48.900',
+                                   latitude='+19:49:42.600',
+                                   elevation=4163,
+                                   pressure=615,
+                                   temperature=0,
+                                   timezone='US/Hawaii')
+
+    def test_range(self):
+        t1 = self.hst.localize(datetime(2014, 4, 28, 19, 0, 0))
+        t2 = self.hst.localize(datetime(2014, 4, 28, 20, 0, 0))
+        grid = TimeGrid.from_range(t1, t2, 5, tz_local=self.hst)
+        self.assertEqual(len(grid), 12)
+        self.assertEqual(grid.start, t1)
+        self.assertEqual(grid.datetimes()[1], t1 + timedelta(0, 300))
+        self.assertEqual(str(grid.local_datetime64[0]),
+                         '2014-04-28T19:00:00.000000')
+
+    def test_ephem_dates(self):
+        dates = [ephem.Date('2014/4/29 10:00'), ephem.Date('2014/4/29 11:30')]
+        grid = TimeGrid.from_ephem(dates)
+        self.assertTrue(numpy.allclose(grid.djd, dates))
+        self.assertAlmostEqual(grid.jd[0], ephem.julian_date(dates[0]))
+
+    def test_dst_transition(self):
+        # US/Pacific switches from PDT to PST at 09:00 UTC on this date
+        t1 = pytz.utc.localize(datetime(2014, 11, 2, 8, 0, 0))
+        t2 = pytz.utc.localize(datetime(2014, 11, 2, 10, 0, 0))
+        grid = TimeGrid.from_range(t1, t2, 30, tz_local=self.pst)
+        self.assertEqual(list(grid.utc_offset),
+                         [-25200.0, -25200.0, -28800.0, -28800.0])
+        for dt in grid.datetimes():
+            self.assertEqual(dt, dt.astimezone(self.pst))
+            self.assertEqual(dt.utcoffset(),
+                             dt.astimezone(self.pst).utcoffset())
+
+    def test_gmst(self):
+        grid = TimeGrid.from_ephem([ephem.Date('2014/4/29 10:00')])
+        c1 = self.obs.calc(entity.SiderealTarget(name='vega',
+                                                 ra='18:36:56.3',
+                                                 dec='+38:47:01'),
+                           grid.start)
+        self.assertAlmostEqual(grid.lmst(self.obs.site.lon)[0], c1.lmst)
+
+    def test_observer_accepts_grid(self):
+        tgt = entity.SiderealTarget(name='vega', ra='18:36:56.3',
+                                    dec='+38:47:01')
+        grid = self.obs.get_time_grid(
+            time_start=self.obs.get_date("2014-04-28 19:00"))
+        history = self.obs.get_target_info(tgt, time_start=grid)
+        self.assertEqual(len(history), len(grid))
+        res = self.obs.calc(tgt, grid[:3])
+        self.assertEqual(len(res), 3)
+        self.assertEqual(res[1].alt, history[1].alt)
+        self.assertEqual(self.obs.sunset(date=grid),
+                         self.obs.sunset(date=grid.start))
+        d_alt, d_az = self.obs.distance(tgt, tgt, grid[:4])
+        self.assertEqual(d_alt.shape, (4,))
+
+
+if __name__ == "__main__":
+    unittest.main()
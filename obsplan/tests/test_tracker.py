@@ -0,0 +1,79 @@
+import unittest
+from datetime import timedelta
+
+import numpy
+
+from obsplan import entity
+from obsplan.tracker import TrackWindow
+
+
+class TestTrackWindow(unittest.TestCase):
+
+    def setUp(self):
+        self.obs = entity.Observer('subaru',
+                                   longitude='-155:28:48.900',
+                                   latitude='+19:49:42.600',
+                                   elevation=4163,
+                                   pressure=615,
+                                   temperature=0,
+                                   timezone='US/Hawaii')
+        self.targets = [
+            entity.SiderealTarget(name="vega", ra="18:36:56.3",
+                                  dec="+38:47:01"),
+            entity.SiderealTarget(name="altair", ra="19:51:29.74",
+                                  dec="8:54:23.5"),
+            ]
+        self.now = self.obs.get_date("2014-04-28 23:02")
+
+    def test_incremental(self):
+        win = TrackWindow(self.obs, self.targets, time_interval=2,
+                          history=30, lookahead=120)
+        n = win.update(self.now)
+        self.assertEqual(n, len(win))
+        self.assertTrue(len(win) in (75, 76))
+
+        # advancing by 10 min computes only ~5 new samples
+        n = win.update(self.now + timedelta(minutes=10))
+        self.assertTrue(n in (5, 6))
+        self.assertTrue(len(win) in (75, 76))
+        self.assertTrue(win.stats['dropped'] in (4, 5, 6))
+
+        # same result as computing the window from scratch
+        trk = self.obs.get_catalog_track(self.targets, win.grid)
+        self.assertTrue(numpy.allclose(win.alt, trk.alt))
+        self.assertTrue(numpy.allclose(win.get_track('altair').az,
+                                       trk[1].az))
+
+        # nothing new within the same interval
+        self.assertEqual(win.update(self.now + timedelta(minutes=10,
+                                                         seconds=20)), 0)
+
+    def test_jump(self):
+        win = TrackWindow(self.obs, self.targets, time_interval=5,
+                          history=0, lookahead=60)
+        win.update(self.now)
+        n = win.update(self.now + timedelta(hours=3))
+        self.assertEqual(n, len(win))
+        self.assertTrue(win.grid.start >= self.now + timedelta(hours=3))
+
+    def test_add_remove(self):
+        win = TrackWindow(self.obs, self.targets[:1], time_interval=5)
+        win.update(self.now)
+        win.add_target(self.targets[1])
+        trk = self.obs.get_catalog_track(self.targets, win.grid)
+        self.assertTrue(numpy.allclose(win.alt, trk.alt))
+        win.remove_target('vega')
+        self.assertEqual(win.alt.shape, (1, len(win)))
+        self.assertEqual(win.moon_sep.shape, (1, len(win)))
+
+    def test_almanac(self):
+        win = TrackWindow(self.obs, self.targets)
+        res = win.almanac(self.now)
+        sunset = self.obs.sunset(self.obs.get_date("2014-04-28 12:00"))
+        self.assertTrue(abs((res[0] - sunset).total_seconds()) < 1)
+        # cached for the rest of the night
+        self.assertTrue(win.almanac(self.now + timedelta(hours=5)) is res)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+#
+# timegrid.py -- array-based grids of sample times
+#
+#  Eric Jeschke (eric@naoj.org)
+#
+from datetime import datetime, timedelta
+
+# 3rd party imports
+import pytz
+import numpy
+
+# Julian Date of MJD 0
+MJD_OFFSET = 2400000.5
+# Dublin Julian Date (used by pyephem) of MJD 0
+DJD_MJD_OFFSET = 2400000.5 - 2415020.0
+
+# MJD 0 as a numpy datetime64
+_mjd_epoch = numpy.datetime64('1858-11-17T00:00:00', 'us')
+_mjd_epoch_dt = datetime(1858, 11, 17, 0, 0, 0)
+
+# local timezone offsets are looked up once per bucket of this many
+# minutes; daylight saving transitions all fall on such a boundary
+tz_bucket_min = 15
+
+
+def gmst_rad(jd):
+    """
+    Compute Greenwich Mean Sidereal Time (radians) from Julian Date(s)
+    `jd`, which may be a scalar or an array.
+    """
+    jd = numpy.asarray(jd, dtype=numpy.float64)
+    d = jd - 2451545.0
+    T = d/36525.0
+    gmstdeg = 280.46061837+(360.98564736629*d)+(0.000387933*T*T)-(T*T*T/38710000.0)
+    return numpy.radians(numpy.mod(gmstdeg, 360.0))
+
+def datetime2mjd(dt, tz_utc=pytz.utc):
+    """
+    Convert datetime `dt` to an MJD.  Naive datetimes are taken to be
+    in UTC.
+    """
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(tz_utc).replace(tzinfo=None)
+    delta = dt - _mjd_epoch_dt
+    return delta.days + (delta.seconds + delta.microseconds*1.0e-6)/86400.0
+
+
+class TimeGrid(object):
+    """
+    A grid of sample times, held as a float array of UTC Modified Julian
+    Dates.  Views as Julian Dates, pyephem (Dublin) dates and numpy
+    datetime64 values are computed with array operations, and the
+    conversion to local time is done once for the whole grid.
+    """
+    def __init__(self, mjd, tz_local=None):
+        super(TimeGrid, self).__init__()
+        self.mjd = numpy.asarray(mjd, dtype=numpy.float64).ravel()
+        if tz_local is None:
+            tz_local = pytz.utc
+        self.tz_local = tz_local
+
+        self._utc_offset = None
+
+    @classmethod
+    def from_range(cls, time_start, time_stop, time_interval, tz_local=None):
+        """
+        Make a grid from datetime `time_start` up to (but not
+        including) `time_stop` every `time_interval` minutes.
+        """
+        mjd1 = datetime2mjd(time_start)
+        mjd2 = datetime2mjd(time_stop)
+        return cls(numpy.arange(mjd1, mjd2, time_interval/1440.0),
+                   tz_local=tz_local)
+
+    @classmethod
+    def from_datetimes(cls, dates, tz_local=None):
+        """Make a grid from a sequence of datetimes."""
+        return cls([datetime2mjd(dt) for dt in dates], tz_local=tz_local)
+
+    @classmethod
+    def from_ephem(cls, dates, tz_local=None):
+        """Make a grid from a sequence of pyephem dates."""
+        djd = numpy.asarray(dates, dtype=numpy.float64)
+        return cls(djd - DJD_MJD_OFFSET, tz_local=tz_local)
+
+    @property
+    def jd(self):
+        return self.mjd + MJD_OFFSET
+
+    @property
+    def djd(self):
+        """Dublin Julian Dates, as used by pyephem"""
+        return self.mjd + DJD_MJD_OFFSET
+
+    @property
+    def interval(self):
+        """Typical spacing of the samples, in minutes"""
+        if len(self.mjd) < 2:
+            return 0.0
+        return float(numpy.median(numpy.diff(self.mjd))) * 1440.0
+
+    @property
+    def datetime64(self):
+        """UTC times as numpy datetime64 values"""
+        usec = numpy.round(self.mjd * 86400.0e6).astype(numpy.int64)
+        return _mjd_epoch + usec.astype('timedelta64[us]')
+
+    @property
+    def utc_offset(self):
+        """Offset of local time from UTC for each sample, in seconds"""
+        if self._utc_offset is None:
+            self._utc_offset = self._calc_utc_offset(self.tz_local)
+        return self._utc_offset
+
+    @property
+    def local_datetime64(self):
+        """Local times (without timezone) as numpy datetime64 values"""
+        offset = self.utc_offset.astype(numpy.int64).astype('timedelta64[s]')
+        return self.datetime64 + offset
+
+    @property
+    def gmst(self):
+        """Greenwich Mean Sidereal Time of each sample, in radians"""
+        return gmst_rad(self.jd)
+
+    def lmst(self, longitude):
+        """
+        Local Mean Sidereal Time of each sample, in radians, for
+        `longitude` (radians, east positive).
+        """
+        return numpy.mod(self.gmst + longitude, 2*numpy.pi)
+
+    def _calc_utc_offset(self, tz):
+        return self._calc_local(tz)[0]
+
+    def _calc_local(self, tz):
+        # Returns arrays of the UTC offset (seconds) and tzinfo for
+        # each sample.  These are looked up once per bucket of samples.
+        bucket = numpy.floor(self.mjd * (1440.0 / tz_bucket_min))
+        keys, inverse = numpy.unique(bucket, return_inverse=True)
+        offsets = numpy.empty(len(keys))
+        tzinfos = numpy.empty(len(keys), dtype=object)
+        for i, key in enumerate(keys):
+            mjd = key * tz_bucket_min / 1440.0
+            dt = _mjd_epoch_dt + timedelta(days=mjd)
+            dt = pytz.utc.localize(dt).astimezone(tz)
+            offset = dt.utcoffset()
+            offsets[i] = offset.days * 86400.0 + offset.seconds
+            tzinfos[i] = dt.tzinfo
+        return offsets[inverse], tzinfos[inverse]
+
+    def datetimes(self, tz=None):
+        """
+        Returns a list of timezone-aware datetimes for the samples, in
+        timezone `tz` (the grid's local timezone by default).
+        """
+        if tz is None:
+            tz = self.tz_local
+        offsets, tzinfos = self._calc_local(tz)
+        offset = offsets.astype(numpy.int64).astype('timedelta64[s]')
+        naive = (self.datetime64 + offset).astype(datetime)
+        return [dt.replace(tzinfo=tzinfo)
+                for dt, tzinfo in zip(naive, tzinfos)]
+
+    @property
+    def start(self):
+        return self[0]
+
+    @property
+    def stop(self):
+        return self[-1]
+
+    def __len__(self):
+        return len(self.mjd)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return TimeGrid(self.mjd[idx], tz_local=self.tz_local)
+        dt = _mjd_epoch_dt + timedelta(days=float(self.mjd[idx]))
+        return pytz.utc.localize(dt)
+
+    def __repr__(self):
+        return "TimeGrid(%d samples)" % (len(self.mjd))
+
+#END
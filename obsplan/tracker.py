@@ -0,0 +1,226 @@
+#
+# tracker.py -- incrementally updated target tracks for live displays
+#
+#  Eric Jeschke (eric@naoj.org)
+#
+import math
+from datetime import datetime, timedelta
+
+# 3rd party imports
+import ephem
+import numpy
+
+# local imports
+from obsplan import apparent, timegrid
+from obsplan.timegrid import TimeGrid
+from obsplan.entity import TargetTrack
+
+
+class TrackWindow(object):
+    """
+    Keeps the tracks of a list of sidereal targets over a window of
+    time that slides along with the clock: from `history` minutes before
+    "now" to `lookahead` minutes after it, every `time_interval` minutes.
+
+    Samples fall on a fixed grid of multiples of the interval, so on
+    each update() only the samples that have come into the window are
+    computed and those that have dropped out of it are discarded; the
+    cost of an update is proportional to the number of new samples, not
+    to the length of the window.  The Moon's position is kept alongside
+    the target tracks and the almanac is cached per night.
+    """
+    def __init__(self, observer, targets, time_interval=5, history=60,
+                 lookahead=240):
+        super(TrackWindow, self).__init__()
+        self.observer = observer
+        self.targets = list(targets)
+        self.time_interval = time_interval
+        self.history = history
+        self.lookahead = lookahead
+
+        # private site, so that we don't disturb the observer's date
+        self.site = observer.get_site()
+        self.moon = ephem.Moon()
+        self.lat = float(self.site.lat)
+
+        # sample numbers (multiples of the interval since MJD 0) of the
+        # first and last samples held
+        self._k0, self._k1 = 0, -1
+        self._clear()
+        # almanac, keyed by the local date of the start of the night
+        self._almanac = {}
+        self.stats = dict(computed=0, dropped=0)
+
+    def _clear(self):
+        ntgts = len(self.targets)
+        self._k0, self._k1 = 0, -1
+        self.mjd = numpy.empty(0)
+        self.ra = numpy.empty((ntgts, 0))
+        self.dec = numpy.empty((ntgts, 0))
+        self.alt = numpy.empty((ntgts, 0))
+        self.az = numpy.empty((ntgts, 0))
+        self.lst = numpy.empty(0)
+        self.moon_ra = numpy.empty(0)
+        self.moon_dec = numpy.empty(0)
+        self.moon_alt = numpy.empty(0)
+        self.moon_pct = numpy.empty(0)
+
+    def _now_mjd(self, now):
+        if now is None:
+            now = datetime.utcnow()
+        return timegrid.datetime2mjd(now)
+
+    def _calc(self, targets, grid):
+        # target values at the samples of `grid`, as (N, T) arrays
+        ra, dec = apparent.catalog_radec(targets, grid)
+        shape = (len(targets), len(grid))
+        ra = numpy.broadcast_to(ra, shape)
+        dec = numpy.broadcast_to(dec, shape)
+        lst, alt, az = self.observer.calc_altaz(ra, dec, grid)
+        return (ra, dec, alt, az, lst)
+
+    def _calc_moon(self, grid):
+        n = len(grid)
+        ra, dec, alt, pct = (numpy.empty(n), numpy.empty(n),
+                             numpy.empty(n), numpy.empty(n))
+        for i, djd in enumerate(grid.djd):
+            self.site.date = djd
+            self.moon.compute(self.site)
+            ra[i], dec[i] = self.moon.ra, self.moon.dec
+            alt[i], pct[i] = self.moon.alt, self.moon.moon_phase
+        return (ra, dec, alt, pct)
+
+    def update(self, now=None):
+        """
+        Slide the window to datetime `now` (the current time by
+        default).  Returns the number of new samples computed.
+        """
+        step = self.time_interval / 1440.0
+        now_mjd = self._now_mjd(now)
+        k0 = int(math.ceil((now_mjd - self.history / 1440.0) / step))
+        k1 = int(math.floor((now_mjd + self.lookahead / 1440.0) / step))
+
+        if k0 < self._k0 or k0 > self._k1:
+            # moved backward, or beyond everything we hold: start over
+            self.stats['dropped'] += len(self.mjd)
+            self._clear()
+            self._k0, self._k1 = k0, k0 - 1
+
+        # drop expired samples
+        ndrop = k0 - self._k0
+        if ndrop > 0:
+            self.stats['dropped'] += ndrop
+            self.mjd = self.mjd[ndrop:]
+            self.ra, self.dec = self.ra[:, ndrop:], self.dec[:, ndrop:]
+            self.alt, self.az = self.alt[:, ndrop:], self.az[:, ndrop:]
+            self.lst = self.lst[ndrop:]
+            self.moon_ra = self.moon_ra[ndrop:]
+            self.moon_dec = self.moon_dec[ndrop:]
+            self.moon_alt = self.moon_alt[ndrop:]
+            self.moon_pct = self.moon_pct[ndrop:]
+            self._k0 = k0
+
+        # append new ones
+        knew = numpy.arange(self._k1 + 1, k1 + 1)
+        if len(knew) == 0:
+            return 0
+        grid = TimeGrid(knew * step)
+        ra, dec, alt, az, lst = self._calc(self.targets, grid)
+        moon_ra, moon_dec, moon_alt, moon_pct = self._calc_moon(grid)
+
+        self.mjd = numpy.concatenate((self.mjd, grid.mjd))
+        self.ra = numpy.concatenate((self.ra, ra), axis=1)
+        self.dec = numpy.concatenate((self.dec, dec), axis=1)
+        self.alt = numpy.concatenate((self.alt, alt), axis=1)
+        self.az = numpy.concatenate((self.az, az), axis=1)
+        self.lst = numpy.concatenate((self.lst, lst))
+        self.moon_ra = numpy.concatenate((self.moon_ra, moon_ra))
+        self.moon_dec = numpy.concatenate((self.moon_dec, moon_dec))
+        self.moon_alt = numpy.concatenate((self.moon_alt, moon_alt))
+        self.moon_pct = numpy.concatenate((self.moon_pct, moon_pct))
+        self._k1 = k1
+        self.stats['computed'] += len(knew)
+        return len(knew)
+
+    def add_target(self, target):
+        """Start tracking `target`, computing it over the whole window."""
+        self.targets.append(target)
+        if len(self.mjd) == 0:
+            self._clear()
+            return
+        ra, dec, alt, az, lst = self._calc([target], self.grid)
+        self.ra = numpy.concatenate((self.ra, ra))
+        self.dec = numpy.concatenate((self.dec, dec))
+        self.alt = numpy.concatenate((self.alt, alt))
+        self.az = numpy.concatenate((self.az, az))
+
+    def remove_target(self, name):
+        """Stop tracking the target named `name`."""
+        idx = [i for i, tgt in enumerate(self.targets) if tgt.name == name]
+        if len(idx) == 0:
+            raise KeyError(name)
+        i = idx[0]
+        self.targets.pop(i)
+        self.ra = numpy.delete(self.ra, i, axis=0)
+        self.dec = numpy.delete(self.dec, i, axis=0)
+        self.alt = numpy.delete(self.alt, i, axis=0)
+        self.az = numpy.delete(self.az, i, axis=0)
+
+    @property
+    def grid(self):
+        return TimeGrid(self.mjd, tz_local=self.observer.tz_local)
+
+    @property
+    def moon_sep(self):
+        """Separation (radians) of each target from the Moon, (N, T)"""
+        cos_sep = (numpy.sin(self.dec) * numpy.sin(self.moon_dec) +
+                   numpy.cos(self.dec) * numpy.cos(self.moon_dec) *
+                   numpy.cos(self.ra - self.moon_ra))
+        cos_sep = numpy.clip(cos_sep, -1.0, 1.0)
+        return numpy.arccos(cos_sep)
+
+    def get_track(self, name=None):
+        """
+        Returns a TargetTrack over the current window for the target
+        named `name`, or a catalog track of all targets.
+        """
+        track = TargetTrack(self.targets, self.grid, self.ra, self.dec,
+                            self.alt, self.az, self.lst, self.lat)
+        if name is None:
+            return track
+        for i, tgt in enumerate(self.targets):
+            if tgt.name == name:
+                return track[i]
+        raise KeyError(name)
+
+    def almanac(self, now=None):
+        """
+        Returns the sun rise/set and twilight times of the night in
+        progress (or about to start) at `now`, as a tuple of
+        (sunset, 12d, 18d, 18d, 12d, sunrise).  Computed once per night.
+        """
+        now_mjd = self._now_mjd(now)
+        # local date of the start of the night; the night changes at
+        # local noon
+        offset = self._utc_offset(now_mjd)
+        day = int(math.floor(now_mjd + offset / 86400.0 - 0.5))
+        try:
+            return self._almanac[day]
+
+        except KeyError:
+            noon = (datetime(1858, 11, 17, 12, 0, 0) + timedelta(days=day)
+                    - timedelta(seconds=offset))
+            res = self.observer.sun_set_rise_times(
+                self.observer.tz_utc.localize(noon))
+            self._almanac = {day: res}
+            return res
+
+    def _utc_offset(self, mjd):
+        # offset of local time from UTC (sec) at `mjd`
+        grid = TimeGrid([mjd], tz_local=self.observer.tz_local)
+        return float(grid.utc_offset[0])
+
+    def __len__(self):
+        return len(self.mjd)
+
+#END